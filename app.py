@@ -1,7 +1,7 @@
 # -*- coding: utf-8 -*-
 import pandas as pd
 import numpy as np
-from flask import Flask, request, jsonify, send_from_directory, send_file
+from flask import Flask, request, jsonify, send_from_directory, send_file, Response
 import json
 import io
 import os
@@ -16,26 +16,143 @@ import re
 import uuid
 import urllib3
 import time
+import functools
+import hashlib
+import zlib
 import threading
+import sqlite3
+import fcntl
+import socket
+import sys
+import logging
+import inspect
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
 from werkzeug.exceptions import NotFound
 
+# Ağır kütüphaneler modül yüklenirken içe aktarılır: gunicorn --preload ile ana süreçte bir kez yüklenir ve
+# worker'lara copy-on-write olarak paylaşılır (sklearn yoksa akıllı eşleştirme kapalı kalır)
+try: import sklearn.feature_extraction.text  # noqa: F401
+except ImportError: pass
+
 # SSL Uyarılarını Kapat
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
+logging.basicConfig(level=os.environ.get('LOG_LEVEL', 'INFO'), format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+logger = logging.getLogger('stokcu')
+
 # --- AYARLAR ---
 decimal.getcontext().prec = 28
 TWOPLACES = decimal.Decimal('0.01')
+# Kolon bazlı fiyatlar ölçeklenmiş int64 olarak tutulur: değer × 10^PRICE_SCALE
+PRICE_SCALE = 6
+# Pazaryeri ve satış fiyatları kuruş (10^-2) ölçeğinde tutulur
+KURUS_SCALE = 2
+
+# Eşleştirme motoru: aday sayısı ve benzerlik araması için bellek bütçesi (MB)
+MATCH_TOP_K = int(os.environ.get('MATCH_TOP_K', 1))
+MATCH_MEMORY_BUDGET_MB = int(os.environ.get('MATCH_MEMORY_BUDGET_MB', 256))
+
+# İç katalog TF-IDF indeksi: diske yazılır, en fazla bu kadar saat ve bu oranda değişiklikle artımlı güncellenir.
+# Varsayılan kapalı: indeksin sözlüğü/IDF'i ilk kurulduğu katalogdan gelir, skorlar her işte sıfırdan fit'ten sapabilir (README).
+MATCH_INDEX_ENABLED = os.environ.get('MATCH_INDEX_ENABLED', '0') == '1'
+MATCH_INDEX_MAX_AGE_H = float(os.environ.get('MATCH_INDEX_MAX_AGE_H', 24))
+MATCH_INDEX_REFIT_RATIO = float(os.environ.get('MATCH_INDEX_REFIT_RATIO', 0.2))
+
+# Eşleştirme ve fiyatlama için süreç sayısı (iş bazında 'workers' form alanıyla değiştirilebilir).
+# 1'den büyük değerler süreci fork eder ve yalnızca JOB_RUNNER=external ile uygulanır; gömülü gthread çalıştırıcıda fork edilen
+# çocuk, başka thread'lerin tuttuğu kilitlerde (logging, sqlite3, kuyruk kilidi) takılabileceğinden MATCH_WORKERS da iş
+# bazındaki 'workers' da 1'e indirilir (parallel_map).
+MATCH_WORKERS = int(os.environ.get('MATCH_WORKERS', 1))
+# Toplam iş (satır ya da benzersiz değer sayısı) bunun altındaysa workers > 1 olsa da süreç açılmaz; fork ve havuz
+# açılışı küçük işlerde hesaplamadan pahalıdır
+PARALLEL_MIN_ITEMS = int(os.environ.get('PARALLEL_MIN_ITEMS', 20000))
+
+# Artımlı eşleştirme: aynı şablonun son çalıştırmasındaki isim eşleştirme atamaları, değişmeyen satırlar için
+# yeniden kullanılır (iş bazında 'incremental' form alanıyla açılıp kapatılabilir)
+MATCH_INCREMENTAL = os.environ.get('MATCH_INCREMENTAL', '0') == '1'
+
+# Büyük CSV/XLSX dosyaları bu kadar satırlık parçalar halinde okunur
+FILE_CHUNK_ROWS = int(os.environ.get('FILE_CHUNK_ROWS', 50000))
+# Ayrıştırılmış yüklemeler dosya içeriği + okunan kolonlar anahtarıyla kolonsal olarak önbelleğe alınır;
+# toplam boyut PARSE_CACHE_MAX_MB'ı aşınca en eski kullanılanlar, PARSE_CACHE_MAX_AGE_H saatten eskiler silinir
+PARSE_CACHE_ENABLED = os.environ.get('PARSE_CACHE_ENABLED', '1') == '1'
+PARSE_CACHE_MAX_MB = int(os.environ.get('PARSE_CACHE_MAX_MB', 1024))
+PARSE_CACHE_MAX_AGE_H = float(os.environ.get('PARSE_CACHE_MAX_AGE_H', 72))
+# Okuma/normalizasyon mantığı değişirse artırılır; eski önbellek kayıtları kendiliğinden geçersiz olur
+PARSE_CACHE_VERSION = 2
+
+# Stok/tedarikçi yüklemelerinde aynı anda okunan dosya sayısı (iş bazında 'workers' form alanıyla değiştirilebilir).
+# 1'den büyük değerler süreci fork eder; MATCH_WORKERS gibi yalnızca JOB_RUNNER=external ile uygulanır.
+INGEST_WORKERS = int(os.environ.get('INGEST_WORKERS', 1))
+
+# Rapordaki ham veri sayfaları (5-7): 'xlsx' çalışma kitabına yazılır, 'csv' ayrı .csv.gz dosyası olur, 'skip' yazılmaz.
+# İş bazında 'raw_sheets' form alanıyla değiştirilebilir. Rapor sayfaları bu kadar satırlık bloklarla akıtılır.
+REPORT_RAW_SHEETS = os.environ.get('REPORT_RAW_SHEETS', 'xlsx')
+REPORT_CHUNK_ROWS = int(os.environ.get('REPORT_CHUNK_ROWS', 10000))
+# İş sonucunun kolonsal olarak saklanan, tek başına indirilebilen parçaları ve indirme biçimleri
+JOB_RESULT_PARTS = ('upload', 'matched', 'unmatched')
+# Tedarikçi konsolidasyonu: aynı ürünün birden çok tedarikçideki tekliflerinden hangisinin kullanılacağı
+# ('aggregate': stoklar toplanır, en düşük maliyet; diğerleri tek tedarikçi seçer). İstekte 'offer_strategy' ile değiştirilebilir.
+SUPPLIER_OFFER_STRATEGIES = ('aggregate', 'cheapest_in_stock', 'max_stock', 'preferred')
+SUPPLIER_OFFER_STRATEGY = os.environ.get('SUPPLIER_OFFER_STRATEGY', 'aggregate')
+# Fiyat simülasyonu: önizleme sayfa boyutu (istekte 'page_size' ile en fazla SIMULATION_PAGE_SIZE_MAX) ve en çok değişen ürün sayısı
+SIMULATION_PAGE_SIZE = int(os.environ.get('SIMULATION_PAGE_SIZE', 50))
+SIMULATION_PAGE_SIZE_MAX = 1000
+SIMULATION_TOP_MOVERS = int(os.environ.get('SIMULATION_TOP_MOVERS', 10))
+EXPORT_FORMATS = {'csv': ('text/csv; charset=utf-8', 'csv'), 'csv.gz': ('application/gzip', 'csv.gz'), 'jsonl': ('application/x-ndjson', 'jsonl')}
+
+# Bilinen markalar ve çakışma tablosu (kod değişmeden marka eklenebilir)
+BRANDS_FILE = Path(os.environ.get('BRANDS_FILE', Path(__file__).resolve().parent / 'data' / 'brands.json'))
+
+# Metin normalizasyonu önbelleği: fonksiyon başına en fazla bu kadar ham metin tutulur
+NORMALIZE_CACHE_SIZE = int(os.environ.get('NORMALIZE_CACHE_SIZE', 200000))
+
+# İş kuyruğu: aynı anda en fazla JOB_WORKERS eşleştirme işi çalışır (tüm gunicorn süreçleri toplamında),
+# en fazla JOB_QUEUE_MAX iş sırada bekler. JOB_RUNNER=external ise işler yalnızca `python app.py worker` sürecinde çalışır.
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 2))
+JOB_QUEUE_MAX = int(os.environ.get('JOB_QUEUE_MAX', 20))
+JOB_RUNNER = os.environ.get('JOB_RUNNER', 'embedded')
+JOB_DEFAULT_PRIORITY = 5
+# İş durumları tüm süreçlerin paylaştığı depoda tutulur ('sqlite' veya 'files'); JOB_TTL_HOURS saat güncellenmeyen iş silinir
+JOB_STORE_BACKEND = os.environ.get('JOB_STORE', 'sqlite')
+JOB_TTL_HOURS = float(os.environ.get('JOB_TTL_HOURS', 24))
+JOB_PURGE_INTERVAL_S = 600
+
+# İlerleme akışı (SSE): depo bu aralıkla okunur, bağlantı en fazla bu kadar açık kalır (tarayıcı kendisi yeniden bağlanır)
+JOB_EVENTS_POLL_S = 0.5
+JOB_EVENTS_MAX_S = int(os.environ.get('JOB_EVENTS_MAX_S', 300))
+# Akıllı eşleştirmede ilerleme bu kadar satırlık parçalar tamamlandıkça bildirilir
+MATCH_PROGRESS_ROWS = int(os.environ.get('MATCH_PROGRESS_ROWS', 5000))
+
+# Döviz kurları tüm süreçlerin paylaştığı disk önbelleğinden okunur; açılış ağı beklemez. Süreçlerden yalnızca biri
+# (flock ile seçilen arka plan yenileyici) kurları RATES_REFRESH_S saniyede bir TCMB'den günceller.
+RATES_REFRESHER = os.environ.get('RATES_REFRESHER', '1') == '1'
+RATES_REFRESH_S = int(os.environ.get('RATES_REFRESH_S', 3600))
+RATES_RETRY_S = 300
+RATES_FETCH_TIMEOUT_S = float(os.environ.get('RATES_FETCH_TIMEOUT_S', 20))
+JOB_POLL_SECONDS = 1.0
 
 APP_DIR = Path(__file__).resolve().parent
+# Sonuçlar, iş kayıtları ve önbellekler WORK_DIR altında tutulur (kıyaslama gibi yalıtılmış çalıştırmalar için taşınabilir)
+WORK_DIR = Path(os.environ.get('WORK_DIR', APP_DIR))
 CONFIG_DIR = APP_DIR / 'config_templates'
 STATIC_DIR = APP_DIR / 'static'
-TEMP_RESULTS_DIR = APP_DIR / 'temp_results'
-JOBS_DIR = APP_DIR / 'jobs'
+TEMP_RESULTS_DIR = WORK_DIR / 'temp_results'
+JOBS_DIR = WORK_DIR / 'jobs'
+JOB_QUEUE_DIR = JOBS_DIR / 'queue'
+PARSE_CACHE_DIR = Path(os.environ.get('PARSE_CACHE_DIR', WORK_DIR / 'parse_cache'))
+MATCH_STATE_DIR = WORK_DIR / 'match_state'
+RATES_FILE = WORK_DIR / 'rates.json'
 
 CONFIG_DIR.mkdir(exist_ok=True)
 STATIC_DIR.mkdir(exist_ok=True)
-TEMP_RESULTS_DIR.mkdir(exist_ok=True)
-JOBS_DIR.mkdir(exist_ok=True)
+TEMP_RESULTS_DIR.mkdir(parents=True, exist_ok=True)
+JOBS_DIR.mkdir(parents=True, exist_ok=True)
+JOB_QUEUE_DIR.mkdir(exist_ok=True)
+PARSE_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+MATCH_STATE_DIR.mkdir(parents=True, exist_ok=True)
 
 app = Flask(__name__, static_folder=str(STATIC_DIR), static_url_path='')
 app.config['MAX_CONTENT_LENGTH'] = 300 * 1024 * 1024
@@ -43,19 +160,578 @@ app.config['JSON_AS_ASCII'] = False
 
 print("Stok Yonetim Servisi Baslatildi.", flush=True)
 
+# --- İŞ DURUMU DEPOSU ---
+# Her iki depo da aynı arayüzü sunar: put / get / list / request_cancel / cancel_requested / purge.
+# Kayıt sözlüğü: status, progress, message, result_file, error, created, timestamp (son güncelleme) ve
+# detail: çalışırken aşama içi ilerleme, bitince ek çıktı dosyaları ("sidecars").
+JOB_FIELDS = ('status', 'progress', 'message', 'result_file', 'error', 'detail')
+JOB_ACTIVE_STATUSES = ('queued', 'running')
+
+class SQLiteJobStore:
+    """WAL kipinde SQLite: yazma tek satırlık atomik upsert, okuyucular yazıcıyı beklemez."""
+    def __init__(self, path):
+        self.path = str(path)
+        self.local = threading.local()
+        with self._conn() as con:
+            con.execute("CREATE TABLE IF NOT EXISTS jobs (job_id TEXT PRIMARY KEY, status TEXT, progress INTEGER, message TEXT, "
+                        "result_file TEXT, error TEXT, detail TEXT, cancel INTEGER DEFAULT 0, created REAL, updated REAL)")
+            con.execute("CREATE INDEX IF NOT EXISTS jobs_updated ON jobs(updated)")
+            if 'detail' not in [r['name'] for r in con.execute("PRAGMA table_info(jobs)")]:
+                con.execute("ALTER TABLE jobs ADD COLUMN detail TEXT")
+
+    def _conn(self):
+        # Bağlantı thread ve süreç başına açılır (fork sonrası paylaşılmaz)
+        con = getattr(self.local, 'con', None)
+        if con is None or self.local.pid != os.getpid():
+            con = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            con.execute("PRAGMA journal_mode=WAL")
+            con.execute("PRAGMA synchronous=NORMAL")
+            con.row_factory = sqlite3.Row
+            self.local.con, self.local.pid = con, os.getpid()
+        return con
+
+    @staticmethod
+    def _record(row):
+        if row is None: return None
+        rec = {k: row[k] for k in JOB_FIELDS}
+        rec["detail"] = json.loads(rec["detail"]) if rec["detail"] else None
+        rec["job_id"], rec["created"], rec["timestamp"] = row["job_id"], row["created"], row["updated"]
+        return rec
+
+    def put(self, job_id, data):
+        now = time.time()
+        self._conn().execute(
+            "INSERT INTO jobs (job_id, status, progress, message, result_file, error, detail, created, updated) VALUES (?,?,?,?,?,?,?,?,?) "
+            "ON CONFLICT(job_id) DO UPDATE SET status=excluded.status, progress=excluded.progress, message=excluded.message, "
+            "result_file=excluded.result_file, error=excluded.error, detail=excluded.detail, updated=excluded.updated",
+            (job_id, *(data.get(k) for k in JOB_FIELDS[:-1]), json.dumps(data["detail"]) if data.get("detail") else None, now, now))
+
+    def get(self, job_id):
+        return self._record(self._conn().execute("SELECT * FROM jobs WHERE job_id=?", (job_id,)).fetchone())
+
+    def list(self, statuses=None, limit=50):
+        if statuses:
+            q = f"SELECT * FROM jobs WHERE status IN ({','.join('?' * len(statuses))}) ORDER BY updated DESC LIMIT ?"
+            rows = self._conn().execute(q, (*statuses, limit))
+        else: rows = self._conn().execute("SELECT * FROM jobs ORDER BY updated DESC LIMIT ?", (limit,))
+        return [self._record(r) for r in rows]
+
+    def request_cancel(self, job_id):
+        self._conn().execute("UPDATE jobs SET cancel=1 WHERE job_id=?", (job_id,))
+
+    def cancel_requested(self, job_id):
+        row = self._conn().execute("SELECT cancel FROM jobs WHERE job_id=?", (job_id,)).fetchone()
+        return bool(row and row["cancel"])
+
+    def purge(self, max_age_s):
+        """Süresi dolan kayıtları siler ve bunları döner."""
+        con = self._conn()
+        cutoff = time.time() - max_age_s
+        con.execute("BEGIN IMMEDIATE")
+        try:
+            expired = [self._record(r) for r in con.execute("SELECT * FROM jobs WHERE updated < ?", (cutoff,))]
+            con.execute("DELETE FROM jobs WHERE updated < ?", (cutoff,))
+            con.execute("COMMIT")
+        except Exception:
+            con.execute("ROLLBACK")
+            raise
+        return expired
+
+class FileJobStore:
+    """İş başına bir JSON dosyası; yazma geçici dosya + os.replace ile atomiktir."""
+    def __init__(self, directory):
+        self.dir = Path(directory)
+
+    def _path(self, job_id):
+        return self.dir / f"{job_id}.json"
+
+    def _read(self, p):
+        try:
+            with open(p, 'r') as f: return json.load(f)
+        except (FileNotFoundError, ValueError): return None
+
+    def put(self, job_id, data):
+        old = self.get(job_id) or {}
+        now = time.time()
+        rec = {k: data.get(k) for k in JOB_FIELDS}
+        rec.update(job_id=job_id, created=old.get("created", now), timestamp=now)
+        tmp = self.dir / f".{job_id}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, 'w') as f: json.dump(rec, f)
+        os.replace(tmp, self._path(job_id))
+
+    def get(self, job_id):
+        return self._read(self._path(job_id))
+
+    def list(self, statuses=None, limit=50):
+        recs = [r for r in (self._read(p) for p in self.dir.glob('*.json')) if r and (not statuses or r.get("status") in statuses)]
+        return sorted(recs, key=lambda r: r.get("timestamp", 0), reverse=True)[:limit]
+
+    def request_cancel(self, job_id):
+        (self.dir / f"{job_id}.cancel").touch()
+
+    def cancel_requested(self, job_id):
+        return (self.dir / f"{job_id}.cancel").exists()
+
+    def purge(self, max_age_s):
+        cutoff = time.time() - max_age_s
+        expired = []
+        for p in self.dir.glob('*.json'):
+            rec = self._read(p)
+            if rec is not None and rec.get("timestamp", 0) < cutoff:
+                expired.append(rec)
+                p.unlink(missing_ok=True)
+                (self.dir / f"{p.stem}.cancel").unlink(missing_ok=True)
+        return expired
+
+JOB_STORE_BACKENDS = {'sqlite': lambda: SQLiteJobStore(JOBS_DIR / 'jobs.db'), 'files': lambda: FileJobStore(JOBS_DIR)}
+JOB_STORE = JOB_STORE_BACKENDS[JOB_STORE_BACKEND]()
+_JOB_PURGE_STATE = {"last": 0.0}
+
+def expire_jobs(force=False):
+    """TTL'i dolan işleri ve rapor dosyalarını siler (en fazla JOB_PURGE_INTERVAL_S saniyede bir)."""
+    now = time.time()
+    if not force and now - _JOB_PURGE_STATE["last"] < JOB_PURGE_INTERVAL_S: return 0
+    _JOB_PURGE_STATE["last"] = now
+    expired = JOB_STORE.purge(JOB_TTL_HOURS * 3600)
+    import shutil
+    for rec in expired:
+        files = [rec.get("result_file")] + list((rec.get("detail") or {}).get("sidecars", []))
+        for name in filter(None, files): (TEMP_RESULTS_DIR / name).unlink(missing_ok=True)
+        for part in JOB_RESULT_PARTS + ('pricing',): shutil.rmtree(result_store_path(f"job_{part}", rec["job_id"]), ignore_errors=True)
+    return len(expired)
+
 # --- YARDIMCI FONKSİYONLAR ---
-def update_job_status(job_id, status, progress, message, result_file=None, error=None):
-    job_file = JOBS_DIR / f"{job_id}.json"
-    data = {
+class JobCancelled(Exception):
+    pass
+
+def update_job_status(job_id, status, progress, message, result_file=None, error=None, detail=None):
+    # Çalışan iş, iptal isteğini her adım geçişinde burada görür
+    if status == "running" and JOB_STORE.cancel_requested(job_id): raise JobCancelled(job_id)
+    JOB_STORE.put(job_id, {
         "status": status,
         "progress": progress,
         "message": f"%{progress} - {message}" if progress > 0 and status == "running" else message,
         "result_file": result_file,
         "error": str(error) if error else None,
-        "timestamp": time.time()
-    }
-    with open(job_file, 'w') as f:
-        json.dump(data, f)
+        "detail": detail,
+    })
+    if status not in JOB_ACTIVE_STATUSES: expire_jobs()
+
+def read_job_status(job_id):
+    return JOB_STORE.get(job_id)
+
+class StageProgress:
+    """Bir aşamanın satır ilerlemesini iş ilerlemesinin [lo, hi] aralığına yansıtır; hız ve kalan süreyi hesaplar.
+    Depoya en fazla saniyede bir yazılır."""
+    def __init__(self, job_id, lo, hi, message, min_interval=1.0):
+        self.job_id, self.lo, self.hi, self.message = job_id, lo, hi, message
+        self.min_interval = min_interval
+        self.first = None
+        self.last = 0.0
+
+    def __call__(self, done, total):
+        now = time.time()
+        # Hız ilk bildirimden itibaren ölçülür; aşamanın hazırlık süresi (indeks kurulumu) tahmini bozmaz
+        if self.first is None: self.first = (now, done)
+        if done < total and now - self.last < self.min_interval: return
+        self.last = now
+        t_ref, d_ref = self.first
+        rate = (done - d_ref) / (now - t_ref) if now > t_ref and done > d_ref else None
+        eta = (total - done) / rate if rate else None
+        progress = self.lo + int((self.hi - self.lo) * done / max(total, 1))
+        note = f"{done}/{total} satır" + (f", {rate:.0f} satır/sn" if rate else "") + (f", kalan ~{eta:.0f} sn" if eta is not None and done < total else "")
+        update_job_status(self.job_id, "running", progress, f"{self.message} ({note})",
+                          detail={"rows_done": done, "rows_total": total, "rows_per_sec": round(rate, 1) if rate else None,
+                                  "eta_sec": round(eta, 1) if eta is not None else None})
+
+# --- AŞAMA ÖLÇÜMLERİ ---
+# Her aşama (span) duvar saati, CPU süresi (iş parçacığı + biten alt süreçler), bellek tepe değeri (RSS) ve satır sayısı kaydeder.
+# Tepe RSS için /proc/self/status VmHWM okunur ve her span başında /proc/self/clear_refs ile sıfırlanır; sıfırlamadan önceki
+# değer o an açık tüm span'lere işlenir, böylece iç içe ve eşzamanlı span'ler kendi ömürlerindeki tepeyi görür.
+# Paralel parçalarda (parallel_map) alt süreçlerin span'leri ana sürece taşınıp toplanır: süreler parçalar üzerinden toplamdır.
+_SPAN_LOCAL = threading.local()
+_SPAN_LOCK = threading.Lock()
+_OPEN_SPANS = []
+
+def _span_reinit():
+    global _SPAN_LOCK
+    _SPAN_LOCK = threading.Lock()
+    _OPEN_SPANS.clear()
+os.register_at_fork(after_in_child=_span_reinit)
+
+def _hwm_mb():
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'): return int(line.split()[1]) / 1024
+    except OSError: pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def _fold_hwm(reset):
+    hwm = _hwm_mb()
+    for sp in _OPEN_SPANS: sp['peak'] = max(sp['peak'], hwm)
+    if not reset: return
+    try:
+        with open('/proc/self/clear_refs', 'w') as f: f.write('5')
+    except OSError: pass
+
+def _cpu_s():
+    t = os.times()
+    return time.thread_time() + t.children_user + t.children_system
+
+class SpanRecorder:
+    """Bir işin (ya da isteğin) aşama ölçümleri; aynı adlı span'ler toplanır (calls, toplam süre, en yüksek RSS)."""
+    def __init__(self):
+        self.totals = {}
+        self._phase = None
+        self._t0 = time.time()
+
+    def record(self, name, wall_s, cpu_s, peak_mb, rows=None, calls=1):
+        t = self.totals.setdefault(name, {"wall_s": 0.0, "cpu_s": 0.0, "peak_rss_mb": 0.0, "rows": 0, "calls": 0})
+        t["wall_s"] += wall_s; t["cpu_s"] += cpu_s; t["calls"] += calls
+        t["peak_rss_mb"] = max(t["peak_rss_mb"], peak_mb)
+        if rows: t["rows"] += int(rows)
+
+    def begin(self, name, rows=None):
+        sp = {"name": name, "rows": rows, "wall": time.perf_counter(), "cpu": _cpu_s(), "peak": 0.0}
+        with _SPAN_LOCK:
+            _fold_hwm(reset=True)
+            sp['peak'] = _hwm_mb()
+            _OPEN_SPANS.append(sp)
+        return sp
+
+    def end(self, sp):
+        with _SPAN_LOCK:
+            _fold_hwm(reset=False)
+            if sp in _OPEN_SPANS: _OPEN_SPANS.remove(sp)
+        self.record(sp["name"], time.perf_counter() - sp["wall"], _cpu_s() - sp["cpu"], sp["peak"], sp["rows"])
+
+    def phase(self, name, rows=None):
+        # Ardışık aşamalar: önceki aşama kapanır, yenisi açılır. Dönen sözlükte 'rows' sonradan doldurulabilir.
+        self.close()
+        self._phase = self.begin(name, rows)
+        return self._phase
+
+    def close(self):
+        if self._phase is not None: self.end(self._phase)
+        self._phase = None
+
+    def export(self):
+        return [(name, t["wall_s"], t["cpu_s"], t["peak_rss_mb"], t["rows"], t["calls"]) for name, t in self.totals.items()]
+
+    def merge(self, exported):
+        for name, wall_s, cpu_s, peak_mb, rows, calls in exported: self.record(name, wall_s, cpu_s, peak_mb, rows, calls)
+
+    def summary(self):
+        out = [{"stage": name, "wall_s": round(t["wall_s"], 3), "cpu_s": round(t["cpu_s"], 3), "peak_rss_mb": round(t["peak_rss_mb"], 1),
+                "rows": t["rows"], "calls": t["calls"]} for name, t in self.totals.items()]
+        out.append({"stage": "total", "wall_s": round(time.time() - self._t0, 3)})
+        return out
+
+    def attach(self):
+        # Kaydediciyi bu iş parçacığında etkin yapar; önceki kaydedici döner (detach'e verilir)
+        prev = getattr(_SPAN_LOCAL, 'recorder', None)
+        _SPAN_LOCAL.recorder = self
+        return prev
+
+    def detach(self, prev=None):
+        self.close()
+        _SPAN_LOCAL.recorder = prev
+
+    @contextmanager
+    def active(self):
+        prev = self.attach()
+        try: yield self
+        finally: self.detach(prev)
+
+def current_spans():
+    return getattr(_SPAN_LOCAL, 'recorder', None)
+
+@contextmanager
+def span(name, rows=None):
+    """Etkin kaydediciye bir span ekler; kaydedici yoksa ölçüm yapılmaz. Dönen sözlükte 'rows' sonradan ayarlanabilir."""
+    rec = current_spans()
+    if rec is None:
+        yield {"rows": rows}
+        return
+    sp = rec.begin(name, rows)
+    try: yield sp
+    finally: rec.end(sp)
+
+# Histogram sınırları: aşama süresi (sn) ve bellek tepe değeri (bayt)
+METRIC_SECONDS_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+METRIC_BYTES_BUCKETS = tuple(mb * 2 ** 20 for mb in (16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192))
+METRICS_FILE = JOBS_DIR / 'metrics.json'
+
+class _MetricsLock:
+    def __enter__(self):
+        self.f = open(JOBS_DIR / 'metrics.lock', 'w')
+        fcntl.flock(self.f, fcntl.LOCK_EX)
+        return self
+    def __exit__(self, *exc):
+        self.f.close()
+
+def _observe(hist, value, buckets):
+    if not hist: hist.update(buckets=[0] * len(buckets), sum=0.0, count=0)
+    for i, b in enumerate(buckets):
+        if value <= b: hist["buckets"][i] += 1
+    hist["sum"] += value; hist["count"] += 1
+
+def _update_metrics(update):
+    # metrics.json'u kilit altında okuyup update(data) ile değiştirir ve atomik olarak yazar
+    try:
+        with _MetricsLock():
+            try:
+                with open(METRICS_FILE) as f: data = json.load(f)
+            except (FileNotFoundError, ValueError): data = {}
+            update(data)
+            tmp = METRICS_FILE.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+            with open(tmp, 'w') as f: json.dump(data, f)
+            os.replace(tmp, METRICS_FILE)
+    except Exception:
+        traceback.print_exc()
+
+def count_metric(name, label, n=1):
+    """Tüm süreçlerin paylaştığı birikimli sayaca n ekler (ör. count_metric('parse_cache', 'hit'))."""
+    def update(data):
+        counters = data.setdefault("counters", {})
+        counters[f"{name}|{label}"] = counters.get(f"{name}|{label}", 0) + n
+    _update_metrics(update)
+
+def record_stage_metrics(pipeline, summary, status=None):
+    """İş/istek bitince aşama özetlerini tüm süreçlerin paylaştığı birikimli histogramlara ekler (jobs/metrics.json)."""
+    def update(data):
+        stages = data.setdefault("stages", {})
+        for st in summary:
+            m = stages.setdefault(f"{pipeline}|{st['stage']}", {})
+            _observe(m.setdefault("wall", {}), st["wall_s"], METRIC_SECONDS_BUCKETS)
+            if "cpu_s" in st: _observe(m.setdefault("cpu", {}), st["cpu_s"], METRIC_SECONDS_BUCKETS)
+            if st.get("peak_rss_mb"): _observe(m.setdefault("rss", {}), st["peak_rss_mb"] * 2 ** 20, METRIC_BYTES_BUCKETS)
+            if "rows" in st: m["rows"] = m.get("rows", 0) + st["rows"]
+        if status:
+            runs = data.setdefault("runs", {})
+            runs[f"{pipeline}|{status}"] = runs.get(f"{pipeline}|{status}", 0) + 1
+    _update_metrics(update)
+
+def _prom_histogram(lines, name, labels, hist, buckets):
+    for b, c in zip(buckets, hist["buckets"]): lines.append(f'{name}_bucket{{{labels},le="{b}"}} {c}')
+    lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {hist["count"]}')
+    lines.append(f'{name}_sum{{{labels}}} {hist["sum"]:.6f}')
+    lines.append(f'{name}_count{{{labels}}} {hist["count"]}')
+
+def render_metrics():
+    """Birikimli aşama histogramları, iş sayaçları ve anlık kuyruk/önbellek göstergeleri (Prometheus metin biçimi)."""
+    try:
+        with open(METRICS_FILE) as f: data = json.load(f)
+    except (FileNotFoundError, ValueError): data = {}
+    stages = sorted(data.get("stages", {}).items())
+    lines = []
+    for name, key, buckets, help_ in [('stokcu_stage_wall_seconds', 'wall', METRIC_SECONDS_BUCKETS, 'Aşama duvar saati süresi (iş başına).'),
+                                      ('stokcu_stage_cpu_seconds', 'cpu', METRIC_SECONDS_BUCKETS, 'Aşama CPU süresi (iş parçacığı + alt süreçler).'),
+                                      ('stokcu_stage_peak_rss_bytes', 'rss', METRIC_BYTES_BUCKETS, 'Aşama boyunca süreç bellek tepe değeri.')]:
+        lines += [f"# HELP {name} {help_}", f"# TYPE {name} histogram"]
+        for label, m in stages:
+            pipeline, stage = label.split('|', 1)
+            if key in m: _prom_histogram(lines, name, f'pipeline="{pipeline}",stage="{stage}"', m[key], buckets)
+    lines += ["# HELP stokcu_stage_rows_total Aşamalarda işlenen satır sayısı.", "# TYPE stokcu_stage_rows_total counter"]
+    for label, m in stages:
+        if "rows" not in m: continue
+        pipeline, stage = label.split('|', 1)
+        lines.append(f'stokcu_stage_rows_total{{pipeline="{pipeline}",stage="{stage}"}} {m.get("rows", 0)}')
+    lines += ["# HELP stokcu_runs_total Biten iş/istek sayısı.", "# TYPE stokcu_runs_total counter"]
+    for label, c in sorted(data.get("runs", {}).items()):
+        pipeline, status = label.split('|', 1)
+        lines.append(f'stokcu_runs_total{{pipeline="{pipeline}",status="{status}"}} {c}')
+    counters = data.get("counters", {})
+    lines += ["# HELP stokcu_parse_cache_lookups_total Ayrıştırma önbelleği aramaları (result=hit|miss).", "# TYPE stokcu_parse_cache_lookups_total counter"]
+    lines += [f'stokcu_parse_cache_lookups_total{{result="{r}"}} {counters.get(f"parse_cache|{r}", 0)}' for r in ('hit', 'miss')]
+    lines += ["# HELP stokcu_job_queue_length Kuyrukta bekleyen iş sayısı.", "# TYPE stokcu_job_queue_length gauge",
+              f"stokcu_job_queue_length {len(_queue_entries())}",
+              "# HELP stokcu_jobs_running Çalışan iş sayısı.", "# TYPE stokcu_jobs_running gauge",
+              f"stokcu_jobs_running {len(JOB_STORE.list(('running',), limit=JOB_QUEUE_MAX + JOB_WORKERS))}",
+              "# HELP stokcu_normalizer_cache_hits Metin normalizasyon önbelleği isabetleri (bu süreç).", "# TYPE stokcu_normalizer_cache_hits gauge"]
+    stats = NORMALIZER.stats()
+    lines += [f'stokcu_normalizer_cache_hits{{cache="{k}"}} {v["hits"]}' for k, v in stats.items()]
+    lines += ["# HELP stokcu_normalizer_cache_misses Metin normalizasyon önbelleği ıskaları (bu süreç).", "# TYPE stokcu_normalizer_cache_misses gauge"]
+    lines += [f'stokcu_normalizer_cache_misses{{cache="{k}"}} {v["misses"]}' for k, v in stats.items()]
+    return "\n".join(lines) + "\n"
+
+# --- İŞ KUYRUĞU ---
+# Kuyruk, tüm gunicorn süreçlerinin (ve ayrı worker sürecinin) paylaştığı JOB_QUEUE_DIR altındaki dosyalardır.
+# Kayıt adı "<9-öncelik>_<zaman>_<job_id>.job.json": ada göre sıralama = önce yüksek öncelik, sonra FIFO.
+# Eşzamanlılık sınırı JOB_WORKERS adet slot dosyası üzerindeki flock kilitleriyle sağlanır; süreç ölürse kilit kendiliğinden düşer.
+# Alınan iş "<aynı ad>.job.running" kaydına sahibiyle (host, pid, slot) taşınır; sahibi ölen iş worker başlarken kuyruğa geri konur.
+def _queue_entries():
+    return sorted(JOB_QUEUE_DIR.glob('*.job.json'))
+
+def _queue_entry(job_id):
+    return next((p for p in _queue_entries() if p.name.endswith(f"_{job_id}.job.json")), None)
+
+class _QueueLock:
+    def __enter__(self):
+        self.f = open(JOB_QUEUE_DIR / 'queue.lock', 'w')
+        fcntl.flock(self.f, fcntl.LOCK_EX)
+        return self
+    def __exit__(self, *exc):
+        self.f.close()
+
+def parse_job_priority(value):
+    try: return min(max(int(value), 0), 9)
+    except (TypeError, ValueError): return JOB_DEFAULT_PRIORITY
+
+def job_queue_full():
+    return len(_queue_entries()) >= JOB_QUEUE_MAX
+
+def enqueue_job(job_id, upload_path, kwargs, priority=JOB_DEFAULT_PRIORITY):
+    """İşi kuyruğa yazar; kuyruk doluysa False döner. kwargs run_matching_job'ın adlı argümanlarıdır (job_id ve mp_path hariç)."""
+    with _QueueLock():
+        if job_queue_full(): return False
+        update_job_status(job_id, "queued", 0, "Sırada bekliyor...")
+        name = f"{9 - priority}_{time.time_ns():020d}_{job_id}.job.json"
+        tmp = JOB_QUEUE_DIR / f".{name}.tmp"
+        with open(tmp, 'w') as f: json.dump({"job_id": job_id, "priority": priority, "upload_path": upload_path, "kwargs": kwargs}, f)
+        os.replace(tmp, JOB_QUEUE_DIR / name)
+    return True
+
+def queue_position(job_id):
+    for i, p in enumerate(_queue_entries()):
+        if p.name.endswith(f"_{job_id}.job.json"): return i + 1
+    return None
+
+def cancel_job(job_id):
+    """Sıradaki işi kuyruktan siler; çalışan işe iptal bayrağı bırakır. Yeni durumu döner (iş yoksa None)."""
+    with _QueueLock():
+        entry = _queue_entry(job_id)
+        if entry is not None:
+            with open(entry, 'r') as f: spec = json.load(f)
+            entry.unlink()
+            mp_path = job_spec_kwargs(spec)['mp_path']
+            if mp_path and os.path.exists(mp_path): os.remove(mp_path)
+            update_job_status(job_id, "cancelled", 0, "İptal edildi.")
+            return "cancelled"
+    data = read_job_status(job_id)
+    if data is None: return None
+    # Kuyruktan alınmış ama henüz başlamamış iş de "queued" görünür; ikisi de bayrakla durdurulur
+    if data.get("status") in JOB_ACTIVE_STATUSES:
+        JOB_STORE.request_cancel(job_id)
+        return "cancelling"
+    return data.get("status")
+
+def _acquire_job_slot():
+    for i in range(max(JOB_WORKERS, 1)):
+        f = open(JOB_QUEUE_DIR / f"slot-{i}.lock", 'w')
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return f
+        except BlockingIOError:
+            f.close()
+    return None
+
+def job_spec_kwargs(spec):
+    # Kuyruk kaydından run_matching_job argümanları; eski (konumsal 'args') kayıtlar parametre adlarıyla eşlenir
+    if 'args' in spec: return dict(zip(inspect.signature(run_matching_job).parameters, spec['args']))
+    return {**spec['kwargs'], 'job_id': spec['job_id'], 'mp_path': spec['upload_path']}
+
+def _claim_next_job(slot=None):
+    with _QueueLock():
+        entries = _queue_entries()
+        if not entries: return None
+        with open(entries[0], 'r') as f: spec = json.load(f)
+        spec["owner"] = {"host": socket.gethostname(), "pid": os.getpid(), "slot": Path(slot.name).name if slot else None}
+        claim = entries[0].with_suffix('.running')
+        tmp = JOB_QUEUE_DIR / f".{claim.name}.tmp"
+        with open(tmp, 'w') as f: json.dump(spec, f)
+        os.replace(tmp, claim)
+        entries[0].unlink()
+        return spec
+
+def _release_job_claim(spec):
+    for claim in JOB_QUEUE_DIR.glob(f"*_{spec['job_id']}.job.running"): claim.unlink(missing_ok=True)
+
+def _job_owner_alive(owner):
+    # Aynı makinedeki sahip süreç yoksa ya da işin slot kilidini artık kimse tutmuyorsa iş sahipsizdir
+    if owner.get("host") == socket.gethostname():
+        try: os.kill(owner["pid"], 0)
+        except ProcessLookupError: return False
+        except PermissionError: pass
+    if not owner.get("slot"): return False
+    with open(JOB_QUEUE_DIR / owner["slot"], 'w') as f:
+        try: fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError: return True
+    return False
+
+def reclaim_orphaned_jobs():
+    """Sahibi ölmüş çalışan işleri aynı öncelik ve sırayla kuyruğa geri koyar; yüklemesi kalmayan iş hata olarak kapanır.
+    Geri alınan iş sayısını döner."""
+    reclaimed = 0
+    with _QueueLock():
+        for claim in sorted(JOB_QUEUE_DIR.glob('*.job.running')):
+            try:
+                with open(claim, 'r') as f: spec = json.load(f)
+            except (OSError, ValueError): continue
+            if _job_owner_alive(spec.get("owner") or {}): continue
+            job_id, mp_path = spec["job_id"], job_spec_kwargs(spec)['mp_path']
+            if JOB_STORE.cancel_requested(job_id):
+                claim.unlink()
+                if mp_path and os.path.exists(mp_path): os.remove(mp_path)
+                update_job_status(job_id, "cancelled", 0, "İptal edildi.")
+            elif mp_path and os.path.exists(mp_path):
+                os.replace(claim, claim.with_suffix('.json'))
+                update_job_status(job_id, "queued", 0, "Çalıştıran süreç durduğu için yeniden sıraya alındı.")
+            else:
+                claim.unlink()
+                update_job_status(job_id, "error", 0, "Hata oluştu", error="Çalıştıran süreç durdu ve yükleme dosyası bulunamadı.")
+            logger.warning("Sahipsiz iş geri alındı: %s", job_id)
+            reclaimed += 1
+    return reclaimed
+
+def _job_worker_loop():
+    while True:
+        spec = None
+        try:
+            slot = _acquire_job_slot()
+            if slot is not None:
+                try:
+                    spec = _claim_next_job(slot)
+                    if spec:
+                        try: run_matching_job(**job_spec_kwargs(spec))
+                        finally: _release_job_claim(spec)
+                finally: slot.close()
+        except Exception:
+            traceback.print_exc()
+        if spec is None: time.sleep(JOB_POLL_SECONDS)
+
+_JOB_WORKERS_STATE = {"pid": None}
+_JOB_WORKERS_LOCK = threading.Lock()
+
+def start_job_workers():
+    # Fork sonrası (gunicorn) thread'ler kopyalanmaz; süreç başına bir kez başlatılır
+    with _JOB_WORKERS_LOCK:
+        if _JOB_WORKERS_STATE["pid"] == os.getpid(): return
+        _JOB_WORKERS_STATE["pid"] = os.getpid()
+        for _ in range(max(JOB_WORKERS, 1)):
+            threading.Thread(target=_job_worker_loop, daemon=True).start()
+
+_BACKGROUND_STATE = {"pid": None}
+
+def start_reclaim():
+    # Yeniden başlatmada ölen süreçlerin yarıda kalan işleri kuyruğa döner; hata süreç başlangıcını durdurmaz
+    try: reclaim_orphaned_jobs()
+    except Exception: traceback.print_exc()
+
+def start_background_threads():
+    """Süreç başına iş worker'larını (JOB_RUNNER=embedded) ve kur yenileyiciyi başlatır.
+    gunicorn'da gunicorn.conf.py'deki post_fork kancasından, ayrı worker sürecinde run_job_worker'dan çağrılır."""
+    _BACKGROUND_STATE["pid"] = os.getpid()
+    start_reclaim()
+    if JOB_RUNNER == 'embedded': start_job_workers()
+    if RATES_REFRESHER: start_rate_refresher()
+
+@app.before_request
+def ensure_background_threads():
+    # Yalnızca geliştirme sunucusu (app.run) için yedek; gunicorn'da thread'ler post_fork'ta başlamış olur
+    if _BACKGROUND_STATE["pid"] != os.getpid(): start_background_threads()
 
 def clean_column_name(col_name):
     if col_name is None: return ""
@@ -64,12 +740,16 @@ def clean_column_name(col_name):
     return re.sub(r'\s+', ' ', s).strip().lower()
 
 # --- STOK AYRIŞTIRMA VE ANALİZ ---
+STOCK_NEGATIVE_KEYWORDS = ["yok", "tükendi", "mevcut değil", "kalmadı", "gelince", "temin", "sorunuz", "stokta yok"]
+STOCK_NEGATIVE_PATTERN = '|'.join(re.escape(kw) for kw in STOCK_NEGATIVE_KEYWORDS)
+# float() ile birebir aynı sonucu veren sade sayı biçimi; bunun dışındaki değerler skaler ayrıştırıcıya düşer
+PLAIN_FLOAT_PATTERN = r'[+-]?(?:[0-9]+\.?[0-9]*|\.[0-9]+)(?:e[+-]?[0-9]+)?'
+
 def parse_stock_value(stock_str):
     if pd.isna(stock_str) or stock_str is None: return 0
     s = str(stock_str).strip().lower()
     if not s or s == 'nan' or s == 'none': return 0
-    negative_keywords = ["yok", "tükendi", "mevcut değil", "kalmadı", "gelince", "temin", "sorunuz", "stokta yok"]
-    if any(kw in s for kw in negative_keywords): return 0
+    if any(kw in s for kw in STOCK_NEGATIVE_KEYWORDS): return 0
     s = s.replace(',', '.').replace('\xa0', '')
     val = 0
     try: 
@@ -97,37 +777,293 @@ def parse_price_value(val):
     except:
         return decimal.Decimal(0)
 
+# --- KOLON BAZLI AYRIŞTIRMA ---
+def _fallback(values, mask, func, out):
+    # Hızlı yola uymayan değerler skaler fonksiyonla (benzersiz değer başına bir kez) çözülür;
+    # int64'e sığmayan sonuçlar ayrıştırılamayan değer gibi 0 sayılır
+    if mask.any():
+        res = map_unique(values[mask], func).to_numpy(dtype=object)
+        out[mask] = [v if -2 ** 63 < v < 2 ** 63 else 0 for v in res]
+    return out
+
+def parse_stock_column(values):
+    # parse_stock_value'nun kolon versiyonu; aynı kurallarla int64 dizi döner
+    values = pd.Series(values, dtype=object).reset_index(drop=True)
+    out = np.zeros(len(values), dtype=np.int64)
+    t = values.astype(str).str.strip().str.lower()
+    zero = (values.isna() | t.isin(['', 'nan', 'none']) | t.str.contains(STOCK_NEGATIVE_PATTERN)).to_numpy(dtype=bool)
+    t = t.str.replace(',', '.', regex=False).str.replace('\xa0', '', regex=False)
+    fast = ~zero & t.str.fullmatch(PLAIN_FLOAT_PATTERN).to_numpy(dtype=bool)
+    nums = np.asarray(t[fast], dtype=object).astype(np.float64)
+    ok = np.abs(nums) < 2.0 ** 62
+    idx = np.flatnonzero(fast)
+    out[idx[ok]] = np.maximum(np.trunc(nums[ok]), 0).astype(np.int64)
+    fast[idx[~ok]] = False
+    return _fallback(values, ~zero & ~fast, parse_stock_value, out)
+
+def decimal_to_scaled(value, scale=PRICE_SCALE):
+    return int(decimal.Decimal(value).scaleb(scale).quantize(decimal.Decimal(1), rounding=decimal.ROUND_HALF_EVEN))
+
+def parse_price_column(values, scale=PRICE_SCALE):
+    # parse_price_value'nun kolon versiyonu; değer × 10^scale olarak int64 döner.
+    # scale'den fazla ondalık basamak yarıya-çift kuralıyla yuvarlanır, kalan her şey birebir aynıdır.
+    values = pd.Series(values, dtype=object).reset_index(drop=True)
+    out = np.zeros(len(values), dtype=np.int64)
+    t = values.astype(str).str.strip().str.replace('\xa0', '', regex=False).str.replace(' ', '', regex=False)
+    zero = (values.isna() | t.str.lower().isin(['nan', 'none', '', '0'])).to_numpy(dtype=bool)
+    t = t.str.replace(r'[^\d.,]', '', regex=True)
+    has_dot = t.str.contains('.', regex=False); has_comma = t.str.contains(',', regex=False)
+    comma_last = t.str.rfind(',') > t.str.rfind('.')
+    t = t.mask(has_dot & has_comma & comma_last, t.str.replace('.', '', regex=False).str.replace(',', '.', regex=False))
+    t = t.mask(has_dot & has_comma & ~comma_last, t.str.replace(',', '', regex=False))
+    t = t.mask(~has_dot & has_comma, t.str.replace(',', '.', regex=False))
+    parts = t.fillna('').str.partition('.')
+    whole, frac = parts[0], parts[2]
+    fast = (~zero & t.str.fullmatch(r'[0-9]*\.?[0-9]*').to_numpy(dtype=bool)
+            & (whole.str.len() + frac.str.len() > 0).to_numpy(dtype=bool)
+            & (whole.str.len() <= 18 - scale).to_numpy(dtype=bool) & (frac.str.len() <= scale).to_numpy(dtype=bool))
+    digits = (whole + frac.str.ljust(scale, '0'))[fast]
+    out[fast] = np.asarray(digits, dtype=object).astype(np.int64)
+    return _fallback(values, ~zero & ~fast, lambda v: decimal_to_scaled(parse_price_value(v), scale), out)
+
+def parse_money_column(values, scale=KURUS_SCALE):
+    # Pazaryeri fiyatı gibi sade sayıları (virgül ondalık kabul edilir) ölçeklenmiş int64'e çevirir; boş değerler 0.
+    # Geçersiz değerler eskisi gibi Decimal hatası fırlatır.
+    values = pd.Series(values, dtype=object).reset_index(drop=True)
+    out = np.zeros(len(values), dtype=np.int64)
+    t = values.astype(str).str.replace(',', '.', regex=False).str.strip()
+    zero = (values.isna() | (t == '')).to_numpy(dtype=bool)
+    parts = t.fillna('').str.lstrip('+-').str.partition('.')
+    whole, frac = parts[0], parts[2]
+    fast = (~zero & t.str.fullmatch(r'[+-]?(?:[0-9]+\.?[0-9]*|\.[0-9]+)').to_numpy(dtype=bool)
+            & (whole.str.len() <= 18 - scale).to_numpy(dtype=bool) & (frac.str.len() <= scale).to_numpy(dtype=bool))
+    digits = np.asarray((whole + frac.str.ljust(scale, '0'))[fast], dtype=object).astype(np.int64)
+    out[fast] = np.where(t[fast].str.startswith('-').to_numpy(dtype=bool), -digits, digits)
+    return _fallback(values, ~zero & ~fast, lambda v: decimal_to_scaled(decimal.Decimal(str(v).replace(',', '.')), scale), out)
+
+def scaled_column(values, scale=PRICE_SCALE):
+    # Decimal/float/str değerli bir kolonu ölçeklenmiş int64'e çevirir; boş değerler 0
+    values = pd.Series(values, dtype=object).reset_index(drop=True)
+    return map_unique(values, lambda v: decimal_to_scaled(decimal.Decimal(str(v)), scale) if pd.notna(v) else 0).to_numpy(dtype=np.int64)
+
+# --- SABİT NOKTALI PARA ---
+# fx_conversion bölmesinde sonucun yuvarlanmadan önce tutulduğu ek ondalık basamak
+MONEY_DIV_DIGITS = 20
+
+def _decimal_fraction(value):
+    # value == num / 10**exp olacak şekilde (num, exp) döner
+    value = decimal.Decimal(value)
+    exp = max(0, -value.as_tuple().exponent)
+    return int(value.scaleb(exp)), exp
+
+def _round_div(values, den):
+    # Yarıya-çift yuvarlamalı tam sayı bölmesi (den > 0); Decimal.quantize ile aynı sonucu verir
+    q = values // den; r = values - q * den
+    return q + ((2 * r > den) | ((2 * r == den) & (q % 2 == 1)))
+
+class Money:
+    """Sabit noktalı para kolonu: tutar = values / 10**scale.
+
+    values normalde int64'tür; çarpım taşma riski taşıdığında Python int (object) dizisine geçer.
+    Çarpma ve toplama tamdır, yuvarlama yalnızca rescale'de (yarıya-çift) yapılır.
+    """
+    def __init__(self, values, scale=KURUS_SCALE):
+        values = np.asarray(values)
+        self.values = values if values.dtype == object else values.astype(np.int64)
+        self.scale = scale
+
+    @classmethod
+    def constant(cls, value, n):
+        num, exp = _decimal_fraction(value)
+        return cls(np.full(n, num, dtype=np.int64), exp)
+
+    @classmethod
+    def zeros(cls, n, scale=KURUS_SCALE):
+        return cls(np.zeros(n, dtype=np.int64), scale)
+
+    @classmethod
+    def select(cls, mask, a, b):
+        # mask olan satırlarda a, diğerlerinde b
+        scale = max(a.scale, b.scale)
+        return cls(np.where(mask, a._at(scale), b._at(scale)), scale)
+
+    def __len__(self): return len(self.values)
+
+    def _widened(self, factor):
+        # Çarpım ve ardından bir toplama int64'e sığmayacaksa Python int'e geç
+        v = self.values
+        if v.dtype != object and max(int(np.abs(v).max()) if len(v) else 0, 1) * abs(factor) >= 2 ** 62: v = v.astype(object)
+        return v
+
+    def _at(self, scale):
+        return self.values if scale == self.scale else self._widened(10 ** (scale - self.scale)) * 10 ** (scale - self.scale)
+
+    def rescale(self, scale=KURUS_SCALE):
+        if scale >= self.scale: return Money(self._at(scale), scale)
+        return Money(_round_div(self.values, 10 ** (self.scale - scale)), scale)
+
+    def __mul__(self, factor):
+        num, exp = _decimal_fraction(factor)
+        return Money(self._widened(num) * num, self.scale + exp)
+
+    def __truediv__(self, divisor):
+        # Decimal bölmesi gibi tam olmayabilir; sonuç MONEY_DIV_DIGITS ek basamakta yarıya-çift yuvarlanır
+        num, exp = _decimal_fraction(divisor)
+        sign = -1 if num < 0 else 1
+        return Money(sign * _round_div(self.values.astype(object) * 10 ** (exp + MONEY_DIV_DIGITS), abs(num)), self.scale + MONEY_DIV_DIGITS)
+
+    def __add__(self, other):
+        if not isinstance(other, Money): other = Money.constant(other, len(self))
+        scale = max(self.scale, other.scale)
+        return Money(self._at(scale) + other._at(scale), scale)
+
+    def _cmp(self, other):
+        if not isinstance(other, Money): other = Money.constant(other, len(self))
+        scale = max(self.scale, other.scale)
+        return self._at(scale), other._at(scale)
+
+    def __lt__(self, other): a, b = self._cmp(other); return np.asarray(a < b, dtype=bool)
+    def __le__(self, other): a, b = self._cmp(other); return np.asarray(a <= b, dtype=bool)
+    def __gt__(self, other): a, b = self._cmp(other); return np.asarray(a > b, dtype=bool)
+    def __ge__(self, other): a, b = self._cmp(other); return np.asarray(a >= b, dtype=bool)
+    def __eq__(self, other): a, b = self._cmp(other); return np.asarray(a == b, dtype=bool)
+    __hash__ = None
+
+    def to_int64(self, scale=KURUS_SCALE):
+        return self.rescale(scale).values.astype(np.int64)
+
+    def to_float(self):
+        if self.values.dtype != object and (not len(self) or int(np.abs(self.values).max()) < 2 ** 53):
+            return self.values.astype(np.float64) / 10 ** self.scale
+        return np.array([float(decimal.Decimal(int(v)).scaleb(-self.scale)) for v in self.values], dtype=np.float64)
+
 # --- METİN VE BİRİM STANDARDİZASYONU ---
-def normalize_units(text):
-    if not text: return ""
-    text = text.lower()
-    text = re.sub(r'(\d+)\s+(mm|cm|mt|m|gr|kg|w|v|lt|ml|bar|adet|pcs|set)\b', r'\1\2', text)
-    replacements = {
-        "watt": "w", "volt": "v", "amper": "amp", "siyah": "", "beyaz": "", 
-        "kirmizi": "", "mavi": "", "sari": "", "yesil": "", "turuncu": "",
-        "takim": "set", "cift": "set"
-    }
-    for k, v in replacements.items():
-        text = re.sub(r'\b' + k + r'\b', v, text)
-    return text
-
-def strict_normalize(text):
-    if not text: return ""
-    text = str(text).lower()
-    text = text.replace('ı', 'i').replace('ğ', 'g').replace('ü', 'u').replace('ş', 's').replace('ö', 'o').replace('ç', 'c')
-    text = normalize_units(text)
-    return re.sub(r'[^a-z0-9]', '', text)
+UNIT_SPACE_PATTERN = re.compile(r'(\d+)\s+(mm|cm|mt|m|gr|kg|w|v|lt|ml|bar|adet|pcs|set)\b')
+UNIT_REPLACEMENTS = {
+    "watt": "w", "volt": "v", "amper": "amp", "siyah": "", "beyaz": "",
+    "kirmizi": "", "mavi": "", "sari": "", "yesil": "", "turuncu": "",
+    "takim": "set", "cift": "set"
+}
+# Kelimeler sınırlarla ayrıldığı için sıralı re.sub zinciri tek geçişlik alternasyonla aynı sonucu verir
+UNIT_WORD_PATTERN = re.compile(r'\b(' + '|'.join(UNIT_REPLACEMENTS) + r')\b')
+TITLE_PREFIX_PATTERN = re.compile(r'\b(rm_|tyc_|hbv|akn_|frkn)\w*')
+TITLE_TR_MAP = str.maketrans("ğüşıöçâêîôû", "gusiocaeiou")
+TITLE_NOISE = ["orijinal", "ithal", "yerli", "uretim", "yeni", "kampanya", "kargo", "bedava", "firsati", "garantili"]
+MATCH_CODE_PREFIXES = ["CETA", "IZELTAS", "BOSCH", "MAKITA", "DEWALT", "KNIPEX", "CERPA", "ELTA", "RTR", "ATTLAS"]
+MATCH_CODE_PREFIX_PATTERNS = [(pre, re.compile(f'^{pre}[-\\s\\.]*')) for pre in MATCH_CODE_PREFIXES]
+
+class TextNormalizer:
+    """Eşleştirme hattındaki metin normalizasyonlarının ortak, önbellekli hali.
+
+    Her fonksiyon ham metne göre sınırlı bir LRU önbelleğiyle sarılır; kolon API'leri yalnızca benzersiz
+    değerleri normalize eder. stats() önbellek isabet/ıska sayılarını döner.
+    """
+    def __init__(self, maxsize=NORMALIZE_CACHE_SIZE):
+        cache = functools.lru_cache(maxsize=maxsize, typed=True)
+        self.units = cache(self._units)
+        self.strict = cache(self._strict)
+        self.match_code = cache(self._match_code)
+        self.title = cache(self._title)
+        self.tokens = cache(self._tokens)
+
+    @staticmethod
+    def _units(text):
+        if not text: return ""
+        text = UNIT_SPACE_PATTERN.sub(r'\1\2', text.lower())
+        return UNIT_WORD_PATTERN.sub(lambda m: UNIT_REPLACEMENTS[m.group(1)], text)
+
+    def _strict(self, text):
+        if not text: return ""
+        text = str(text).lower()
+        text = text.replace('ı', 'i').replace('ğ', 'g').replace('ü', 'u').replace('ş', 's').replace('ö', 'o').replace('ç', 'c')
+        return re.sub(r'[^a-z0-9]', '', self.units(text))
+
+    @staticmethod
+    def _match_code(code):
+        if not code or pd.isna(code): return "KOD_YOK"
+        s = str(code).upper().strip()
+        for pre, pattern in MATCH_CODE_PREFIX_PATTERNS:
+            if s.startswith(pre):
+                s = pattern.sub('', s)
+                break
+        return re.sub(r'[^A-Z0-9]', '', s)
+
+    def _title(self, text):
+        if not isinstance(text, str): return ""
+        text = TITLE_PREFIX_PATTERN.sub('', text.lower())
+        text = text.replace("frkn", "").translate(TITLE_TR_MAP)
+        text = self.units(text)
+        for w in TITLE_NOISE: text = text.replace(w, "")
+        text = re.sub(r'[^a-z0-9\s]', ' ', text)
+        return re.sub(r'\s+', ' ', text).strip()
+
+    def _tokens(self, text):
+        return frozenset(self.title(text).split())
+
+    # Kolon API'leri: her benzersiz değer bir kez normalize edilir
+    def strict_column(self, values, workers=1): return map_unique(values, self.strict, workers)
+    def match_code_column(self, values, workers=1): return map_unique(values, self.match_code, workers)
+    def title_column(self, values, workers=1): return map_unique(values, self.title, workers)
+    def token_column(self, values, workers=1): return map_unique(values, self.tokens, workers)
+
+    def stats(self):
+        out = {}
+        for name in ('units', 'strict', 'match_code', 'title', 'tokens'):
+            info = getattr(self, name).cache_info()
+            out[name] = {"hits": info.hits, "misses": info.misses, "size": info.currsize, "maxsize": info.maxsize}
+        return out
+
+    def clear(self):
+        for name in ('units', 'strict', 'match_code', 'title', 'tokens'): getattr(self, name).cache_clear()
+
+NORMALIZER = TextNormalizer()
+
+def normalize_units(text): return NORMALIZER.units(text)
+
+def strict_normalize(text): return NORMALIZER.strict(text)
 
 # --- MATCH CODE KÖPRÜSÜ ---
-def generate_match_code(code):
-    if not code or pd.isna(code): return "KOD_YOK"
-    s = str(code).upper().strip()
-    prefixes = ["CETA", "IZELTAS", "BOSCH", "MAKITA", "DEWALT", "KNIPEX", "CERPA", "ELTA", "RTR", "ATTLAS"]
-    for pre in prefixes:
-        if s.startswith(pre):
-            s = re.sub(f'^{pre}[-\s\.]*', '', s)
-            break
-    return re.sub(r'[^A-Z0-9]', '', s)
+def generate_match_code(code): return NORMALIZER.match_code(code)
+
+# --- MARKA İNDEKSİ ---
+class BrandIndex:
+    """Bilinen markalar için derlenmiş tek geçişlik arama ve simetrik çakışma tablosu.
+
+    Lookahead alternasyonu her konumda oradan başlayan en uzun markayı bulur; başlıktaki en uzun marka seçilir
+    (eşit uzunlukta alfabetik ilk). Çakışmalar sırasız çiftler kümesinde tutulur.
+    """
+    def __init__(self, brands, conflicts, version=None):
+        self.brands = frozenset(brands)
+        self.ordered = sorted(self.brands, key=lambda b: (-len(b), b))
+        self.rank = {b: i for i, b in enumerate(self.ordered)}
+        self.pattern = re.compile(r'(?=\b(' + '|'.join(re.escape(b) for b in self.ordered) + r')\b)') if self.ordered else None
+        self.conflicts = frozenset(frozenset((a, b)) for a, others in conflicts.items() for b in others if a != b)
+        self.version = version
+
+    @classmethod
+    def load(cls, path):
+        raw = Path(path).read_bytes()
+        data = json.loads(raw.decode('utf-8'))
+        return cls(data.get('brands', []), data.get('conflicts', {}), hashlib.sha1(raw).hexdigest())
+
+    def extract(self, title):
+        title_upper = str(title).upper().replace('İ', 'I')
+        found = set(self.pattern.findall(title_upper)) if self.pattern else ()
+        if found: return min(found, key=self.rank.__getitem__)
+        if "IZEL" in title_upper: return "IZELTAS"
+        return "TANIMSIZ"
+
+    def extract_column(self, titles, workers=1):
+        return map_unique(titles, self.extract, workers)
+
+    def is_conflict(self, b1, b2):
+        if b1 == "TANIMSIZ" or b2 == "TANIMSIZ": return False
+        if b1 == b2: return False
+        if b1 in b2 or b2 in b1: return False
+        if frozenset((b1, b2)) in self.conflicts: return True
+        return b1 in self.brands and b2 in self.brands
+
+BRAND_INDEX = BrandIndex.load(BRANDS_FILE)
 
 def load_template(name):
     p = CONFIG_DIR / f"{name}.json"
@@ -135,40 +1071,411 @@ def load_template(name):
     with open(p, 'r', encoding='utf-8') as f:
         return {k: clean_column_name(v) for k, v in json.load(f).items()}
 
-def read_and_normalize_file(path, filename):
-    print(f"DEBUG: Okunuyor -> {filename}", flush=True)
+def template_columns(tpl):
+    # Şablonun referans verdiği (temizlenmiş) kolon adları; büyük dosyalardan yalnızca bunlar okunur
+    return {v for v in tpl.values() if v}
+
+def _project(names, columns):
+    # Okunacak kolon konumları. Hiçbiri eşleşmezse satır sayısı korunsun diye ilk kolon okunup atılır.
+    if columns is None: return list(range(len(names))), False
+    pos = [i for i, n in enumerate(names) if clean_column_name(n) in columns]
+    return (pos, False) if pos or not names else ([0], True)
+
+def _finish_chunk(df, drop):
+    if drop: df = df.iloc[:, :0]
+    df.columns = [clean_column_name(c) for c in df.columns]
+    return df.where(pd.notnull(df), None)
+
+def _is_utf8(path):
+    import codecs
+    dec = codecs.getincrementaldecoder('utf-8')()
+    with open(path, 'rb') as f:
+        try:
+            for block in iter(lambda: f.read(1 << 20), b''): dec.decode(block)
+            dec.decode(b'', final=True)
+        except UnicodeDecodeError: return False
+    return True
+
+def _iter_csv(path, columns, chunk_rows):
+    enc = 'utf-8-sig' if _is_utf8(path) else 'latin-1'
+    names = pd.read_csv(path, dtype=str, encoding=enc, nrows=0).columns
+    pos, drop = _project(list(names), columns)
+    empty = True
+    for chunk in pd.read_csv(path, dtype=str, encoding=enc, usecols=pos, chunksize=chunk_rows):
+        empty = False
+        yield _finish_chunk(chunk, drop)
+    if empty: yield _finish_chunk(pd.DataFrame(columns=names[pos]), drop)
+
+def _excel_cell(cell):
+    # pandas'ın openpyxl okuyucusuyla aynı hücre dönüşümü
+    from openpyxl.cell.cell import TYPE_ERROR, TYPE_NUMERIC
+    if cell.value is None: return ""
+    if cell.data_type == TYPE_ERROR: return np.nan
+    if cell.data_type == TYPE_NUMERIC:
+        val = int(cell.value)
+        return val if val == cell.value else float(cell.value)
+    return cell.value
+
+def _iter_xlsx(path, columns, chunk_rows):
+    # Salt okunur openpyxl ile satır satır okunur; parçalar pandas'ın TextParser'ından geçirilir,
+    # böylece NA ve dtype=str dönüşümleri pd.read_excel ile birebir aynı kalır.
+    # pd.read_excel gibi aradaki boş satırlar korunur, yalnızca sondaki boş satırlar atılır.
+    from openpyxl import load_workbook
+    from pandas.io.parsers import TextParser
+    wb = load_workbook(path, read_only=True, data_only=True, keep_links=False)
     try:
-        if filename.lower().endswith('.csv'):
-            try: df = pd.read_csv(path, dtype=str, encoding='utf-8-sig')
-            except UnicodeDecodeError: df = pd.read_csv(path, dtype=str, encoding='latin-1')
-        elif filename.lower().endswith('.xls'):
-            try: df = pd.read_excel(path, dtype=str, engine='xlrd')
-            except: df = pd.read_excel(path, dtype=str, engine='openpyxl')
-        else:
-            df = pd.read_excel(path, dtype=str)
+        ws = wb.worksheets[0]
+        ws.reset_dimensions()
+        rows = ([_excel_cell(c) for c in row] for row in ws.rows)
+        header = next(rows, None)
+        if header is None: raise ValueError("Dosya boş")
+        while header and header[-1] == "": header.pop()
+        names = list(TextParser([header], header=0, dtype=str).read().columns) if header else []
+        pos, drop = _project(names, columns)
+        sel = [names[i] for i in pos]
+        def parse(buf): return _finish_chunk(TextParser(buf, names=sel, header=None, dtype=str, skip_blank_lines=False).read(), drop)
+        buf = []; blank = 0; yielded = False
+        for r in rows:
+            if all(v == "" for v in r):
+                blank += 1; continue
+            buf.extend([[""] * len(pos)] * blank); blank = 0
+            buf.append([r[i] if i < len(r) else "" for i in pos])
+            if len(buf) >= chunk_rows:
+                yield parse(buf); buf = []; yielded = True
+        if buf: yield parse(buf)
+        elif not yielded: yield _finish_chunk(pd.DataFrame(columns=sel), drop)
+    finally:
+        wb.close()
+
+def _iter_whole(path, filename, columns, chunk_rows):
+    if filename.lower().endswith('.xls'):
+        try: df = pd.read_excel(path, dtype=str, engine='xlrd')
+        except: df = pd.read_excel(path, dtype=str, engine='openpyxl')
+    else:
+        df = pd.read_excel(path, dtype=str)
+    pos, drop = _project(list(df.columns), columns)
+    if columns is None:
+        yield _finish_chunk(df, False); return
+    df = df.iloc[:, pos]
+    for start in range(0, max(len(df), 1), chunk_rows):
+        yield _finish_chunk(df.iloc[start:start + chunk_rows], drop)
+
+def iter_normalized_chunks(path, filename, columns=None, chunk_rows=None):
+    # Dosyayı FILE_CHUNK_ROWS satırlık, kolon adları temizlenmiş parçalar halinde verir.
+    # columns verilirse yalnızca o kolonlar okunur (CSV ve XLSX akış halinde okunur).
+    # Aynı içerik ve kolonlarla daha önce okunmuş dosyalar ayrıştırma önbelleğinden, yine parça parça gelir.
+    chunk_rows = chunk_rows or FILE_CHUNK_ROWS
+    cache_key = parse_cache_key(path, filename, columns) if PARSE_CACHE_ENABLED else None
+    cached = load_parse_cache(cache_key) if cache_key else None
+    if cache_key: count_metric('parse_cache', 'miss' if cached is None else 'hit')
+    if cached is not None:
+        logger.debug("Ayrıştırma önbelleğinden: %s", filename)
+        offset = 0
+        for part in cached:
+            part.index = pd.RangeIndex(offset, offset + len(part))
+            offset += len(part)
+            for start in range(0, max(len(part), 1), chunk_rows): yield part.iloc[start:start + chunk_rows]
+        return
+    logger.debug("Okunuyor: %s", filename)
+    lower = filename.lower()
+    writer = ParseCacheWriter(cache_key) if cache_key else None
+    try:
+        if lower.endswith('.csv'): source = _iter_csv(path, columns, chunk_rows)
+        elif columns is not None and lower.endswith(('.xlsx', '.xlsm')): source = _iter_xlsx(path, columns, chunk_rows)
+        else: source = _iter_whole(path, filename, columns, chunk_rows)
+        for chunk in source:
+            if writer: writer.add(chunk)
+            yield chunk
+        if writer: writer.commit()
     except Exception as e:
         raise Exception(f"'{filename}' okunamadı: {str(e)}")
-    df.columns = [clean_column_name(c) for c in df.columns]
-    return df.where(pd.notnull(df), None)
+    finally:
+        # Okuma yarıda kaldıysa (hata ya da tüketici durdu) yarım kayıt silinir
+        if writer: writer.discard()
+
+def read_and_normalize_file(path, filename, columns=None):
+    chunks = list(iter_normalized_chunks(path, filename, columns))
+    return chunks[0] if len(chunks) == 1 else pd.concat(chunks, ignore_index=True)
+
+# --- AYRIŞTIRMA ÖNBELLEĞİ ---
+# Anahtar: dosya baytlarının sha256'sı + dosya türü + okunan kolonlar + PARSE_CACHE_VERSION.
+# Değer: PARSE_CACHE_DIR/parse_<anahtar>/ altında okuma sırasındaki her parça için bir kolonsal depo (part_<sıra>/)
+# ve parçaları sıralayan schema.json. Parçalar okunurken tek tek yazılır, isabette tek tek okunur; bellek
+# kullanımı dosya boyundan değil parça boyundan (FILE_CHUNK_ROWS) bağımsızdır.
+# Son kullanım zamanı klasörün mtime'ıdır; isabetlerde güncellenir.
+def parse_cache_key(path, filename, columns=None):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''): h.update(block)
+    spec = json.dumps([PARSE_CACHE_VERSION, Path(filename).suffix.lower(), sorted(columns) if columns is not None else None])
+    return hashlib.sha256(f"{h.hexdigest()}|{spec}".encode('utf-8')).hexdigest()
+
+def load_parse_cache(key):
+    """Önbellekteki parçaları sırayla veren üreteç; kayıt yoksa ya da eksikse None."""
+    path = result_store_path('parse', key, PARSE_CACHE_DIR)
+    try:
+        with open(path / "schema.json", encoding='utf-8') as f: parts = json.load(f)["parts"]
+        if not all((result_store_path('part', p, path) / "schema.json").exists() for p in parts): return None
+        os.utime(path)
+    except FileNotFoundError: return None
+    except (OSError, ValueError, KeyError, TypeError):
+        traceback.print_exc()
+        return None
+    def read():
+        for p in parts:
+            df = load_result_frame('part', p, root=path)
+            dtypes = load_result_meta('part', p, root=path).get("dtypes", {})
+            yield df.astype({c: d for c, d in dtypes.items() if c in df.columns})
+    return read()
+
+class ParseCacheWriter:
+    """Okunan parçaları geçici klasöre tek tek yazar; commit ile kayıt tek rename ile yayınlanır.
+    En iyi çaba ile çalışır: yazım hatasında ya da tekrarlı kolon adlarında (kolonsal depoda tutulamaz) önbelleğe alma bırakılır."""
+    def __init__(self, key):
+        self.path = result_store_path('parse', key, PARSE_CACHE_DIR)
+        self.parts = []
+        self.tmp = None
+
+    def add(self, chunk):
+        if self.parts is None: return
+        try:
+            if not chunk.columns.is_unique: return self.discard()
+            if self.tmp is None: self.tmp = Path(tempfile.mkdtemp(dir=PARSE_CACHE_DIR, prefix=f"{self.path.name}.tmp"))
+            name = f"{len(self.parts):06d}"
+            save_result_frame('part', name, chunk, meta={"dtypes": {str(c): str(t) for c, t in chunk.dtypes.items()}}, root=self.tmp)
+            self.parts.append(name)
+        except Exception:
+            traceback.print_exc()
+            self.discard()
+
+    def commit(self):
+        if not self.parts: return self.discard()
+        try:
+            with open(self.tmp / "schema.json", 'w', encoding='utf-8') as f: json.dump({"parts": self.parts}, f)
+            # Aynı dosyayı eşzamanlı okuyan başka bir süreç kaydı önce yayınladıysa bizimki atılır
+            try: os.replace(self.tmp, self.path)
+            except OSError: return self.discard()
+            self.tmp = self.parts = None
+            prune_parse_cache()
+        except Exception:
+            traceback.print_exc()
+            self.discard()
+
+    def discard(self):
+        import shutil
+        if self.tmp is not None: shutil.rmtree(self.tmp, ignore_errors=True)
+        self.tmp = self.parts = None
+
+def prune_parse_cache():
+    import shutil
+    entries = []
+    now = time.time()
+    for d in PARSE_CACHE_DIR.glob('parse_*'):
+        try:
+            if not d.is_dir(): continue
+            # Yarım kalmış yazımlardan artan geçici klasörler bir saat sonra silinir
+            if '.tmp' in d.name:
+                if now - d.stat().st_mtime > 3600: shutil.rmtree(d, ignore_errors=True)
+                continue
+            entries.append((d.stat().st_mtime, sum(f.stat().st_size for f in d.rglob('*') if f.is_file()), d))
+        except FileNotFoundError: continue
+    cutoff = now - PARSE_CACHE_MAX_AGE_H * 3600
+    total = sum(size for _, size, _ in entries)
+    budget = PARSE_CACHE_MAX_MB * 1024 * 1024
+    for mtime, size, d in sorted(entries, key=lambda e: e[0]):
+        if mtime >= cutoff and total <= budget: break
+        shutil.rmtree(d, ignore_errors=True)
+        total -= size
+
+# --- KOLONSAL ARA SONUÇ DEPOSU ---
+# internal_/supplier_ sonuçları temp_results/<prefix>_<key>/ klasörüne kolon başına .npy olarak yazılır:
+#   num     -> doğal numpy dtype
+#   decimal -> ölçeklenmiş int64 + ölçek (Decimal değerler birebir geri döner)
+#   str     -> sözlük kodlaması: int32 kodlar + utf-8 sözlük (bayt dizisi + ofsetler)
+# Kolonlar ihtiyaç halinde, bellek eşlemeli (mmap) okunur. Eski .json anahtarları okunmaya devam eder.
+def result_store_path(prefix, key, root=None):
+    return (root or TEMP_RESULTS_DIR) / f"{prefix}_{key}"
+
+def _decimal_column(values):
+    # Tüm değerler Decimal/int/None ise ortak ölçekli int64'e çevrilir; sığmıyorsa None
+    scale = 0
+    for v in values:
+        if v is None or isinstance(v, (int, np.integer)) and not isinstance(v, bool): continue
+        if not isinstance(v, decimal.Decimal) or not v.is_finite(): return None
+        scale = max(scale, -v.as_tuple().exponent)
+    if scale > 18: return None
+    q = decimal.Decimal(1).scaleb(-scale)
+    unscaled = np.zeros(len(values), dtype=np.int64)
+    nulls = np.zeros(len(values), dtype=bool)
+    for i, v in enumerate(values):
+        if v is None: nulls[i] = True; continue
+        n = int(decimal.Decimal(v).quantize(q).scaleb(scale))
+        if abs(n) >= 2 ** 63: return None
+        unscaled[i] = n
+    return unscaled, scale, nulls
+
+def _write_strings(folder, name, values):
+    codes, uniques = pd.factorize(pd.Series(values, dtype=object), use_na_sentinel=True)
+    encoded = [str(u).encode('utf-8') for u in uniques]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(b) for b in encoded])
+    np.save(folder / f"{name}.codes.npy", codes.astype(np.int32))
+    np.save(folder / f"{name}.dict.npy", np.frombuffer(b''.join(encoded), dtype=np.uint8))
+    np.save(folder / f"{name}.offsets.npy", offsets)
+
+def _read_strings(folder, name):
+    codes = np.load(folder / f"{name}.codes.npy", mmap_mode='r')
+    blob = np.load(folder / f"{name}.dict.npy", mmap_mode='r')
+    offsets = np.load(folder / f"{name}.offsets.npy")
+    uniques = np.empty(len(offsets), dtype=object)
+    for i in range(len(offsets) - 1): uniques[i] = blob[offsets[i]:offsets[i + 1]].tobytes().decode('utf-8')
+    uniques[-1] = None
+    return uniques[codes]
+
+def save_result_frame(prefix, key, df, meta=None, scales=None, root=None):
+    # scales: ölçeklenmiş int64 tutan kolonlar ({kolon: ölçek}); doğrudan decimal olarak yazılır
+    import shutil
+    path = result_store_path(prefix, key, root)
+    tmp = Path(tempfile.mkdtemp(dir=path.parent, prefix=f"{path.name}.tmp"))
+    schema = {"rows": len(df), "columns": [], "meta": meta}
+    for i, col in enumerate(df.columns):
+        name = f"c{i}"
+        s = df[col]
+        entry = {"name": str(col), "file": name}
+        if scales and col in scales and pd.api.types.is_integer_dtype(s):
+            entry.update(kind="decimal", scale=scales[col], nulls=False)
+            np.save(tmp / f"{name}.npy", s.to_numpy(dtype=np.int64))
+        elif pd.api.types.is_bool_dtype(s) or pd.api.types.is_numeric_dtype(s):
+            entry["kind"] = "num"
+            np.save(tmp / f"{name}.npy", s.to_numpy())
+        else:
+            values = s.astype(object).where(s.notna(), None).tolist()
+            dec = _decimal_column(values) if any(isinstance(v, decimal.Decimal) for v in values) else None
+            if dec is not None:
+                unscaled, scale, nulls = dec
+                entry.update(kind="decimal", scale=scale, nulls=bool(nulls.any()))
+                np.save(tmp / f"{name}.npy", unscaled)
+                if nulls.any(): np.save(tmp / f"{name}.nulls.npy", nulls)
+            else:
+                entry["kind"] = "str"
+                _write_strings(tmp, name, values)
+        schema["columns"].append(entry)
+    with open(tmp / "schema.json", 'w', encoding='utf-8') as f:
+        json.dump(schema, f, ensure_ascii=False)
+    # Eski sürüm önce kenara taşınır, yenisi tek rename ile yerine geçer, eskisi sonra silinir; yerleştirme olmazsa eskisi geri konur
+    old = path.with_name(f"{path.name}.old{uuid.uuid4().hex}")
+    try: os.rename(path, old)
+    except FileNotFoundError: old = None
+    try: os.replace(tmp, path)
+    except OSError:
+        if old is not None: os.rename(old, path)
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+    if old is not None: shutil.rmtree(old, ignore_errors=True)
+
+def _read_column(folder, entry):
+    name = entry["file"]
+    if entry["kind"] == "num": return np.load(folder / f"{name}.npy", mmap_mode='r')
+    if entry["kind"] == "str": return _read_strings(folder, name)
+    unscaled = np.load(folder / f"{name}.npy", mmap_mode='r')
+    scale = entry["scale"]
+    out = np.empty(len(unscaled), dtype=object)
+    for i, n in enumerate(unscaled.tolist()): out[i] = decimal.Decimal(n).scaleb(-scale)
+    if entry.get("nulls"): out[np.load(folder / f"{name}.nulls.npy")] = None
+    return out
+
+def _read_scaled(folder, entry, scale):
+    if entry["kind"] == "decimal" and not entry.get("nulls"):
+        return Money(np.load(folder / f"{entry['file']}.npy"), entry["scale"]).to_int64(scale)
+    return scaled_column(_read_column(folder, entry), scale)
+
+def load_result_frame(prefix, key, columns=None, scaled=None, root=None):
+    # columns verilirse yalnızca o kolonlar okunur; depo yoksa eski <prefix>_<key>.json okunur.
+    # scaled ({kolon: ölçek}) verilen kolonlar Decimal yerine ölçeklenmiş int64 olarak döner.
+    scaled = scaled or {}
+    path = result_store_path(prefix, key, root)
+    if not (path / "schema.json").exists():
+        df = pd.read_json(TEMP_RESULTS_DIR / f"{prefix}_{key}.json")
+        if columns is not None: df = df[[c for c in columns if c in df.columns]]
+        for c, sc in scaled.items():
+            if c in df.columns: df[c] = scaled_column(df[c], sc)
+        return df
+    with open(path / "schema.json", encoding='utf-8') as f: schema = json.load(f)
+    entries = [e for e in schema["columns"] if columns is None or e["name"] in columns]
+    data = {e["name"]: _read_scaled(path, e, scaled[e["name"]]) if e["name"] in scaled else _read_column(path, e) for e in entries}
+    return pd.DataFrame(data, index=pd.RangeIndex(schema["rows"]))
+
+def load_result_meta(prefix, key, root=None):
+    path = result_store_path(prefix, key, root)
+    if (path / "schema.json").exists():
+        with open(path / "schema.json", encoding='utf-8') as f: return json.load(f).get("meta") or {}
+    with open(TEMP_RESULTS_DIR / f"meta_{prefix}_{key}.json") as f: return json.load(f)
 
 # --- DÖVİZ VE API ---
 BASE_CURRENCY = "TRY"
 EXCHANGE_RATES = {BASE_CURRENCY: decimal.Decimal(1.0)}
 RATE_LAST_UPDATE = "Henüz Güncellenmedi"
 
+_RATES_STATE = {"mtime": None, "pid": None}
+_RATES_LOCK = threading.Lock()
+
+def load_cached_rates():
+    """Disk önbelleği son okumadan beri değiştiyse kurları yeniden yükler (değişmediyse yalnızca bir stat çağrısı)."""
+    global EXCHANGE_RATES, RATE_LAST_UPDATE
+    try: mtime = RATES_FILE.stat().st_mtime_ns
+    except OSError: return False
+    if mtime == _RATES_STATE["mtime"]: return False
+    try:
+        with open(RATES_FILE, 'r') as f: data = json.load(f)
+        nr = {BASE_CURRENCY: decimal.Decimal(1.0)}
+        nr.update({c: decimal.Decimal(v) for c, v in data["rates"].items()})
+    except (OSError, ValueError, KeyError, TypeError, decimal.InvalidOperation): return False
+    EXCHANGE_RATES = nr
+    RATE_LAST_UPDATE = data.get("last_update", RATE_LAST_UPDATE)
+    _RATES_STATE["mtime"] = mtime
+    return True
+
+def store_cached_rates(rates, last_update):
+    tmp = RATES_FILE.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+    with open(tmp, 'w') as f:
+        json.dump({"rates": {c: str(v) for c, v in rates.items() if c != BASE_CURRENCY}, "last_update": last_update}, f)
+    os.replace(tmp, RATES_FILE)
+
+# TCMB'den çekilen para birimleri. Yazım farkları (boşluk, küçük harf) yok sayılır; eski TL kodları TRY sayılır.
+RATE_CURRENCIES = ("USD", "EUR")
+CURRENCY_ALIASES = {"TL": BASE_CURRENCY, "TRL": BASE_CURRENCY, "YTL": BASE_CURRENCY, "₺": BASE_CURRENCY}
+
+class MissingExchangeRate(Exception):
+    pass
+
+def normalize_currency(value):
+    c = str(value).strip().upper()
+    return CURRENCY_ALIASES.get(c, c)
+
+def known_currency(currency):
+    c = normalize_currency(currency)
+    return c == BASE_CURRENCY or c in RATE_CURRENCIES or c in EXCHANGE_RATES
+
+def exchange_rate(currency):
+    # Kuru bilinmeyen para biriminde tutar 0 ya da 1 kurla çevrilmez; işlem açık bir hatayla durur
+    c = normalize_currency(currency)
+    rate = EXCHANGE_RATES.get(c)
+    if not rate: raise MissingExchangeRate(f"{c} kuru yüklenemedi (son güncelleme: {RATE_LAST_UPDATE}); dövizli tutarlar TL'ye çevrilemiyor. Kurları güncelleyip tekrar deneyin.")
+    return rate
+
 def fetch_exchange_rates():
     global EXCHANGE_RATES, RATE_LAST_UPDATE
-    print("DEBUG: TCMB Kur servisine baglaniliyor...", flush=True)
+    logger.info("TCMB kur servisine bağlanılıyor")
     try:
         headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
         }
-        r = requests.get("https://www.tcmb.gov.tr/kurlar/today.xml", timeout=20, headers=headers, verify=False)
+        r = requests.get("https://www.tcmb.gov.tr/kurlar/today.xml", timeout=RATES_FETCH_TIMEOUT_S, headers=headers, verify=False)
         
         if r.status_code == 200:
             root = ET.fromstring(r.content)
             nr = {BASE_CURRENCY: decimal.Decimal(1.0)}
-            for c in ["USD", "EUR"]:
+            for c in RATE_CURRENCIES:
                 n = root.find(f"./Currency[@CurrencyCode='{c}']/ForexSelling")
                 if n is None or not n.text: n = root.find(f"./Currency[@CurrencyCode='{c}']/BanknoteSelling")
                 if n is not None and n.text:
@@ -176,17 +1483,43 @@ def fetch_exchange_rates():
             if "USD" in nr:
                 EXCHANGE_RATES = nr
                 RATE_LAST_UPDATE = datetime.now().strftime("%d-%m-%Y %H:%M")
-                print(f"DEBUG: Kurlar Guncellendi -> USD: {nr.get('USD')} - EUR: {nr.get('EUR')}", flush=True)
+                # Diğer süreçler yeni kurları önbellek dosyasından görür
+                store_cached_rates(nr, RATE_LAST_UPDATE)
+                logger.info("Kurlar güncellendi: USD=%s EUR=%s", nr.get('USD'), nr.get('EUR'))
                 return True, f"Kurlar güncellendi. ({RATE_LAST_UPDATE})"
         else:
-            print(f"DEBUG: TCMB Yanit Kodu Hatali: {r.status_code}", flush=True)
-    except Exception as e:
-        print(f"DEBUG: KUR CEKME HATASI: {str(e)}", flush=True)
-        traceback.print_exc()
+            logger.warning("TCMB yanıt kodu hatalı: %s", r.status_code)
+    except Exception:
+        logger.exception("Kurlar çekilemedi")
     return False, "Kur alınamadı."
 
-try: fetch_exchange_rates()
-except: pass
+def _rate_refresher_loop():
+    # Kilidi alan süreç yenileyici olur ve kilidi süreç ölene kadar tutar; diğerleri RATES_RETRY_S'de bir yeniden dener
+    with open(WORK_DIR / 'rates.lock', 'w') as lock:
+        while True:
+            try: fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                # Yenileyici olmayan süreçler önbellekteki yeni kurları bu döngüde okur
+                load_cached_rates()
+                time.sleep(RATES_RETRY_S)
+                continue
+            try: age = time.time() - RATES_FILE.stat().st_mtime
+            except OSError: age = None
+            if age is None or age >= RATES_REFRESH_S:
+                ok, _ = fetch_exchange_rates()
+                time.sleep(RATES_REFRESH_S if ok else min(RATES_RETRY_S, RATES_REFRESH_S))
+            else: time.sleep(RATES_REFRESH_S - age)
+
+def start_rate_refresher():
+    # Fork sonrası (gunicorn) thread'ler kopyalanmaz; süreç başına bir kez başlatılır
+    with _RATES_LOCK:
+        if _RATES_STATE["pid"] == os.getpid(): return
+        _RATES_STATE["pid"] = os.getpid()
+        threading.Thread(target=_rate_refresher_loop, daemon=True).start()
+
+# Açılışta yalnızca disk önbelleği okunur; önbellek yoksa ya da eskiyse ilk çekimi yenileyici thread hemen yapar.
+# O zamana kadar gereken kur yoksa dövizli işlemler MissingExchangeRate ile açık bir hatayla durur.
+load_cached_rates()
 
 # --- NLP Fiyatlandırma ve Kural Motoru ---
 def parse_natural_language_rules(text_input):
@@ -266,6 +1599,155 @@ def parse_natural_language_rules(text_input):
         })
     return rules
 
+# --- FİYAT HESAPLAMA ---
+class PriceRulePlan:
+    """parse_natural_language_rules çıktısının derlenmiş hali.
+
+    Tüm hedefler tek bir regex alternasyonunda toplanır ve her kolonun benzersiz değerlerinde bir kez aranır.
+    Lookahead her konumda oradan başlayan en uzun hedefi bulur; bulunan hedefin içinde geçen diğer hedefler
+    de orada geçtiğinden (implied) sonuç, her kural için ayrı ayrı yapılan alt dizgi kontrolüyle birebir aynıdır.
+    """
+    def __init__(self, rules):
+        self.rules = rules
+        self.targets = sorted({r['target'] for r in rules if r['target'] != "ALL_PRODUCTS"}, key=lambda t: (-len(t), t))
+        self.target_ids = {t: i for i, t in enumerate(self.targets)}
+        self.pattern = re.compile('(?=(' + '|'.join(re.escape(t) for t in self.targets) + '))') if self.targets else None
+        self.implied = [[j for j, u in enumerate(self.targets) if u in t] for t in self.targets]
+        self.has_fix_price = any(r['action'] == 'fix_price' for r in rules)
+
+    def __bool__(self): return bool(self.rules)
+
+    def _column_hits(self, values):
+        codes, uniques = pd.factorize(values)
+        hits = np.zeros((len(uniques), len(self.targets)), dtype=bool)
+        for i, u in enumerate(uniques.tolist()):
+            for t in set(self.pattern.findall(u)): hits[i, self.implied[self.target_ids[t]]] = True
+        return hits[codes]
+
+    def rule_masks(self, columns, n):
+        # n × kural sayısı boyutunda matris: satır, kuralın hedefini kolonlardan herhangi birinde içeriyor mu
+        masks = np.ones((n, len(self.rules)), dtype=bool)
+        if not self.targets: return masks
+        hits = np.zeros((n, len(self.targets)), dtype=bool)
+        for col in columns: hits |= self._column_hits(col)
+        for k, rule in enumerate(self.rules):
+            if rule['target'] != "ALL_PRODUCTS": masks[:, k] = hits[:, self.target_ids[rule['target']]]
+        return masks
+
+def _upper_column(df, col):
+    # Satır bazlı str(r.get(col, '')).upper() ile aynı metin
+    if col not in df: return pd.Series('', index=df.index)
+    return df[col].astype(object).map(str).str.upper()
+
+def price_rule_columns(df):
+    # Kural hedeflerinin arandığı kolonlar: marka, ürün adı, SKU
+    return [_upper_column(df, 'Nihai_Marka'), _upper_column(df, 'Urun_Adi'), df['MP_SKU'].astype(object).map(str)]
+
+def calculate_prices(df, price_strat, rule_plan, freeze_conf=None, smart_freeze=False, masks=None):
+    """Satış fiyatlarını kolon bazında hesaplar.
+
+    Girdi kolonları: MP_Fiyat (kuruş), Ic_Hazir_Fiyat / Ted_Hazir_Fiyat / maliyet (PRICE_SCALE),
+    Nihai_Marka, MP_SKU, MP_Barkod. rule_plan bir PriceRulePlan'dır; kurallar sırayla kolon bazında uygulanır.
+    masks verilirse (rule_plan.rule_masks çıktısı) kural hedefleri yeniden aranmaz.
+    Satis_Fiyati (kuruş int64) ve Fiyat_Durumu kolonlarını döner.
+    Kararlar eski satır bazlı hesaplamayla aynı sıradadır; yuvarlama yalnızca sonda kuruşa yapılır.
+    """
+    n = len(df)
+    def money(col, scale):
+        return Money(df[col].to_numpy(dtype=np.int64), scale) if col in df else Money.zeros(n, scale)
+    curr = money('MP_Fiyat', KURUS_SCALE)
+    price = curr
+    status = np.full(n, '', dtype=object)
+    open_ = np.ones(n, dtype=bool)
+
+    def settle(mask, value, text):
+        # mask'teki açık satırların sonucunu sabitler
+        nonlocal price, open_
+        mask = mask & open_
+        price = Money.select(mask, value, price)
+        status[mask] = text
+        open_ = open_ & ~mask
+
+    if freeze_conf:
+        frozen = df['MP_SKU'].astype(str).isin(freeze_conf.get('skus', [])) | df['MP_Barkod'].astype(str).isin(freeze_conf.get('barcodes', []))
+        settle(frozen.to_numpy(dtype=bool), curr, "Manuel Dondurma")
+
+    method = price_strat.get('method', 'calculated')
+    source = price_strat.get('source', 'cost')
+    note = np.full(n, '', dtype=object)
+    if method == 'stock_only': base = curr; note[:] = "Pazaryeri Fiyatı"
+    elif source == 'internal': base = money('Ic_Hazir_Fiyat', PRICE_SCALE); note[:] = "İç Liste"
+    elif source == 'supplier': base = money('Ted_Hazir_Fiyat', PRICE_SCALE); note[:] = "Ted. Liste"
+    elif source == 'cost': base = money('maliyet', PRICE_SCALE); note[:] = "Maliyet"
+    else: base = Money.zeros(n)
+
+    if method != 'stock_only' and source != 'cost':
+        missing = base <= 0
+        settle(missing & (curr > 0), curr, "Kaynak Fiyat Yok")
+        settle(missing, Money.zeros(n), "Fiyat Yok")
+
+    if method in ('stock_only', 'ready_list'):
+        candidate = base
+    else:
+        positive = base > 0
+        candidate = Money.zeros(n)
+        if (positive & open_).any():
+            mult = decimal.Decimal(str(price_strat.get('default_multiplier', 1.5)))
+            add = decimal.Decimal(str(price_strat.get('default_addition', 0)))
+            candidate = Money.select(positive, base * mult + add, candidate)
+        note[~positive] = "Maliyet Yok"
+
+    if rule_plan:
+        active = open_ & ((candidate > 0) | rule_plan.has_fix_price)
+        if masks is None: masks = rule_plan.rule_masks(price_rule_columns(df), n)
+        for k, rule in enumerate(rule_plan.rules):
+            hit = active & masks[:, k]
+            if not hit.any(): continue
+
+            if rule['action'] == 'fx_conversion':
+                if rule['old_rate'] and rule['old_rate'] > 0:
+                    rate_curr = rule['currency'] if rule['currency'] else 'USD'
+                    new_rate = exchange_rate(rate_curr)
+                    candidate = Money.select(hit, (candidate / rule['old_rate']) * new_rate, candidate)
+                    note[hit] += f" + Kur Farkı ({rate_curr})"
+
+            elif rule['action'] == 'fx_index':
+                rate_curr = rule['currency'] if rule['currency'] else 'USD'
+                candidate = Money.select(hit, base * exchange_rate(rate_curr), candidate)
+                note[hit] = f"Döviz Endeksli ({rate_curr})"
+
+            elif rule['action'] == 'multiplier':
+                if rule['value'] > 1 or rule['value'] < 1: changed = candidate * rule['value']
+                else: changed = candidate + rule['value']
+                candidate = Money.select(hit, changed, candidate)
+                note[hit] += f" + NLP ({rule['target']})"
+
+            elif rule['action'] == 'fix_price':
+                p_val = rule['value']
+                if rule['currency'] and rule['currency'] != 'TRY':
+                    p_val = p_val * exchange_rate(rule['currency'])
+                candidate = Money.select(hit, Money.constant(p_val, n), candidate)
+                note[hit] = f"Sabit Fiyat ({rule['target']})"
+
+    if price_strat.get('add_vat'):
+        try: vat = 1 + (decimal.Decimal(str(price_strat.get('vat_rate', 20))) / 100)
+        except: vat = None
+        if vat is not None: candidate = Money.select(candidate > 0, candidate * vat, candidate)
+
+    empty = candidate <= 0
+    settle(empty & (curr > 0), curr, "Fiyat Korundu")
+    keep_note = empty & open_
+    settle(keep_note, Money.zeros(n), '')
+    status[keep_note] = note[keep_note]
+
+    final_p = candidate.rescale(KURUS_SCALE)
+    if smart_freeze: settle((curr > 0) & (final_p < curr), curr, "Donduruldu (Düşüş Engellendi)")
+    settle(final_p == curr, curr, "Değişim Yok")
+    rest = open_.copy()
+    settle(rest, final_p, '')
+    status[rest] = note[rest]
+    return pd.DataFrame({'Satis_Fiyati': price.to_int64(KURUS_SCALE), 'Fiyat_Durumu': status}, index=df.index)
+
 @app.route('/')
 def index(): return send_from_directory(str(STATIC_DIR), 'index.html')
 
@@ -274,6 +1756,7 @@ def serve_documentation(): return send_from_directory(str(STATIC_DIR), 'teknik_d
 
 @app.route('/api/v1/exchange-rates', methods=['GET'])
 def get_rates():
+    load_cached_rates()
     return jsonify({"rates": {k: str(v) for k,v in EXCHANGE_RATES.items()}, "last_update": RATE_LAST_UPDATE})
 
 @app.route('/api/v1/exchange-rates/refresh', methods=['POST'])
@@ -281,6 +1764,14 @@ def refresh_rates():
     ok, msg = fetch_exchange_rates()
     return jsonify({"mesaj": msg}) if ok else (jsonify({"hata": msg}), 503)
 
+@app.route('/api/v1/normalizer/stats', methods=['GET'])
+def normalizer_stats():
+    return jsonify(NORMALIZER.stats())
+
+@app.route('/api/v1/metrics', methods=['GET'])
+def metrics():
+    return Response(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
 @app.route('/api/v1/templates', methods=['POST', 'GET'])
 def handle_templates():
     if request.method == 'POST':
@@ -336,227 +1827,672 @@ def template_ops(name):
         with open(p, 'r', encoding='utf-8') as f: return jsonify({"config": json.load(f)})
 
 # --- SİMÜLASYON ENDPOINT ---
+# Simülasyon girdisi calculate_prices'ın okuduğu kolonlardır. Eşleştirme işleri bu kolonları fiyatlama anındaki
+# halleriyle job_pricing_<iş> olarak saklar; simülasyon yüklenen dosya yerine bu kayıt üzerinde de çalışabilir.
+SIMULATION_SCALES = {'MP_Fiyat': KURUS_SCALE, 'Satis_Fiyati': KURUS_SCALE, 'Ic_Hazir_Fiyat': PRICE_SCALE, 'Ted_Hazir_Fiyat': PRICE_SCALE, 'maliyet': PRICE_SCALE}
+SIMULATION_COLUMNS = list(SIMULATION_SCALES) + ['Nihai_Marka', 'Urun_Adi', 'MP_Urun_Adi', 'MP_SKU', 'MP_Barkod']
+
+def simulation_frame(df, tpl):
+    # Yüklenen pazaryeri dosyasını calculate_prices girdisine çevirir (fiyat, eski simülasyondaki gibi parse_price_value kurallarıyla)
+    def col(key, default=''):
+        c = tpl.get(key)
+        return df[c].astype(object).where(df[c].notna(), '').map(str) if c and c in df.columns else pd.Series(default, index=df.index)
+    c_price = tpl.get('current_price')
+    out = pd.DataFrame({'MP_SKU': col('sku'), 'MP_Barkod': col('barcode'), 'Nihai_Marka': col('brand').str.upper(), 'Urun_Adi': col('product_name')})
+    out['MP_Urun_Adi'] = out['Urun_Adi']
+    out['MP_Fiyat'] = parse_price_column(df[c_price], KURUS_SCALE) if c_price and c_price in df.columns else 0
+    return out.reset_index(drop=True)
+
+def _money_text(value, scale=KURUS_SCALE):
+    return str(decimal.Decimal(int(value)).scaleb(-scale))
+
+def simulate_prices(df, price_strat, rule_plan, freeze_conf=None, smart_freeze=False, page=1, page_size=None, top=None):
+    """Kuralları tüm kataloğa tek geçişte uygular ve etkisini özetler.
+
+    Kural başına eşleşen/fiyatı değişen satır, toplam ve ortalama fiyat farkı, sıfır ve KDV eşiğini geçen ürünler,
+    en çok değişen ürünler ve kural eşleşen ya da fiyatı değişen satırların sayfalı önizlemesi döner.
+    """
+    page_size = min(max(int(page_size or SIMULATION_PAGE_SIZE), 1), SIMULATION_PAGE_SIZE_MAX)
+    top = SIMULATION_TOP_MOVERS if top is None else top
+    n = len(df)
+    with span('pricing', n):
+        masks = rule_plan.rule_masks(price_rule_columns(df), n) if rule_plan else np.zeros((n, 0), dtype=bool)
+        res = calculate_prices(df, price_strat, rule_plan, freeze_conf, smart_freeze, masks)
+    with span('aggregate', n):
+        old = df['MP_Fiyat'].to_numpy(dtype=np.int64) if 'MP_Fiyat' in df else np.zeros(n, dtype=np.int64)
+        new = res['Satis_Fiyati'].to_numpy(dtype=np.int64)
+        status = res['Fiyat_Durumu'].to_numpy(dtype=object)
+        delta = new - old
+        changed = delta != 0
+        up, down = changed & (delta > 0), changed & (delta < 0)
+
+        try: vat = 1 + float(price_strat.get('vat_rate', 20)) / 100
+        except (TypeError, ValueError): vat = 1.2
+        both = (old > 0) & (new > 0)
+        ratio = np.divide(new, old, out=np.ones(n), where=both)
+        # KDV eşiği: fiyat en az KDV oranı kadar artan/azalan ürünler (KDV'nin iki kez eklenmesi ya da düşülmesi gibi)
+        vat_cross = both & ((ratio >= vat) | (ratio <= 1 / vat))
+
+        rules = [{"kural": r['raw_text'], "hedef": r['target'], "islem": r['action'],
+                  "eslesen": int(m.sum()), "degisen": int((m & changed).sum())} for r, m in zip(rule_plan.rules, masks.T)]
+
+        def row(i):
+            sku, name = str(df['MP_SKU'].iat[i]), str(df['MP_Urun_Adi'].iat[i]) if 'MP_Urun_Adi' in df else ''
+            item = {"urun": (sku + " - " + name)[:50] + "...", "sku": sku, "eski": _money_text(old[i]), "yeni": _money_text(new[i]),
+                    "fark": _money_text(delta[i]), "kurallar": str(status[i]).strip(' +')}
+            if 'Satis_Fiyati' in df: item["onceki"] = _money_text(df['Satis_Fiyati'].iat[i])
+            return item
+
+        moved = np.flatnonzero(changed)
+        if top and len(moved) > top: moved = moved[np.argpartition(-np.abs(delta[moved]), top - 1)[:top]]
+        moved = moved[np.lexsort((moved, -np.abs(delta[moved])))]
+
+        listed = np.flatnonzero(masks.any(axis=1) | changed)
+        pages = max(1, -(-len(listed) // page_size))
+        page = min(max(int(page or 1), 1), pages)
+        shown = listed[(page - 1) * page_size:page * page_size]
+
+        total = int(delta.sum())
+        count = int(changed.sum())
+        avg = decimal.Decimal(total) / count if count else decimal.Decimal(0)
+        return {
+            "satir": n,
+            "etkilenen": count,
+            "artan": int(up.sum()),
+            "azalan": int(down.sum()),
+            "toplam_fark": _money_text(total),
+            "ortalama_fark": str(avg.scaleb(-KURUS_SCALE).quantize(TWOPLACES)),
+            "ortalama_degisim_yuzde": round(float(np.mean(ratio[changed & both]) - 1) * 100, 2) if (changed & both).any() else 0.0,
+            "sifira_dusen": int(((old > 0) & (new <= 0)).sum()),
+            "sifirdan_cikan": int(((old <= 0) & (new > 0)).sum()),
+            "kdv_esigini_gecen": int(vat_cross.sum()),
+            "kurallar": rules,
+            "en_cok_degisen": [row(i) for i in moved],
+            "preview": [row(i) for i in shown],
+            "sayfa": page, "sayfa_boyutu": page_size, "sayfa_sayisi": pages, "onizleme_satir": int(len(listed)),
+        }
+
 @app.route('/api/v1/simulate_nlp', methods=['POST'])
 def simulate_nlp():
+    # Kaynak: yüklenen dosya + şablon ya da job_id ile daha önce çalışmış bir eşleştirme işinin fiyatlama girdisi.
+    # rules verilmezse işin kendi kuralları, price_strategy verilmezse işin stratejisi (dosyada: mevcut fiyat üzerine kurallar) kullanılır.
+    spans = SpanRecorder()
     try:
-        if 'file' not in request.files: return jsonify({"error": "Dosya yok"}), 400
-        f = request.files['file']
-        rules_text = request.form.get('rules', '')
-        tpl_name = request.form.get('template_name', '')
-        
-        tf = tempfile.NamedTemporaryFile(delete=False, suffix=Path(f.filename).suffix)
-        f.save(tf.name)
-        df = read_and_normalize_file(tf.name, f.filename)
-        os.remove(tf.name)
-        
-        tpl = load_template(tpl_name)
-        rules = parse_natural_language_rules(rules_text)
-        
-        c_price = tpl.get('current_price')
-        c_name = tpl.get('product_name')
-        c_brand = tpl.get('brand')
-        c_sku = tpl.get('sku')
-        
-        preview_data = []
-        scan_limit = min(len(df), 200) 
-        scan_df = df.head(scan_limit)
-        
-        for idx, row in scan_df.iterrows():
-            curr_p = parse_price_value(row.get(c_price, 0)) if c_price in row else decimal.Decimal(0)
-            prod_name = str(row.get(c_name, '')).upper()
-            brand = str(row.get(c_brand, '')).upper()
-            sku = str(row.get(c_sku, '')).upper()
-            
-            matched_rules = []
-            final_p = curr_p
-            rule_descriptions = []
-            
-            for rule in rules:
-                is_match = False
-                if rule['target'] == "ALL_PRODUCTS": is_match = True
-                elif rule['target'] in brand: is_match = True
-                elif rule['target'] in prod_name: is_match = True
-                elif rule['target'] in sku: is_match = True 
-                
-                if is_match:
-                    matched_rules.append(rule['raw_text'])
-                    
-                    desc = ""
-                    if final_p > 0 or rule['action'] == 'fix_price':
-                        if rule['action'] == 'multiplier':
-                            if rule['value'] > 1 or rule['value'] < 1: 
-                                final_p = final_p * rule['value']
-                                pct = int((rule['value'] - 1) * 100)
-                                desc = f"Yüzde {'Zam' if pct > 0 else 'İndirim'} (%{abs(pct)})"
-                            else: 
-                                final_p = final_p + rule['value']
-                                desc = f"Tutar {'Ekleme' if rule['value'] > 0 else 'Düşme'} ({rule['value']})"
-                        elif rule['action'] == 'fix_price':
-                             p_val = rule['value']
-                             curr_symbol = rule['currency'] if rule['currency'] else 'TRY'
-                             if rule['currency'] and rule['currency'] != 'TRY':
-                                 rate = EXCHANGE_RATES.get(rule['currency'], 1)
-                                 p_val = p_val * rate
-                             final_p = p_val
-                             desc = f"Sabit Fiyat: {rule['value']} {curr_symbol}"
-                        elif rule['action'] == 'fx_index':
-                            rate = EXCHANGE_RATES.get(rule['currency'] or 'USD', 1)
-                            final_p = final_p * rate 
-                            desc = f"Döviz Endeksleme ({rule['currency'] or 'USD'})"
-                        elif rule['action'] == 'fx_conversion':
-                            if rule['old_rate'] and rule['old_rate'] > 0:
-                                rate_curr = rule['currency'] if rule['currency'] else 'USD'
-                                new_rate = EXCHANGE_RATES.get(rate_curr, 1)
-                                final_p = (final_p / rule['old_rate']) * new_rate
-                                desc = f"Kur Farkı Uygulaması (Eski: {rule['old_rate']} -> Yeni: {new_rate})"
-                    
-                    if desc: rule_descriptions.append(desc)
-            
-            if matched_rules:
-                preview_data.append({
-                    "urun": (sku + " - " + prod_name)[:50] + "...",
-                    "eski": str(curr_p),
-                    "yeni": str(final_p.quantize(TWOPLACES)),
-                    "kurallar": ", ".join(rule_descriptions) 
-                })
-                
-        return jsonify({
-            "preview": preview_data[:10] 
-        })
-        
+        form = request.form
+        job_id = form.get('job_id') or request.args.get('job_id')
+        freeze_conf, smart_freeze = None, False
+        with spans.active():
+            if job_id:
+                sp = spans.phase('result_load')
+                if not (result_store_path('job_pricing', job_id) / "schema.json").exists(): return jsonify({"error": "İşin fiyatlama kaydı yok"}), 404
+                df = load_result_frame('job_pricing', job_id, scaled=SIMULATION_SCALES)
+                meta = load_result_meta('job_pricing', job_id)
+                price_strat = dict(meta.get('price_strategy') or {})
+                freeze_conf, smart_freeze = meta.get('freeze'), bool(meta.get('smart_freeze'))
+            else:
+                if 'file' not in request.files: return jsonify({"error": "Dosya yok"}), 400
+                f = request.files['file']
+                tpl = load_template(form.get('template_name', ''))
+                tf = tempfile.NamedTemporaryFile(delete=False, suffix=Path(f.filename).suffix)
+                f.save(tf.name)
+                sp = spans.phase('file_read')
+                try: df = simulation_frame(read_and_normalize_file(tf.name, f.filename, template_columns(tpl)), tpl)
+                finally: os.remove(tf.name)
+                price_strat = {'method': 'stock_only'}
+            sp['rows'] = len(df)
+            if form.get('price_strategy'): price_strat = json.loads(form['price_strategy'])
+            if 'rules' in form: price_strat['natural_language_text'] = form['rules']
+            load_cached_rates()
+            rule_plan = PriceRulePlan(parse_natural_language_rules(price_strat.get('natural_language_text', '')))
+            spans.close()
+            page = form.get('page', request.args.get('page', 1))
+            page_size = form.get('page_size', request.args.get('page_size'))
+            result = simulate_prices(df, price_strat, rule_plan, freeze_conf, smart_freeze, page, page_size)
+        summary = spans.summary()
+        result["sure_ms"] = round(summary[-1]["wall_s"] * 1000, 1)
+        record_stage_metrics('simulate', summary, 'completed')
+        return jsonify(result)
+
     except Exception as e:
         traceback.print_exc()
+        record_stage_metrics('simulate', spans.summary(), 'error')
         return jsonify({"error": str(e)}), 500
 
 # --- STOK HESAPLAMA ---
-def calculate_internal_stock(files, thr, amt):
-    all_df = pd.DataFrame()
-    meta_info = {}
-    for f in files:
-        df=f['dataframe']; tpl=f['template']; lbl=f['label']; fname=f['filename']
-        meta_info[fname] = len(df)
-        t_sku = tpl.get('sku'); t_stock = tpl.get('stock')
-        sub = pd.DataFrame()
-        sub['Anahtar_Kod'] = df[t_sku].fillna('KOD_YOK').astype(str) if t_sku and t_sku in df else 'KOD_YOK'
-        sub['match_code'] = sub['Anahtar_Kod'].apply(generate_match_code)
-        sub['Miktar'] = df[t_stock].apply(parse_stock_value) if t_stock and t_stock in df else 0
-        sub['Barkod'] = df[tpl['barcode']].fillna('_barkod_yok_').astype(str) if tpl.get('barcode') in df else '_barkod_yok_'
-        sub['Marka'] = df[tpl['brand']].fillna('TANIMSIZ').astype(str).str.upper() if tpl.get('brand') in df else 'TANIMSIZ'
-        t_price = tpl.get('selling_price')
-        sub['Ic_Hazir_Fiyat'] = df[t_price].apply(parse_price_value) if t_price and t_price in df else 0
-        t_name = tpl.get('product_name')
-        if t_name and t_name in df: sub['Ic_Urun_Adi'] = df[t_name].fillna('').astype(str)
-        else: sub['Ic_Urun_Adi'] = ''
-        if lbl == '-': sub['Miktar'] = sub['Miktar'].abs() * -1
-        all_df = pd.concat([all_df, sub], ignore_index=True)
-
-    if all_df.empty: return pd.DataFrame(), meta_info
+def file_chunks(f):
+    # Dosya diskteki yol (parçalar okunurken üretilir), hazır parça akışı ya da tek bir DataFrame olarak gelir
+    if 'path' in f: return iter_normalized_chunks(f['path'], f['filename'], f.get('columns'))
+    return f['chunks'] if 'chunks' in f else [f['dataframe']]
+
+def ingest_files(files, reduce_chunk, merge, workers=None):
+    """Her dosya ayrı süreçte parça parça okunur ve reduce_chunk(df, f) sonuçları merge ile dosya başına tek kısmi sonuca indirgenir.
+    Dosya sırasıyla (kısmi_sonuç, satır_sayısı, süre_sn) listesi döner; birleştirme çağırana kalır."""
+    def load(f):
+        t0 = time.time()
+        part, rows = None, 0
+        chunks = iter(file_chunks(f))
+        while True:
+            with span('file_read') as sp:
+                df = next(chunks, None)
+                sp['rows'] = len(df) if df is not None else 0
+            if df is None: break
+            rows += len(df)
+            with span('template_projection', len(df)): part = merge(part, reduce_chunk(df, f))
+        return part, rows, round(time.time() - t0, 3)
+    # Parça akışı taşıyan dosyalar başka sürece aktarılamaz
+    if any('chunks' in f for f in files): workers = 1
+    return parallel_map(load, files, min(resolve_workers(workers or INGEST_WORKERS), max(len(files), 1)))
+
+def ingest_meta(files, loaded):
+    return {f['filename']: {"rows": rows, "seconds": sec} for f, (_, rows, sec) in zip(files, loaded)}
+
+def merge_partials(parts, keys, agg):
+    # Parça bazlı grup sonuçlarını birleştirir; sum/min/max/first kendi çıktıları üzerinde yeniden uygulanabilir
+    parts = [p for p in parts if p is not None]
+    if not parts: return None
+    if len(parts) == 1: return parts[0]
+    return pd.concat(parts, ignore_index=True).groupby(keys, as_index=False).agg(**{c: (c, fn) for c, (_, fn) in agg.items()})
+
+def internal_stock_frame(df, tpl, lbl):
+    t_sku = tpl.get('sku'); t_stock = tpl.get('stock')
+    sub = pd.DataFrame()
+    sub['Anahtar_Kod'] = df[t_sku].fillna('KOD_YOK').astype(str) if t_sku and t_sku in df else 'KOD_YOK'
+    sub['match_code'] = NORMALIZER.match_code_column(sub['Anahtar_Kod'])
+    sub['Miktar'] = parse_stock_column(df[t_stock]) if t_stock and t_stock in df else 0
+    sub['Barkod'] = df[tpl['barcode']].fillna('_barkod_yok_').astype(str) if tpl.get('barcode') in df else '_barkod_yok_'
+    sub['Marka'] = df[tpl['brand']].fillna('TANIMSIZ').astype(str).str.upper() if tpl.get('brand') in df else 'TANIMSIZ'
+    t_price = tpl.get('selling_price')
+    sub['Ic_Hazir_Fiyat'] = parse_price_column(df[t_price]) if t_price and t_price in df else 0
+    t_name = tpl.get('product_name')
+    if t_name and t_name in df: sub['Ic_Urun_Adi'] = df[t_name].fillna('').astype(str)
+    else: sub['Ic_Urun_Adi'] = ''
+    if lbl == '-': sub['Miktar'] = sub['Miktar'].abs() * -1
+    return sub
+
+INTERNAL_KEYS = ['Anahtar_Kod', 'Barkod', 'match_code']
+INTERNAL_AGG = dict(
+    Hesaplanan_Stok=('Miktar','sum'), 
+    Marka=('Marka','first'), 
+    Ic_Urun_Adi=('Ic_Urun_Adi', 'first'),
+    Ic_Hazir_Fiyat=('Ic_Hazir_Fiyat', 'max')
+)
+
+def calculate_internal_stock(files, thr, amt, workers=None):
+    # Dosyalar paralel ve parça parça okunur; her parça gruplanıp dosyanın birikimli sonucuna eklenir, bellek dosya boyutuyla büyümez.
+    # Dosya sonuçları sonda tek seferde birleştirilir. meta: dosya başına satır sayısı ve okuma süresi.
+    loaded = ingest_files(
+        files,
+        lambda df, f: internal_stock_frame(df, f['template'], f['label']).groupby(INTERNAL_KEYS, as_index=False).agg(**INTERNAL_AGG),
+        lambda acc, part: merge_partials([acc, part], INTERNAL_KEYS, INTERNAL_AGG),
+        workers)
+    meta_info = ingest_meta(files, loaded)
+    net = merge_partials([part for part, _, _ in loaded], INTERNAL_KEYS, INTERNAL_AGG)
+
+    if net is None or net.empty: return pd.DataFrame(), meta_info
     
-    net = all_df.groupby(['Anahtar_Kod', 'Barkod', 'match_code'], as_index=False).agg(
-        Hesaplanan_Stok=('Miktar','sum'), 
-        Marka=('Marka','first'), 
-        Ic_Urun_Adi=('Ic_Urun_Adi', 'first'),
-        Ic_Hazir_Fiyat=('Ic_Hazir_Fiyat', 'max')
-    )
     sec = amt if amt else decimal.Decimal(0)
     def apply_sec(r):
         v = decimal.Decimal(str(r['Hesaplanan_Stok']))
         return v - sec if thr is None or v > thr else v
     
-    net['Nihai_Stok'] = net.apply(apply_sec, axis=1) if thr is not None else net['Hesaplanan_Stok']
+    with span('stock', len(net)):
+        net['Nihai_Stok'] = net.apply(apply_sec, axis=1) if thr is not None else net['Hesaplanan_Stok']
     net['Hesaplanan_Stok'] = net['Hesaplanan_Stok'].astype(int)
     net['Nihai_Stok'] = net['Nihai_Stok'].astype(int)
     net['Barkod'] = net['Barkod'].replace('_barkod_yok_', 'YOK')
     return net, meta_info
 
 # --- TEDARİKÇİ KONSOLİDE ---
-def consolidate_suppliers(files):
-    all_df = pd.DataFrame()
-    meta_info = {}
+def supplier_frame(df, tpl, unknown=None):
+    # unknown verilirse tanınmayan para birimleri satır sayılarıyla bu sözlüğe eklenir ({'XYZ': 3})
+    t_sku = tpl.get('sku'); t_stock = tpl.get('stock')
+    sub = pd.DataFrame()
+    sub['Anahtar_Kod'] = df[t_sku].fillna('KOD_YOK').astype(str) if t_sku and t_sku in df else 'KOD_YOK'
+    sub['match_code'] = NORMALIZER.match_code_column(sub['Anahtar_Kod'])
+    sub['Miktar'] = parse_stock_column(df[t_stock]) if t_stock and t_stock in df else 0
+    sub['Barkod'] = df[tpl['barcode']].fillna('_barkod_yok_').astype(str) if tpl.get('barcode') in df else '_barkod_yok_'
+    sub['Maliyet'] = parse_price_column(df[tpl['cost']]) if tpl.get('cost') in df else 0
+    t_price = tpl.get('selling_price')
+    sub['Ted_Hazir_Fiyat'] = parse_price_column(df[t_price]) if t_price and t_price in df else 0
+    sub['Marka'] = df[tpl['brand']].fillna('TANIMSIZ').astype(str).str.upper() if tpl.get('brand') in df else 'TANIMSIZ'
+    t_name = tpl.get('product_name')
+    if t_name and t_name in df: sub['Ted_Urun_Adi'] = df[t_name].fillna('').astype(str)
+    else: sub['Ted_Urun_Adi'] = ''
+    p_col = tpl.get('currency_column')
+    cur_col = df[p_col] if p_col and p_col in df else pd.Series(tpl.get('currency', 'TRY'), index=df.index)
+    sub['Para_Birimi'] = map_unique(cur_col.astype(str), normalize_currency)
+    # Kur dönüşümü para birimi başına tek çarpım. Para birimi boş ya da tanınmayan satırlarda maliyet 0 (tanınmayanlar
+    # unknown'a sayılır); bilinen bir dövizin kuru yoksa (ör. ilk kur çekimi olmadıysa) konsolidasyon MissingExchangeRate ile durur
+    cost = np.broadcast_to(np.asarray(sub['Maliyet'], dtype=np.int64), (len(sub),))
+    cur = sub['Para_Birimi'].to_numpy(dtype=object)
+    cost_try = np.zeros(len(sub), dtype=np.int64)
+    for c in pd.unique(cur):
+        mask = cur == c
+        if c == BASE_CURRENCY: cost_try[mask] = cost[mask]
+        elif c in ('', 'NAN', 'NONE'): continue
+        elif not known_currency(c):
+            if unknown is not None: unknown[c] = unknown.get(c, 0) + int(mask.sum())
+        elif cost[mask].any():
+            cost_try[mask] = (Money(cost[mask], PRICE_SCALE) * exchange_rate(c)).to_int64(PRICE_SCALE)
+    sub['Maliyet_TRY'] = cost_try
+    return sub
+
+SUPPLIER_BC_AGG = dict(
+    Anahtar_Kod=('Anahtar_Kod','first'),
+    match_code=('match_code', 'first'), 
+    Toplam_Tedarikci_Stok=('Miktar','sum'), 
+    Maliyet=('Maliyet_TRY','min'), 
+    Ted_Hazir_Fiyat=('Ted_Hazir_Fiyat', 'max'),
+    Marka=('Marka','first'), 
+    Ted_Urun_Adi=('Ted_Urun_Adi', 'first')
+)
+SUPPLIER_SKU_AGG = {k: v for k, v in SUPPLIER_BC_AGG.items() if k != 'match_code'}
+SUPPLIER_COLUMNS = ['Barkod', 'Anahtar_Kod', 'match_code', 'Toplam_Tedarikci_Stok', 'Maliyet', 'Ted_Hazir_Fiyat', 'Marka', 'Ted_Urun_Adi']
+
+def supplier_partials(df, tpl):
+    # Barkodlu satırlar barkoda, barkodsuzlar eşleşme koduna göre gruplanır: (barkod_grupları, kod_grupları, tanınmayan_para_birimleri)
+    unknown = {}
+    sub = supplier_frame(df, tpl, unknown)
+    v_bc = sub[sub['Barkod'] != '_barkod_yok_']
+    v_sku = sub[sub['Barkod'] == '_barkod_yok_']
+    return (v_bc.groupby(['Barkod'], as_index=False).agg(**SUPPLIER_BC_AGG) if not v_bc.empty else None,
+            v_sku.groupby('match_code', as_index=False).agg(**SUPPLIER_SKU_AGG) if not v_sku.empty else None,
+            unknown)
+
+def merge_supplier_partials(parts):
+    parts = [p for p in parts if p is not None]
+    unknown = {}
+    for p in parts:
+        for c, n in p[2].items(): unknown[c] = unknown.get(c, 0) + n
+    return (merge_partials([p[0] for p in parts], ['Barkod'], SUPPLIER_BC_AGG),
+            merge_partials([p[1] for p in parts], 'match_code', SUPPLIER_SKU_AGG),
+            unknown)
+
+def supplier_names(files):
+    # Teklif tablosundaki tedarikçi adı dosya adıdır (uzantısız, büyük harf); aynı adlı dosyalara sıra eklenir
+    names = []
     for f in files:
-        df=f['dataframe']; tpl=f['template']; fname=f['filename']
-        meta_info[fname] = len(df)
-        t_sku = tpl.get('sku'); t_stock = tpl.get('stock')
-        sub = pd.DataFrame()
-        sub['Anahtar_Kod'] = df[t_sku].fillna('KOD_YOK').astype(str) if t_sku and t_sku in df else 'KOD_YOK'
-        sub['match_code'] = sub['Anahtar_Kod'].apply(generate_match_code)
-        sub['Miktar'] = df[t_stock].apply(parse_stock_value).clip(lower=0) if t_stock and t_stock in df else 0
-        sub['Barkod'] = df[tpl['barcode']].fillna('_barkod_yok_').astype(str) if tpl.get('barcode') in df else '_barkod_yok_'
-        sub['Maliyet'] = df[tpl['cost']].apply(parse_price_value) if tpl.get('cost') in df else 0
-        t_price = tpl.get('selling_price')
-        sub['Ted_Hazir_Fiyat'] = df[t_price].apply(parse_price_value) if t_price and t_price in df else 0
-        sub['Marka'] = df[tpl['brand']].fillna('TANIMSIZ').astype(str).str.upper() if tpl.get('brand') in df else 'TANIMSIZ'
-        t_name = tpl.get('product_name')
-        if t_name and t_name in df: sub['Ted_Urun_Adi'] = df[t_name].fillna('').astype(str)
-        else: sub['Ted_Urun_Adi'] = ''
-        p_col = tpl.get('currency_column')
-        sub['Para_Birimi'] = df[p_col] if p_col and p_col in df else tpl.get('currency', 'TRY')
-        def convert(r):
+        base = name = Path(f['filename']).stem.strip().upper() or 'TEDARIKCI'
+        k = 2
+        while name in names: name = f"{base} ({k})"; k += 1
+        names.append(name)
+    return names
+
+def supplier_offers(loaded, names):
+    """Dosya başına grup sonuçlarından tedarikçi teklif tablosunu kurar: (tedarikçi, anahtar) başına bir satır.
+
+    Tedarikci_Sira dosya sırasıdır; barkodsuz tekliflerde Barkod '_barkod_yok_' kalır."""
+    frames = []
+    for i, ((g_bc, g_sku, _), _, _) in enumerate(loaded):
+        for g in (g_bc, g_sku):
+            if g is None or g.empty: continue
+            g = g.assign(Barkod=g['Barkod'] if 'Barkod' in g else '_barkod_yok_')[SUPPLIER_COLUMNS]
+            frames.append(g.assign(Tedarikci=names[i], Tedarikci_Sira=i))
+    if not frames: return pd.DataFrame(columns=SUPPLIER_COLUMNS + ['Tedarikci', 'Tedarikci_Sira'])
+    offers = pd.concat(frames, ignore_index=True)
+    for col, dtype in [('Toplam_Tedarikci_Stok', np.int64), ('Maliyet', np.int64), ('Ted_Hazir_Fiyat', np.int64), ('Tedarikci_Sira', np.int64)]:
+        offers[col] = offers[col].fillna(0).astype(dtype)
+    return offers
+
+def offer_groups(offers):
+    # Barkodlu teklifler barkoda, barkodsuzlar eşleşme koduna göre gruplanır; grup numaraları barkodlar (sıralı),
+    # ardından kodlar (sıralı) gelecek şekilde verilir (eski groupby çıktısıyla aynı sıra)
+    bc = (offers['Barkod'] != '_barkod_yok_').to_numpy(dtype=bool)
+    groups = np.empty(len(offers), dtype=np.int64)
+    codes, uniques = pd.factorize(offers['Barkod'][bc], sort=True)
+    groups[bc] = codes
+    groups[~bc] = pd.factorize(offers['match_code'][~bc], sort=True)[0] + len(uniques)
+    return groups
+
+def select_best_offers(offers, strategy=None, preferred=None):
+    """Teklif tablosundan anahtar başına tek tedarikçi satırı üretir (tek sıralama + gruplu indirgeme).
+
+    aggregate: stoklar toplanır, en düşük maliyet ve en yüksek liste fiyatı alınır (tedarikçiler karışabilir).
+    cheapest_in_stock / max_stock / preferred: kazanan tedarikçinin stok, maliyet ve liste fiyatı birlikte alınır.
+    Tedarikci kazanan (aggregate'te en düşük maliyetli) teklifin sahibi, Teklif_Sayisi anahtardaki teklif sayısıdır.
+    """
+    strategy = strategy or SUPPLIER_OFFER_STRATEGY
+    if strategy not in SUPPLIER_OFFER_STRATEGIES: raise ValueError(f"Geçersiz teklif stratejisi: {strategy}")
+    if offers.empty: return pd.DataFrame(columns=SUPPLIER_COLUMNS + ['Tedarikci', 'Teklif_Sayisi'])
+    groups = offer_groups(offers)
+    stock = offers['Toplam_Tedarikci_Stok'].to_numpy(dtype=np.int64)
+    cost = offers['Maliyet'].to_numpy(dtype=np.int64)
+    rank = offers['Tedarikci_Sira'].to_numpy(dtype=np.int64)
+    no_stock, no_cost = stock <= 0, cost <= 0
+
+    # Sıralama anahtarları (lexsort'ta sondaki anahtar önceliklidir): grup içinde kazanan teklif ilk sıraya gelir
+    if strategy == 'aggregate': keys = [rank, cost]
+    elif strategy == 'cheapest_in_stock': keys = [rank, -stock, cost, no_cost, no_stock]
+    elif strategy == 'max_stock': keys = [rank, cost, no_cost, -stock]
+    else:
+        pref = {name.strip().upper(): i for i, name in enumerate(reversed(preferred or [])) if name.strip()}
+        pref_rank = -offers['Tedarikci'].map(pref).fillna(-1).to_numpy(dtype=np.int64)
+        keys = [rank, -stock, cost, no_cost, pref_rank, no_stock]
+    order = np.lexsort(keys + [groups])
+    g = groups[order]
+    starts = np.flatnonzero(np.r_[True, g[1:] != g[:-1]])
+    win = order[starts]
+
+    out = offers.iloc[win][SUPPLIER_COLUMNS + ['Tedarikci']].reset_index(drop=True)
+    out['Teklif_Sayisi'] = np.diff(np.r_[starts, len(order)])
+    if strategy == 'aggregate':
+        # Toplam stok ve en yüksek liste fiyatı tüm tekliflerden; metin kolonları ilk tedarikçinin teklifinden
+        first = np.lexsort([rank, groups])[starts]
+        out['Toplam_Tedarikci_Stok'] = np.add.reduceat(stock[order], starts)
+        out['Ted_Hazir_Fiyat'] = np.maximum.reduceat(offers['Ted_Hazir_Fiyat'].to_numpy(dtype=np.int64)[order], starts)
+        for col in ['Barkod', 'Anahtar_Kod', 'match_code', 'Marka', 'Ted_Urun_Adi']: out[col] = offers[col].to_numpy(dtype=object)[first]
+    out['Toplam_Tedarikci_Stok'] = out['Toplam_Tedarikci_Stok'].astype(int)
+    out['Barkod'] = out['Barkod'].replace('_barkod_yok_', 'YOK')
+    return out
+
+def consolidate_suppliers(files, workers=None, strategy=None, preferred=None):
+    # Dönüş: (anahtar başına seçilen teklif, tedarikçi teklif tablosu, meta)
+    loaded = ingest_files(files, lambda df, f: supplier_partials(df, f['template']), lambda acc, part: merge_supplier_partials([acc, part]), workers)
+    meta_info = ingest_meta(files, loaded)
+    # Tanınmayan para birimleri işi durdurmaz: o satırların maliyeti 0 alınır, dosya bazında satır sayılarıyla bildirilir
+    for f, (part, _, _) in zip(files, loaded):
+        if part and part[2]:
+            meta_info[f['filename']]["unknown_currencies"] = part[2]
+            logger.warning("%s: tanınmayan para birimleri, maliyet 0 alındı: %s", f['filename'], part[2])
+    if not any(m["rows"] for m in meta_info.values()): return pd.DataFrame(), pd.DataFrame(), meta_info
+    with span('offer_select') as sp:
+        offers = supplier_offers([(part or (None, None, {}), rows, sec) for part, rows, sec in loaded], supplier_names(files))
+        final = select_best_offers(offers, strategy, preferred)
+        sp['rows'] = len(offers)
+    return final, offers, meta_info
+
+def save_supplier_result(key, result_df, offers, meta, strategy=None, preferred=None):
+    # Seçilen teklifler eşleştirme işinin okuduğu supplier_<anahtar>, teklif tablosu yeniden seçim için supplier_offers_<anahtar> olarak yazılır.
+    # supplier_codes_<anahtar>: barkodu tutmayan ürünler için aynı stratejiyle match_code başına seçilmiş teklif
+    scales = {'Maliyet': PRICE_SCALE, 'Ted_Hazir_Fiyat': PRICE_SCALE}
+    save_result_frame('supplier', key, result_df, meta=meta, scales=scales)
+    if offers.empty: return
+    save_result_frame('supplier_offers', key, offers, meta=meta, scales=scales)
+    codes = select_best_offers(offers.assign(Barkod='_barkod_yok_'), strategy, preferred)
+    save_result_frame('supplier_codes', key, codes, meta=meta, scales=scales)
+
+def offer_summary(offers, strategy):
+    suppliers = offers.groupby('Tedarikci_Sira')['Tedarikci'].agg(['first', 'size']) if not offers.empty else pd.DataFrame(columns=['first', 'size'])
+    return {"offer_strategy": strategy, "offers": len(offers), "suppliers": {name: int(n) for name, n in zip(suppliers['first'], suppliers['size'])}}
+
+# --- ÇOK SÜREÇLİ ÇALIŞTIRMA ---
+_SHARED_TASKS = {}
+
+def resolve_workers(value=None):
+    try: n = int(value) if value not in (None, '') else MATCH_WORKERS
+    except (TypeError, ValueError): n = MATCH_WORKERS
+    return max(1, min(n, os.cpu_count() or 1))
+
+def split_frame(df, n):
+    # Satırları n adet ardışık, boş olmayan parçaya böler
+    n = max(1, min(int(n), len(df)))
+    bounds = np.linspace(0, len(df), n + 1).astype(int)
+    return [df.iloc[a:b] for a, b in zip(bounds[:-1], bounds[1:])]
+
+def _run_shared_task(token, shard, measure=False):
+    # Alt süreçteki span'ler sonuçla birlikte döner; ana süreç bunları kendi kaydedicisine ekler
+    if not measure: return _SHARED_TASKS[token](shard), None
+    with SpanRecorder().active() as rec: out = _SHARED_TASKS[token](shard)
+    return out, rec.export()
+
+def parallel_map(func, shards, workers=1, on_result=None, items=None):
+    # func (closure dahil) fork öncesi global tabloya konur; alt süreçler onu ve yakaladığı büyük nesneleri
+    # (iç katalog matrisi, özellikler) copy-on-write olarak miras alır. Görev başına yalnızca parça serileştirilir.
+    # on_result(i, sonuç) her parça sırayla tamamlandığında ana süreçte çağrılır; hata fırlatırsa kalan parçalar iptal edilir.
+    # items: toplam iş büyüklüğü; verilmezse çerçeve/dizi parçalarının satır sayısından bulunur. PARALLEL_MIN_ITEMS altında sırayla çalışır.
+    # Gömülü çalıştırıcıda (JOB_RUNNER != external) çok thread'li süreç fork edilmez, hep sırayla çalışılır.
+    if items is None and all(isinstance(sh, (pd.DataFrame, np.ndarray, list)) for sh in shards): items = sum(len(sh) for sh in shards)
+    workers = min(int(workers or 1), len(shards))
+    if items is not None and items < PARALLEL_MIN_ITEMS: workers = 1
+    if JOB_RUNNER != 'external': workers = 1
+    results = []
+    if workers <= 1 or 'fork' not in multiprocessing.get_all_start_methods():
+        for s in shards:
+            results.append(func(s))
+            if on_result: on_result(len(results) - 1, results[-1])
+        return results
+    token = uuid.uuid4().hex
+    _SHARED_TASKS[token] = func
+    rec = current_spans()
+    try:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('fork')) as ex:
             try:
-                c = r['Maliyet']
-                cur = str(r['Para_Birimi']).strip().upper()
-                if cur == BASE_CURRENCY: return c
-                rate = EXCHANGE_RATES.get(cur)
-                return c * rate if rate else decimal.Decimal(0)
-            except: return decimal.Decimal(0)
-        sub['Maliyet_TRY'] = sub.apply(convert, axis=1)
-        all_df = pd.concat([all_df, sub], ignore_index=True)
-    if all_df.empty: return pd.DataFrame(), meta_info
-    
-    v_bc = all_df[all_df['Barkod'] != '_barkod_yok_']
-    g_bc = v_bc.groupby(['Barkod'], as_index=False).agg(
-        Anahtar_Kod=('Anahtar_Kod','first'),
-        match_code=('match_code', 'first'), 
-        Toplam_Tedarikci_Stok=('Miktar','sum'), 
-        Maliyet=('Maliyet_TRY','min'), 
-        Ted_Hazir_Fiyat=('Ted_Hazir_Fiyat', 'max'),
-        Marka=('Marka','first'), 
-        Ted_Urun_Adi=('Ted_Urun_Adi', 'first')
-    ) if not v_bc.empty else pd.DataFrame()
-    
-    v_sku = all_df[all_df['Barkod'] == '_barkod_yok_']
-    g_sku = v_sku.groupby('match_code', as_index=False).agg(
-        Anahtar_Kod=('Anahtar_Kod','first'),
-        Toplam_Tedarikci_Stok=('Miktar','sum'), 
-        Maliyet=('Maliyet_TRY','min'), 
-        Ted_Hazir_Fiyat=('Ted_Hazir_Fiyat', 'max'),
-        Marka=('Marka','first'), 
-        Ted_Urun_Adi=('Ted_Urun_Adi', 'first')
-    ) if not v_sku.empty else pd.DataFrame()
-    g_sku['Barkod'] = 'YOK'
-    
-    final = pd.concat([g_bc, g_sku], ignore_index=True)
-    final['Maliyet'] = final['Maliyet'].fillna(0)
-    final['Toplam_Tedarikci_Stok'] = final['Toplam_Tedarikci_Stok'].fillna(0).astype(int)
-    final['Ted_Hazir_Fiyat'] = final['Ted_Hazir_Fiyat'].fillna(0)
-    final['Barkod'] = final['Barkod'].replace('_barkod_yok_', 'YOK')
-    return final, meta_info
+                for r, spans in ex.map(_run_shared_task, [token] * len(shards), shards, [rec is not None] * len(shards)):
+                    if spans: rec.merge(spans)
+                    results.append(r)
+                    if on_result: on_result(len(results) - 1, r)
+            except BaseException:
+                ex.shutdown(wait=False, cancel_futures=True)
+                raise
+        return results
+    finally:
+        _SHARED_TASKS.pop(token, None)
+
+# --- SEYREK TOP-K ADAY ARAMASI ---
+def sparse_top_k(query_matrix, index_matrix, k=1, memory_budget_mb=MATCH_MEMORY_BUDGET_MB):
+    # TF-IDF satırları L2 normalize olduğu için nokta çarpım = kosinüs benzerliği.
+    # Sorgu satırları bloklar halinde işlenir; bir blok için ayrılan bellek bütçeyi aşmaz.
+    n_query, n_index = query_matrix.shape[0], index_matrix.shape[0]
+    k = max(1, min(int(k), n_index))
+    top_idx = np.zeros((n_query, k), dtype=np.int64)
+    top_score = np.zeros((n_query, k), dtype=np.float32)
+    if n_query == 0 or n_index == 0: return top_idx, top_score
+
+    # Satır başına en kötü durum: yoğun float32 satır + seyrek çarpım (veri + indeks)
+    bytes_per_row = n_index * 12
+    block_rows = max(1, int(memory_budget_mb * 1024 * 1024 // bytes_per_row))
+    index_t = index_matrix.T.tocsr()
+    rows = np.arange(k)
+
+    for start in range(0, n_query, block_rows):
+        end = min(start + block_rows, n_query)
+        block = (query_matrix[start:end] @ index_t).toarray()
+        if k == 1:
+            best = block.argmax(axis=1)
+            top_idx[start:end, 0] = best
+            top_score[start:end, 0] = block[np.arange(end - start), best]
+        else:
+            part = np.argpartition(-block, k - 1, axis=1)[:, :k]
+            scores = np.take_along_axis(block, part, axis=1)
+            order = np.lexsort((part, -scores), axis=-1)
+            top_idx[start:end] = np.take_along_axis(part, order, axis=1)
+            top_score[start:end] = np.take_along_axis(scores, order, axis=1)
+        del block
+    return top_idx, top_score
+
+SET_COUNT_PATTERN = r'(\d+)\s*(parca|prc|set|li)'
+
+def map_unique(series, func, workers=1):
+    # Fonksiyonu yalnızca benzersiz değerlere uygular (PARALLEL_MIN_ITEMS'tan çok benzersiz değer varsa süreçlere bölerek),
+    # sonucu satırlara geri dağıtır. NORMALIZER.*_column ve BrandIndex.extract_column bu eşiği buradan alır.
+    codes, uniques = pd.factorize(series, use_na_sentinel=False)
+    if len(uniques) < PARALLEL_MIN_ITEMS: workers = 1
+    shards = np.array_split(np.asarray(uniques, dtype=object), max(1, min(workers, len(uniques))))
+    mapped = np.empty(len(uniques), dtype=object)
+    i = 0
+    for part in parallel_map(lambda shard: [func(u) for u in shard], shards, workers):
+        for v in part: mapped[i] = v; i += 1
+    return pd.Series(mapped[codes], index=series.index)
+
+def indicator_matrix(sets, vocab):
+    # Küme kolonunu seyrek 0/1 matrise çevirir; sözlükte olmayan elemanlar sözlüğe eklenir
+    from scipy import sparse
+    indptr = [0]; indices = []
+    for s in sets:
+        indices.extend(vocab.setdefault(t, len(vocab)) for t in s)
+        indptr.append(len(indices))
+    return sparse.csr_matrix((np.ones(len(indices), dtype=np.int32), indices, indptr), shape=(len(indptr) - 1, max(len(vocab), 1)))
+
+def widen(mat, width):
+    # Sözlük büyüdükten sonra eski matrisi kopyalamadan yeni genişliğe taşır
+    from scipy import sparse
+    if mat.shape[1] >= width: return mat
+    return sparse.csr_matrix((mat.data, mat.indices, mat.indptr), shape=(mat.shape[0], width), copy=False)
+
+def pair_intersections(mat_a, mat_b, rows_a, rows_b):
+    # (rows_a[i], rows_b[i]) çiftlerinin kesişim eleman sayısı
+    if len(rows_a) == 0: return np.zeros(0, dtype=np.int64)
+    return np.asarray(mat_a[rows_a].multiply(mat_b[rows_b]).sum(axis=1)).ravel()
+
+# --- KALICI İÇ KATALOG İNDEKSİ ---
+INDEX_NGRAM_RANGE = (3, 4)
+MATCHER_INDEX_LATEST = TEMP_RESULTS_DIR / "matcher_index_latest.json"
+
+def matcher_index_path(key):
+    return TEMP_RESULTS_DIR / f"matcher_index_{key}"
+
+def catalog_row_keys(df):
+    # Satırın eşleşmeyi etkileyen içeriğinin (isim + marka) kararlı 64-bit özeti
+    content = df['ic_urun_adi'].astype(str) + '\x1f' + (df['marka'].astype(str) if 'marka' in df else '')
+    return pd.util.hash_pandas_object(content, index=False).to_numpy()
+
+class MatcherIndex:
+    # İç kataloğun sözlüğü, IDF ağırlıkları, L2 normalize TF-IDF matrisi ve satır bazlı karar özellikleri.
+    # Diskte .npy dosyaları olarak tutulur ve bellek eşlemeli (mmap) açılır. Özellikler kolonsal depoya yazılır
+    # (pickle yok); küme kolonları sıralı, boşlukla birleştirilmiş metin olarak saklanır.
+    ARRAYS = ('data', 'indices', 'indptr', 'idf', 'row_keys')
+    SET_FEATURES = ('tokens', 'numbers', 'codes')
+
+    def __init__(self, vocabulary, idf, matrix, row_keys, features, built_at, n_docs):
+        self.vocabulary = vocabulary
+        self.idf = idf
+        self.matrix = matrix
+        self.row_keys = row_keys
+        self.features = features
+        self.built_at = built_at
+        self.n_docs = n_docs
+        self._counter = None
+
+    def counter(self):
+        if self._counter is None:
+            from sklearn.feature_extraction.text import CountVectorizer
+            self._counter = CountVectorizer(analyzer='char_wb', ngram_range=INDEX_NGRAM_RANGE, vocabulary=self.vocabulary, dtype=np.float32)
+        return self._counter
+
+    def oov_weight(self, name):
+        # Sözlükte olmayan n-gramlar vektöre girmez ama norma, tek belgede geçen bir terimin IDF'i ile katılır
+        grams = [g for g in self.counter().build_analyzer()(name) if g not in self.vocabulary]
+        if not grams: return 0.0
+        counts = np.unique(grams, return_counts=True)[1]
+        idf = np.log((1 + self.n_docs) / 2) + 1
+        return float((counts.astype(np.float64) ** 2).sum() * idf * idf)
+
+    def transform(self, names, count_oov=False):
+        from scipy import sparse
+        weighted = self.counter().transform(names).multiply(self.idf).tocsr().astype(np.float32)
+        sq = np.asarray(weighted.multiply(weighted).sum(axis=1), dtype=np.float64).ravel()
+        if count_oov: sq += map_unique(names, self.oov_weight).to_numpy(dtype=np.float64)
+        norms = np.sqrt(sq); norms[norms == 0] = 1.0
+        return (sparse.diags((1.0 / norms).astype(np.float32)) @ weighted).tocsr()
+
+    @classmethod
+    def fit(cls, valid_int, matcher):
+        from sklearn.feature_extraction.text import CountVectorizer
+        counts = CountVectorizer(analyzer='char_wb', ngram_range=INDEX_NGRAM_RANGE, dtype=np.float32).fit(valid_int['norm_name'])
+        n_docs = len(valid_int)
+        df = np.bincount(counts.transform(valid_int['norm_name']).indices, minlength=len(counts.vocabulary_))
+        idf = (np.log((1 + n_docs) / (1 + df)) + 1).astype(np.float32)
+        index = cls(counts.vocabulary_, idf, None, catalog_row_keys(valid_int), None, time.time(), n_docs)
+        index.matrix = index.transform(valid_int['norm_name'])
+        index.features = matcher.build_side_features(valid_int, 'marka', 'ic_urun_adi').reset_index(drop=True)
+        return index
+
+    def locate(self, keys):
+        # Her yeni satırın indeksteki karşılığı; yeni ya da değişmiş satırlar için -1
+        uniq, first = np.unique(self.row_keys, return_index=True)
+        pos = pd.Index(uniq).get_indexer(keys)
+        return np.where(pos >= 0, first[np.maximum(pos, 0)], -1)
+
+    def update(self, valid_int, matcher, pos=None):
+        # Değişmeyen satırlar indeksten kopyalanır; yalnızca eklenen/değişen satırlar vektörleştirilir
+        from scipy import sparse
+        keys = catalog_row_keys(valid_int)
+        if pos is None: pos = self.locate(keys)
+        if len(pos) == len(self.row_keys) and np.array_equal(pos, np.arange(len(pos))): return self
+        miss = np.flatnonzero(pos < 0)
+        sel = pos.copy(); sel[miss] = len(self.row_keys) + np.arange(len(miss))
+        new_rows = valid_int.iloc[miss]
+        matrix = sparse.vstack([self.matrix, self.transform(new_rows['norm_name'])]).tocsr()[sel]
+        new_feats = matcher.build_side_features(new_rows, 'marka', 'ic_urun_adi')
+        features = pd.concat([self.features, new_feats], ignore_index=True).iloc[sel].reset_index(drop=True)
+        return MatcherIndex(self.vocabulary, self.idf, matrix, keys, features, self.built_at, self.n_docs)
+
+    def save(self, path):
+        # Geçici klasöre yazılıp tek rename ile yayınlanır; aynı anahtarı başka bir iş yazdıysa bizimki atılır
+        import shutil
+        tmp = Path(tempfile.mkdtemp(dir=path.parent, prefix=f"{path.name}.tmp"))
+        m = self.matrix
+        for name, arr in zip(self.ARRAYS, (m.data, m.indices, m.indptr, self.idf, self.row_keys)):
+            np.save(tmp / f"{name}.npy", np.asarray(arr))
+        feats = self.features.copy()
+        for col in self.SET_FEATURES: feats[col] = feats[col].map(lambda v: " ".join(sorted(v)))
+        save_result_frame('index', 'features', feats, root=tmp)
+        terms = [None] * len(self.vocabulary)
+        for t, i in self.vocabulary.items(): terms[i] = t
+        with open(tmp / "meta.json", 'w', encoding='utf-8') as f:
+            json.dump({"terms": terms, "shape": list(m.shape), "built_at": self.built_at, "n_docs": self.n_docs, "brands": BRAND_INDEX.version}, f, ensure_ascii=False)
+        try: os.replace(tmp, path)
+        except OSError: shutil.rmtree(tmp, ignore_errors=True)
+
+    @classmethod
+    def load(cls, path):
+        from scipy import sparse
+        with open(path / "meta.json", encoding='utf-8') as f: meta = json.load(f)
+        arr = {name: np.load(path / f"{name}.npy", mmap_mode='r') for name in cls.ARRAYS}
+        matrix = sparse.csr_matrix((arr['data'], arr['indices'], arr['indptr']), shape=tuple(meta['shape']), copy=False)
+        vocabulary = {t: i for i, t in enumerate(meta['terms'])}
+        features = load_result_frame('index', 'features', root=path)
+        for col in cls.SET_FEATURES: features[col] = map_unique(features[col], lambda t: frozenset(t.split()))
+        index = cls(vocabulary, np.asarray(arr['idf']), matrix, np.asarray(arr['row_keys']), features, meta['built_at'], meta['n_docs'])
+        index.brands_version = meta.get('brands')
+        return index
+
+def load_matcher_index(key, valid_int, matcher):
+    # Önce anahtarın kendi indeksi, yoksa en son kaydedilen indeks denenir. Taban indeks eskimişse
+    # ya da satırların çoğu değişmişse sıfırdan kurulur; aksi halde artımlı güncellenir.
+    latest = None
+    try:
+        with open(MATCHER_INDEX_LATEST) as f: latest = json.load(f).get('key')
+    except Exception: pass
+
+    for source in dict.fromkeys(k for k in (key, latest) if k):
+        try: base = MatcherIndex.load(matcher_index_path(source))
+        except Exception: continue
+        if time.time() - base.built_at > MATCH_INDEX_MAX_AGE_H * 3600: continue
+        # Marka tablosu değiştiyse kayıtlı marka/kod özellikleri geçersizdir
+        if base.brands_version != BRAND_INDEX.version: continue
+        pos = base.locate(catalog_row_keys(valid_int))
+        if (pos < 0).mean() > MATCH_INDEX_REFIT_RATIO: continue
+        index = base.update(valid_int, matcher, pos)
+        if source == key: return index
+        break
+    else:
+        index = MatcherIndex.fit(valid_int, matcher)
+
+    index.save(matcher_index_path(key))
+    tmp = MATCHER_INDEX_LATEST.with_suffix(f".{uuid.uuid4().hex}.tmp")
+    with open(tmp, 'w') as f: json.dump({"key": key}, f)
+    os.replace(tmp, MATCHER_INDEX_LATEST)
+    return index
 
 # --- UNIVERSAL SMART MATCHING ENGINE (Enhanced) ---
 class UniversalSmartMatcher:
-    def __init__(self, internal_df, marketplace_df):
+    def __init__(self, internal_df, marketplace_df, top_k=None, memory_budget_mb=None, index_key=None, workers=None):
         self.int_df = internal_df.copy()
         self.mp_df = marketplace_df.copy()
+        self.TOP_K = top_k or MATCH_TOP_K
+        self.MEMORY_BUDGET_MB = memory_budget_mb or MATCH_MEMORY_BUDGET_MB
+        self.INDEX_KEY = index_key if MATCH_INDEX_ENABLED else None
+        self.WORKERS = resolve_workers(workers)
         self.THRESHOLD_TRUSTED = 0.35 
         self.THRESHOLD_HIGH = 0.75    
         self.THRESHOLD_NUMERIC = 0.50 
         
         self.BANNED_CODES = { "SET", "ADET", "PARCA", "TAKIM", "CANTALI", "KUTULU", "PRO", "PLUS", "MAX" }
-        self.KNOWN_BRANDS = { "BOSCH", "MAKITA", "DEWALT", "MILWAUKEE", "STANLEY", "BLACK&DECKER", "CETA FORM", "IZELTAS", "KNIPEX", "PROXXON", "WERA", "WIHA", "ATTLAS", "RTRMAX", "CATPOWER", "EINHELL", "KARCHER", "LOCTITE", "DBK", "KLPRO", "MAX EXTRA", "ROTA", "GLOBE", "YKAR", "CERMAX", "INGCO", "TOTAL", "RODEX", "CRAFT", "MAGMAWELD", "ASKAYNAK", "CERPA", "ALTAS", "ALTAŞ", "WOLFCRAFT", "UNI-T", "UNIT", "AEG", "ELTA", "MASTECH", "LUTION", "LUTIAN", "MYTOL", "CORAH", "HITACHI", "HIKOKI", "PIECESS", "ZOBO", "DURACELL", "GP", "VARTA", "OSRAM", "PHILIPS", "RAPID", "CHATTEL", "TODRILL", "RUBI", "KRISTAL", "RODEX", "MIKASSO", "KLEIN", "DREMEL", "RYOBI", "METABO", "HILTI", "STAYER", "VIRAX", "ROTHENBERGER", "RIDGID", "REMS" }
-        self.BRAND_CONFLICTS = { "CETA FORM": ["IZELTAS", "CERPA", "ALTAS", "KNIPEX", "ELTA"], "IZELTAS": ["CETA FORM", "CERPA", "ALTAS", "KNIPEX"], "CERPA": ["CETA FORM", "IZELTAS", "KNIPEX", "ALTAS"], "BOSCH": ["MAKITA", "DEWALT", "MILWAUKEE", "EINHELL", "RTRMAX", "DBK", "AEG", "HITACHI"], "MAKITA": ["BOSCH", "DEWALT", "MILWAUKEE", "EINHELL", "RTRMAX", "DBK", "AEG", "HITACHI"], "RTRMAX": ["BOSCH", "MAKITA", "DEWALT", "EINHELL", "CATPOWER", "AEG", "HITACHI", "ATTLAS", "CHATTEL", "INGCO"], "INGCO": ["TOTAL", "RTRMAX", "ATTLAS", "CATPOWER"], "KNIPEX": ["IZELTAS", "CETA FORM", "CERPA"], "MILWAUKEE": ["DEWALT", "MAKITA", "BOSCH"], "HITACHI": ["MAKITA", "BOSCH", "DEWALT", "RTRMAX"] }
+        self.brands = BRAND_INDEX
         
     def normalize_text(self, text):
-        if not isinstance(text, str): return ""
-        text = text.lower()
-        text = re.sub(r'\b(rm_|tyc_|hbv|akn_|frkn)\w*', '', text) 
-        text = text.replace("frkn", "")
-        tr_map = str.maketrans("ğüşıöçâêîôû", "gusiocaeiou")
-        text = text.translate(tr_map)
-        text = normalize_units(text)
-        noise = ["orijinal", "ithal", "yerli", "uretim", "yeni", "kampanya", "kargo", "bedava", "firsati", "garantili"]
-        for w in noise: text = text.replace(w, "")
-        text = re.sub(r'[^a-z0-9\s]', ' ', text)
-        return re.sub(r'\s+', ' ', text).strip()
+        return NORMALIZER.title(text)
 
     def normalize_brand(self, brand_text):
         if not brand_text or str(brand_text).upper() in ['TANIMSIZ', 'NAN', 'NONE', 'YOK', 'DIĞER', 'DIGER', 'NULL']: return "TANIMSIZ"
@@ -569,12 +2505,7 @@ class UniversalSmartMatcher:
         return b.strip()
 
     def extract_brand_from_title(self, title):
-        title_upper = str(title).upper().replace('İ', 'I')
-        sorted_brands = sorted(self.KNOWN_BRANDS, key=len, reverse=True)
-        for b in sorted_brands:
-            if re.search(r'\b' + re.escape(b) + r'\b', title_upper): return b
-        if "IZEL" in title_upper: return "IZELTAS"
-        return "TANIMSIZ"
+        return self.brands.extract(title)
 
     def detect_brand_smart(self, row, source_type):
         col_brand = self.normalize_brand(row.get('MP_Marka' if source_type == 'mp' else 'marka', 'TANIMSIZ'))
@@ -583,43 +2514,35 @@ class UniversalSmartMatcher:
         return self.extract_brand_from_title(text)
 
     def is_brand_conflict(self, b1, b2):
-        if b1 == "TANIMSIZ" or b2 == "TANIMSIZ": return False
-        if b1 == b2: return False
-        if b1 in b2 or b2 in b1: return False
-        if b1 in self.BRAND_CONFLICTS and b2 in self.BRAND_CONFLICTS[b1]: return True
-        if b2 in self.BRAND_CONFLICTS and b1 in self.BRAND_CONFLICTS[b2]: return True
-        if b1 in self.KNOWN_BRANDS and b2 in self.KNOWN_BRANDS: return True
-        return False
+        return self.brands.is_conflict(b1, b2)
 
     def get_numbers(self, text):
         return set(re.findall(r'\b\d+[a-z]*\b', text))
 
     def extract_identity_codes(self, text):
-        text_clean = self.normalize_text(text).upper()
-        tokens = text_clean.split()
+        return self.identity_codes_from_norm(self.normalize_text(text))
+
+    def identity_codes_from_norm(self, norm_text):
         codes = set()
-        for t in tokens:
+        for t in norm_text.upper().split():
             if len(t) < 3: continue 
             if t in self.BANNED_CODES: continue
             if any(c.isdigit() for c in t) and any(c.isalpha() for c in t):
                 codes.add(t)
-            elif t.isalpha() and len(t) >= 4 and t not in self.KNOWN_BRANDS:
+            elif t.isalpha() and len(t) >= 4 and t not in self.brands.brands:
                 codes.add(t)
         return codes
 
     def check_set_count_conflict(self, t1, t2):
-        p1 = re.search(r'(\d+)\s*(parca|prc|set|li)', t1.lower())
-        p2 = re.search(r'(\d+)\s*(parca|prc|set|li)', t2.lower())
+        p1 = re.search(SET_COUNT_PATTERN, t1.lower())
+        p2 = re.search(SET_COUNT_PATTERN, t2.lower())
         if p1 and p2:
             if p1.group(1) != p2.group(1): return True
         return False
 
     def calculate_hybrid_score(self, vector_score, row_text, cand_text):
-        norm1 = self.normalize_text(row_text)
-        norm2 = self.normalize_text(cand_text)
-        
-        tokens1 = set(norm1.split())
-        tokens2 = set(norm2.split())
+        tokens1 = NORMALIZER.tokens(row_text)
+        tokens2 = NORMALIZER.tokens(cand_text)
         
         if not tokens1 or not tokens2: return 0.0
         
@@ -630,131 +2553,414 @@ class UniversalSmartMatcher:
         final_score = (vector_score * 0.6) + (jaccard * 0.4)
         return min(final_score, 1.0)
 
-    def run_engine(self):
+    def build_side_features(self, df, brand_col, title_col):
+        # Karar ağacının ihtiyaç duyduğu türevler her taraf için tek sefer, kolon olarak hesaplanır
+        titles = df[title_col].astype(str) if title_col in df else pd.Series('', index=df.index)
+        brands = df[brand_col] if brand_col in df else pd.Series('TANIMSIZ', index=df.index)
+        feats = pd.DataFrame(index=df.index)
+        feats['norm_name'] = df['norm_name'] if 'norm_name' in df else NORMALIZER.title_column(titles)
+        
+        brand = map_unique(brands, self.normalize_brand)
+        from_title = (brand == "TANIMSIZ") | (brand.str.len() <= 2)
+        if from_title.any():
+            brand[from_title] = self.brands.extract_column(titles[from_title])
+        feats['brand'] = brand
+        
+        feats['tokens'] = NORMALIZER.token_column(titles) if 'norm_name' not in df else map_unique(feats['norm_name'], lambda t: frozenset(t.split()))
+        feats['numbers'] = map_unique(feats['norm_name'], self.get_numbers)
+        feats['codes'] = map_unique(feats['norm_name'], self.identity_codes_from_norm)
+        feats['compact'] = feats['norm_name'].str.replace(" ", "", regex=False)
+        feats['set_count'] = titles.str.lower().str.extract(SET_COUNT_PATTERN, expand=True)[0]
+        return feats
+
+    def int_indicators(self, int_f):
+        # İç katalog tarafının küme matrisleri bir kez kurulur; paralel modda alt süreçlere fork ile miras kalır
+        if getattr(self, '_int_ind_src', None) is not int_f:
+            self._int_ind = {}
+            for col in ('tokens', 'numbers', 'codes'):
+                vocab = {}
+                self._int_ind[col] = (indicator_matrix(int_f[col], vocab), vocab)
+            self._int_ind_src = int_f
+        return self._int_ind
+
+    def pair_indicators(self, mp_f, int_f, col):
+        int_mat, int_vocab = self.int_indicators(int_f)[col]
+        vocab = dict(int_vocab)
+        mp_mat = indicator_matrix(mp_f[col], vocab)
+        return mp_mat, widen(int_mat, mp_mat.shape[1])
+
+    def evaluate_candidates(self, mp_f, int_f, top_idx, top_scores):
+        # Tüm (pazaryeri satırı, aday) çiftleri için karar ağacı toplu olarak uygulanır
+        n, k = top_idx.shape
+        rows = np.repeat(np.arange(n), k)
+        cols = top_idx.ravel()
+        vs = top_scores.ravel()
+        valid = vs >= 0.15
+        
+        decisions = np.full(n * k, "Eşleşmedi", dtype=object)
+        hybrid = np.zeros(n * k, dtype=np.float32)
+        
+        if valid.any():
+            r, c, v = rows[valid], cols[valid], vs[valid]
+            
+            b1 = mp_f['brand'].to_numpy(dtype=object)[r]
+            b2 = int_f['brand'].to_numpy(dtype=object)[c]
+            pair_codes, pair_uniques = pd.MultiIndex.from_arrays([b1, b2]).factorize()
+            conflict_lookup = np.array([self.brands.is_conflict(x, y) for x, y in pair_uniques], dtype=bool)
+            brand_conflict = conflict_lookup[pair_codes]
+            brands_match = (b1 == b2) & (b1 != "TANIMSIZ")
+            
+            (tok1, tok2), (num1, num2), (cod1, cod2) = [self.pair_indicators(mp_f, int_f, col) for col in ('tokens', 'numbers', 'codes')]
+            
+            n_num1 = np.diff(num1.indptr)[r]; n_num2 = np.diff(num2.indptr)[c]
+            num_inter = pair_intersections(num1, num2, r, c)
+            numeric_match = (n_num1 > 0) & (n_num2 > 0) & ((num_inter == n_num1) | (num_inter == n_num2))
+            
+            strong = pair_intersections(cod1, cod2, r, c) > 0
+            codes2 = int_f['codes'].to_numpy(dtype=object)
+            compact1 = mp_f['compact'].to_numpy(dtype=object)
+            for p in np.flatnonzero(~strong):
+                n1 = compact1[r[p]]
+                if any(len(code) > 3 and code.lower() in n1 for code in codes2[c[p]]):
+                    strong[p] = True
+            
+            s1 = mp_f['set_count'].to_numpy(dtype=object)[r]
+            s2 = int_f['set_count'].to_numpy(dtype=object)[c]
+            set_conflict = pd.notna(s1) & pd.notna(s2) & (s1 != s2)
+            
+            n_tok1 = np.diff(tok1.indptr)[r]; n_tok2 = np.diff(tok2.indptr)[c]
+            tok_inter = pair_intersections(tok1, tok2, r, c)
+            union = n_tok1 + n_tok2 - tok_inter
+            jaccard = np.divide(tok_inter, union, out=np.zeros(len(r)), where=union > 0)
+            score = np.minimum(v * 0.6 + (jaccard * 0.4).astype(np.float32), 1.0)
+            score = np.where((n_tok1 > 0) & (n_tok2 > 0), score, np.float32(0.0))
+            
+            conditions = [
+                brand_conflict & strong & ~set_conflict & numeric_match,
+                brand_conflict,
+                set_conflict,
+                strong,
+                brands_match & (score > self.THRESHOLD_TRUSTED),
+                brands_match & numeric_match & (score > 0.25),
+                brands_match,
+                numeric_match & (score > self.THRESHOLD_NUMERIC),
+                score > self.THRESHOLD_HIGH,
+            ]
+            choices = [
+                "Füzyon (Marka Farklı ama Kod ve Sayılar Aynı)",
+                "Eşleşmedi (Marka Çatışması)",
+                "Eşleşmedi (Set Sayısı Farkı)",
+                "Füzyon (Altın Kod)",
+                "Füzyon (Güvenli Marka)",
+                "Füzyon (Marka + Sayısal Eşleşme)",
+                "Eşleşmedi",
+                "Füzyon (Güçlü Sayısal Benzerlik)",
+                "Füzyon (Yüksek Metin Benzerliği)",
+            ]
+            decisions[valid] = np.select(conditions, choices, default="Eşleşmedi")
+            hybrid[valid] = score
+        
+        # Adaylar skor sırasıyla denenir; ilk kabul edilen aday kazanır, hiçbiri kabul edilmezse en iyi adayın kararı raporlanır.
+        decisions = decisions.reshape(n, k); hybrid = hybrid.reshape(n, k)
+        accepted = np.char.startswith(decisions.astype(str), "Füzyon") & valid.reshape(n, k)
+        pick = np.where(accepted.any(axis=1), accepted.argmax(axis=1), 0)
+        line = np.arange(n)
+        return decisions[line, pick], hybrid[line, pick], top_idx[line, pick], accepted[line, pick]
+
+    def run_engine(self, progress=None, reuse=None):
+        # progress(biten_satır, toplam_satır): puanlanan pazaryeri satırları parça parça bildirilir.
+        # reuse: aynı şablon ve katalogla önceki atamalar (DeltaMatchState); değişmeyen satırlar puanlanmadan geri yüklenir.
+        # Yalnızca kalıcı indeksle kullanılır: indekssiz vektörleştirici pazaryeri başlıklarıyla da eğitildiğinden skorlar çalıştırmalar arasında karşılaştırılamaz.
+        # Çalıştıktan sonra self.assignments tüm geçerli satırların atamalarını, self.reused geri yüklenen satır sayısını tutar.
+        self.assignments, self.reused = None, 0
         try:
             from sklearn.feature_extraction.text import TfidfVectorizer
-            from sklearn.metrics.pairwise import cosine_similarity
         except ImportError: return pd.DataFrame()
         
-        self.int_df['norm_name'] = self.int_df['ic_urun_adi'].astype(str).apply(self.normalize_text)
-        self.mp_df['norm_name'] = self.mp_df['MP_Urun_Adi'].astype(str).apply(self.normalize_text)
+        with span('normalize', len(self.int_df) + len(self.mp_df)):
+            self.int_df['norm_name'] = NORMALIZER.title_column(self.int_df['ic_urun_adi'].astype(str), self.WORKERS)
+            self.mp_df['norm_name'] = NORMALIZER.title_column(self.mp_df['MP_Urun_Adi'].astype(str), self.WORKERS)
         
         valid_int = self.int_df[self.int_df['norm_name'].str.len() > 3].reset_index(drop=True)
         valid_mp = self.mp_df[self.mp_df['norm_name'].str.len() > 3].reset_index(drop=True)
         
         if valid_int.empty or valid_mp.empty: return pd.DataFrame()
         
-        vectorizer = TfidfVectorizer(analyzer='char_wb', ngram_range=(3, 4), min_df=1, dtype=np.float32)
+        mp_fp, int_fp = DeltaMatchState.mp_fingerprints(valid_mp), DeltaMatchState.int_fingerprints(valid_int)
+        self.catalog_fp = DeltaMatchState.catalog_fingerprint(int_fp)
+        prev = reuse.resolve(mp_fp, int_fp, self.catalog_fp, self.engine_signature()) if reuse is not None and self.INDEX_KEY else None
+        todo = np.flatnonzero(prev['pos'] < 0) if prev is not None else np.arange(len(valid_mp))
+        self.reused = len(valid_mp) - len(todo)
+        
+        scored_parts = self.score_rows(valid_mp.iloc[todo].reset_index(drop=True), valid_int, progress) if len(todo) else None
+        if scored_parts is None and len(todo): return pd.DataFrame()
         
+        cols = ['decision', 'score', 'cand_idx', 'accepted', 'scored']
+        frames = []
+        if scored_parts is not None: frames.append(pd.DataFrame(dict(zip(cols, scored_parts)), index=todo))
+        if self.reused:
+            keep = np.flatnonzero(prev['pos'] >= 0)
+            frames.append(pd.DataFrame({c: prev[c][keep] for c in cols}, index=keep))
+        arr = pd.concat(frames).sort_index() if len(frames) > 1 else frames[0]
+        decision, score, cand_idx, accepted, scored = [arr[c].to_numpy() for c in cols]
+        decision = decision.astype(object); accepted = accepted.astype(bool); scored = scored.astype(bool)
+        self.assignments = pd.DataFrame({'fp': mp_fp, 'decision': decision, 'score': score, 'accepted': accepted, 'scored': scored,
+                                         'target': np.where(accepted, int_fp[cand_idx], np.uint64(0))})
+        return self.assemble_results(valid_mp, valid_int, decision, score, cand_idx, accepted, scored)
+
+    def engine_signature(self):
+        # Karar mantığını etkileyen ayarlar; değişirse önceki atamalar kullanılmaz
+        return json.dumps([BRAND_INDEX.version, self.TOP_K, self.THRESHOLD_TRUSTED, self.THRESHOLD_HIGH, self.THRESHOLD_NUMERIC,
+                           list(INDEX_NGRAM_RANGE), bool(self.INDEX_KEY)])
+
+    def score_rows(self, valid_mp, valid_int, progress=None):
+        # valid_mp satırlarını iç katalogla puanlar: (karar, skor, aday_konumu, kabul, puanlandı) dizileri; hata olursa None
+        from sklearn.feature_extraction.text import TfidfVectorizer
         try:
-            vectorizer.fit(pd.concat([valid_int['norm_name'], valid_mp['norm_name']]))
-            int_matrix = vectorizer.transform(valid_int['norm_name'])
-            mp_matrix = vectorizer.transform(valid_mp['norm_name'])
-            similarity_scores = cosine_similarity(mp_matrix, int_matrix)
-        except: return pd.DataFrame()
+            with span('tfidf_fit', len(valid_int)):
+                if self.INDEX_KEY:
+                    # İç katalog indeksi diskten yüklenir/güncellenir; pazaryeri satırları onun sözlüğüyle vektörleşir
+                    index = load_matcher_index(self.INDEX_KEY, valid_int, self)
+                    int_matrix = index.matrix
+                    transform = lambda names: index.transform(names, count_oov=True)
+                    int_f = index.features.set_axis(valid_int.index)
+                else:
+                    vectorizer = TfidfVectorizer(analyzer='char_wb', ngram_range=INDEX_NGRAM_RANGE, min_df=1, dtype=np.float32)
+                    vectorizer.fit(pd.concat([valid_int['norm_name'], valid_mp['norm_name']]))
+                    int_matrix = vectorizer.transform(valid_int['norm_name'])
+                    transform = vectorizer.transform
+                    int_f = self.build_side_features(valid_int, 'marka', 'ic_urun_adi')
+        except: return None
         
-        results = []
+        # Pazaryeri satırları parçalara bölünür; iç katalog matrisi ve özellikleri tüm parçalarca paylaşılır
+        self.int_indicators(int_f)
+        budget = max(1, self.MEMORY_BUDGET_MB // self.WORKERS)
+        def score_shard(part):
+            with span('tfidf_transform', len(part)): query = transform(part['norm_name'])
+            with span('similarity', len(part)): top_idx, top_scores = sparse_top_k(query, int_matrix, self.TOP_K, budget)
+            with span('decision_loop', len(part)):
+                mp_f = self.build_side_features(part, 'MP_Marka', 'MP_Urun_Adi')
+                return self.evaluate_candidates(mp_f, int_f, top_idx, top_scores) + (top_scores[:, 0] >= 0.15,)
         
-        for i, (idx, row) in enumerate(valid_mp.iterrows()):
-            best_idx = similarity_scores[i].argmax()
-            vector_score = similarity_scores[i][best_idx]
-            
-            if vector_score < 0.15:
-                match_data = row.to_dict(); match_data['Eslestirme'] = 'Eşleşmedi'; match_data['anahtar_kod']='YOK'; results.append(match_data); continue
-            
-            candidate = valid_int.iloc[best_idx]
-            
-            match_data = row.to_dict()
-            mp_title = str(row['MP_Urun_Adi'])
-            int_title = str(candidate['ic_urun_adi'])
-            
-            mp_brand = self.detect_brand_smart(row, 'mp')
-            int_brand = self.detect_brand_smart(candidate, 'int')
-            brand_conflict = self.is_brand_conflict(mp_brand, int_brand)
-            brands_match = (mp_brand == int_brand) and (mp_brand != "TANIMSIZ")
-            
-            nums_mp = self.get_numbers(self.normalize_text(mp_title))
-            nums_int = self.get_numbers(self.normalize_text(int_title))
-            
-            numeric_match = False
-            if nums_mp and nums_int:
-                if nums_mp.issubset(nums_int) or nums_int.issubset(nums_mp):
-                    numeric_match = True
-            
-            codes1 = self.extract_identity_codes(mp_title)
-            codes2 = self.extract_identity_codes(int_title)
-            common_codes = codes1.intersection(codes2)
-            
-            has_strong_code_match = False
-            if common_codes:
-                longest = max(common_codes, key=len)
-                if len(longest) >= 3: has_strong_code_match = True
-            
-            if not has_strong_code_match:
-                n1 = self.normalize_text(mp_title).replace(" ", "")
-                n2 = self.normalize_text(int_title).replace(" ", "")
-                for code in codes2:
-                    if len(code) > 3 and code.lower() in n1:
-                        has_strong_code_match = True
-                        break
-            
-            set_conflict = self.check_set_count_conflict(mp_title, int_title)
-            hybrid_score = self.calculate_hybrid_score(vector_score, mp_title, int_title)
-            
-            match_data['Algoritma_Skoru'] = round(hybrid_score * 100, 2)
-            
-            final_decision = "Eşleşmedi"
-            
-            if brand_conflict:
-                if has_strong_code_match and not set_conflict and numeric_match:
-                    final_decision = "Füzyon (Marka Farklı ama Kod ve Sayılar Aynı)"
-                else:
-                    final_decision = "Eşleşmedi (Marka Çatışması)"
-                    
-            elif set_conflict:
-                final_decision = "Eşleşmedi (Set Sayısı Farkı)"
-                
-            elif has_strong_code_match:
-                final_decision = "Füzyon (Altın Kod)"
-                
-            elif brands_match:
-                if hybrid_score > self.THRESHOLD_TRUSTED: 
-                    final_decision = "Füzyon (Güvenli Marka)"
-                elif numeric_match and hybrid_score > 0.25:
-                    final_decision = "Füzyon (Marka + Sayısal Eşleşme)"
-                    
-            else: 
-                if numeric_match and hybrid_score > self.THRESHOLD_NUMERIC:
-                    final_decision = "Füzyon (Güçlü Sayısal Benzerlik)"
-                elif hybrid_score > self.THRESHOLD_HIGH:
-                    final_decision = "Füzyon (Yüksek Metin Benzerliği)"
-            
-            if "Eşleşmedi" not in final_decision:
-                match_data.update(candidate.to_dict())
-                match_data['Eslestirme'] = final_decision
+        # İlerleme bildirimi için parçalar MATCH_PROGRESS_ROWS satırı geçmez; satır puanları parçalamadan bağımsızdır
+        n_shards = max(self.WORKERS, -(-len(valid_mp) // MATCH_PROGRESS_ROWS)) if progress else self.WORKERS
+        shards = split_frame(valid_mp, n_shards)
+        ends = np.cumsum([len(p) for p in shards])
+        on_result = (lambda i, _: progress(int(ends[i]), len(valid_mp))) if progress else None
+        parts = parallel_map(score_shard, shards, self.WORKERS, on_result)
+        return [np.concatenate(p) for p in zip(*parts)]
+
+    def assemble_results(self, valid_mp, valid_int, decision, score, cand_idx, accepted, scored):
+        # Kabul edilen satırlarda aday kolonları pazaryeri kolonlarının üzerine yazılır; diğerlerinde anahtar_kod 'YOK'
+        out = valid_mp.copy()
+        out['Algoritma_Skoru'] = np.where(scored, np.round(score * 100, 2), np.nan)
+        cand = valid_int.iloc[cand_idx].reset_index(drop=True)
+        cand.index = out.index
+        for col in cand.columns:
+            if col in out.columns:
+                out[col] = out[col].where(~accepted, cand[col])
             else:
-                match_data['Eslestirme'] = final_decision
-                match_data['anahtar_kod'] = 'YOK'
-            
-            results.append(match_data)
-            
-        return pd.DataFrame(results)
-
-def run_matching_job(job_id, ikey, skey, mp_path, mp_filename, tpl_n, stock_strat, price_strat, orphan_strat, smart_freeze, freeze_conf, brand_strat, include_orig):
+                out[col] = cand[col].where(accepted)
+        out['Eslestirme'] = decision
+        out.loc[~scored, 'Eslestirme'] = 'Eşleşmedi'
+        out.loc[~accepted, 'anahtar_kod'] = 'YOK'
+        return out
+
+# --- RAPOR YAZICI ---
+def _xlsx_rows(df, chunk_rows=REPORT_CHUNK_ROWS):
+    # Satırlar blok blok Python değerlerine çevrilir; boş değerler (NaN/NA/NaT) boş hücre, sonsuzlar pandas gibi 'inf' olur
+    inf_cols = [i for i, dt in enumerate(df.dtypes) if pd.api.types.is_float_dtype(dt)]
+    for start in range(0, len(df), chunk_rows):
+        block = df.iloc[start:start + chunk_rows]
+        values = block.to_numpy(dtype=object)
+        values[block.isna().to_numpy()] = None
+        for i in inf_cols:
+            col = block.iloc[:, i].to_numpy(dtype=np.float64)
+            inf = np.isinf(col)
+            if inf.any(): values[inf, i] = np.where(col[inf] > 0, 'inf', '-inf')
+        yield from values.tolist()
+
+def write_xlsx_report(path, sheets, chunk_rows=REPORT_CHUNK_ROWS):
+    """[(sayfa_adı, DataFrame)] listesini openpyxl write-only kipinde yazar (DataFrame.to_excel(index=False) ile aynı hücreler).
+    Satırlar diske akıtılır; bellek kullanımı tablo boyundan bağımsızdır."""
+    from openpyxl import Workbook
+    wb = Workbook(write_only=True)
+    for name, df in sheets:
+        ws = wb.create_sheet(title=name)
+        ws.append(list(df.columns))
+        for row in _xlsx_rows(df, chunk_rows): ws.append(row)
+    wb.save(path)
+
+def write_csv_sidecar(path, df, chunk_rows=REPORT_CHUNK_ROWS):
+    df.to_csv(path, index=False, compression='gzip', chunksize=chunk_rows)
+
+def iter_export(df, fmt, chunk_rows=REPORT_CHUNK_ROWS):
+    """DataFrame'i 'csv', 'csv.gz' veya 'jsonl' olarak bloklar halinde üretir (bytes)."""
+    if fmt == 'jsonl':
+        for start in range(0, len(df), chunk_rows):
+            yield df.iloc[start:start + chunk_rows].to_json(orient='records', lines=True, force_ascii=False, date_format='iso').rstrip('\n').encode('utf-8') + b'\n'
+        return
+    def csv_blocks():
+        if len(df) == 0: yield df.to_csv(index=False)
+        for start in range(0, len(df), chunk_rows):
+            yield df.iloc[start:start + chunk_rows].to_csv(index=False, header=start == 0)
+    if fmt == 'csv':
+        for block in csv_blocks(): yield block.encode('utf-8')
+        return
+    z = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31: gzip başlığı
+    for block in csv_blocks():
+        out = z.compress(block.encode('utf-8'))
+        if out: yield out
+    yield z.flush()
+
+# --- ARTIMLI EŞLEŞTİRME ---
+class DeltaMatchState:
+    """Bir pazaryeri şablonunun, bir iç katalog sonucuyla (store key) son isim eşleştirme atamaları (MATCH_STATE_DIR/delta_<özet>/).
+    Satırlar barkod + SKU + başlık + marka özetiyle (fp), atanan iç ürün kod + barkod + ad + marka özetiyle (target) tanınır.
+    Skorlar katalog indeksinin sözlüğüne bağlı olduğundan atamalar yalnızca aynı katalogla (özet de tutmalı) yeniden kullanılır."""
+    MP_COLUMNS = ['MP_Barkod', 'MP_SKU', 'MP_Urun_Adi', 'MP_Marka']
+    INT_COLUMNS = ['anahtar_kod', 'barkod', 'ic_urun_adi', 'marka']
+
+    def __init__(self, frame, meta):
+        self.frame, self.meta = frame, meta
+
+    @staticmethod
+    def key(template_name, store_key):
+        return hashlib.sha1(f"{template_name or ''}\0{store_key or ''}".encode('utf-8')).hexdigest()[:16]
+
+    @staticmethod
+    def _hash_rows(df, columns):
+        cols = [c for c in columns if c in df.columns]
+        if not cols or not len(df): return np.zeros(len(df), dtype=np.uint64)
+        return pd.util.hash_pandas_object(df[cols].astype(str), index=False).to_numpy(dtype=np.uint64)
+
+    @classmethod
+    def mp_fingerprints(cls, df): return cls._hash_rows(df, cls.MP_COLUMNS)
+
+    @classmethod
+    def int_fingerprints(cls, df): return cls._hash_rows(df, cls.INT_COLUMNS)
+
+    @staticmethod
+    def catalog_fingerprint(int_fp):
+        return hashlib.sha1(np.sort(int_fp).tobytes()).hexdigest()
+
+    @classmethod
+    def load(cls, template_name, store_key):
+        key = cls.key(template_name, store_key)
+        if not (result_store_path('delta', key, MATCH_STATE_DIR) / "schema.json").exists(): return None
+        try: return cls(load_result_frame('delta', key, root=MATCH_STATE_DIR), load_result_meta('delta', key, root=MATCH_STATE_DIR))
+        except Exception:
+            traceback.print_exc()
+            return None
+
+    @classmethod
+    def save(cls, template_name, store_key, assignments, catalog_fp, signature):
+        try: save_result_frame('delta', cls.key(template_name, store_key), assignments, meta={"template": template_name, "store": store_key, "catalog": catalog_fp, "engine": signature, "saved_at": time.time()}, root=MATCH_STATE_DIR)
+        except Exception: traceback.print_exc()
+
+    def resolve(self, mp_fp, int_fp, catalog_fp, signature):
+        """Yeni satırlar için önceki atamaları döner: pos (-1: yeniden puanlanacak) ve karar dizileri."""
+        n = len(mp_fp)
+        out = {'pos': np.full(n, -1, dtype=np.int64), 'decision': np.full(n, "Eşleşmedi", dtype=object), 'score': np.zeros(n, dtype=np.float32),
+               'cand_idx': np.zeros(n, dtype=np.int64), 'accepted': np.zeros(n, dtype=bool), 'scored': np.zeros(n, dtype=bool)}
+        if self.meta.get("engine") != signature or self.meta.get("catalog") != catalog_fp or self.frame.empty: return out
+        prev = self.frame
+        pos = KeyIndex(prev['fp'].to_numpy(dtype=np.uint64)).lookup(mp_fp)
+        hit = pos >= 0
+        p = np.maximum(pos, 0)
+        accepted = prev['accepted'].to_numpy(dtype=bool)[p] & hit
+        target = KeyIndex(int_fp).lookup(prev['target'].to_numpy(dtype=np.uint64)[p])
+        usable = hit & (~accepted | (target >= 0))
+        out['pos'] = np.where(usable, pos, -1)
+        out['decision'] = np.asarray(prev['decision'].to_numpy(dtype=object)[p], dtype=object)
+        out['score'] = prev['score'].to_numpy()[p]
+        out['cand_idx'] = np.where(accepted, np.maximum(target, 0), 0)
+        out['accepted'] = accepted
+        out['scored'] = prev['scored'].to_numpy(dtype=bool)[p]
+        return out
+
+# --- BİREBİR ANAHTAR EŞLEŞTİRME ---
+class KeyIndex:
+    # Anahtar -> ilk geçtiği satırın konumu; sorgular pd.Index hash tablosu üzerinden toplu yapılır
+    def __init__(self, keys, valid=None):
+        keys = pd.Series(keys).reset_index(drop=True)
+        pos = np.arange(len(keys)) if valid is None else np.flatnonzero(np.asarray(valid, dtype=bool))
+        k = keys.iloc[pos]
+        first = ~k.duplicated().to_numpy()
+        self.index = pd.Index(k.to_numpy()[first])
+        self.rows = pos[first]
+
+    def lookup(self, probe):
+        # Her sorgu anahtarı için satır konumu, bulunamayanlar için -1
+        if not len(self.rows): return np.full(len(probe), -1, dtype=np.int64)
+        found = self.index.get_indexer(pd.Index(probe))
+        return np.where(found >= 0, self.rows[found], -1)
+
+# (kolon, en kısa geçerli uzunluk, etiket) — öncelik sırasıyla; kalan satırlar bulanık eşleştirmeye gider
+EXACT_KEY_STAGES = [('bk_norm', 4, 'Barkod'), ('sku_norm', 2, 'SKU')]
+EXACT_KEY_SPANS = {'bk_norm': 'barcode_join', 'sku_norm': 'sku_join'}
+
+def exact_key_matches(mp, internal_df):
+    # İç katalogda her anahtar için bir hash indeks kurulur ve tüm pazaryeri satırları tek seferde sorgulanır.
+    # Her aşama için (etiket, kolon, pazaryeri konumları, iç katalog konumları) ve eşleşmeyen satır maskesi döner.
+    open_ = np.ones(len(mp), dtype=bool)
+    stages = []
+    for col, min_len, label in EXACT_KEY_STAGES:
+        with span(EXACT_KEY_SPANS[col], len(mp)):
+            index = KeyIndex(internal_df[col], (internal_df[col].str.len() > min_len).to_numpy(dtype=bool))
+            pos = index.lookup(mp[col])
+            rows = np.flatnonzero(open_ & (mp[col].str.len() > min_len).to_numpy(dtype=bool) & (pos >= 0))
+        stages.append((label, col, rows, pos[rows]))
+        open_[rows] = False
+    return stages, open_
+
+def supplier_matches(final, supplier_df, supplier_codes):
+    # Tedarikçi satırı önce eşleşen iç ürünün barkoduyla (supplier_df) bulunur; barkodu tutmayanlar match_code ile,
+    # aynı koddaki teklifler arasından tedarikçi sonucunun stratejisiyle seçilmiş satırdan (supplier_codes) alınır.
+    # (barkod konumları, kod konumları) döner; bulunamayan ya da barkodla bulunmuş satırın kod konumu -1
+    min_len = dict((c, n) for c, n, _ in EXACT_KEY_STAGES)['bk_norm']   # barkodsuz teklifler ('YOK') bu sınırın altında kalır
+    sup_bk = NORMALIZER.strict_column(supplier_df['barkod'])
+    int_bk = NORMALIZER.strict_column(final['barkod'].fillna('')) if 'barkod' in final.columns else pd.Series('', index=final.index)
+    bc_pos = KeyIndex(sup_bk, (sup_bk.str.len() > min_len).to_numpy()).lookup(int_bk.where(int_bk.str.len() > min_len, ''))
+    code_pos = np.where(bc_pos < 0, KeyIndex(supplier_codes['match_code']).lookup(final['match_code']), -1)
+    return bc_pos, code_pos
+
+def join_rows(left, right, left_pos, right_pos, on, suffix='_ic'):
+    # pd.merge(left, right, on=on, suffixes=('', suffix)) ile aynı kolon düzeninde, verilen satır çiftlerinden çerçeve
+    l = left.iloc[left_pos].reset_index(drop=True)
+    r = right.iloc[right_pos].drop(columns=[on]).reset_index(drop=True)
+    r.columns = [c + suffix if c in l.columns else c for c in r.columns]
+    return pd.concat([l, r], axis=1)
+
+def run_matching_job(job_id, ikey, skey, mp_path, mp_filename, tpl_n, stock_strat, price_strat, orphan_strat, smart_freeze, freeze_conf, brand_strat, include_orig, workers=None, raw_sheets=None, incremental=None):
+    # Aşama ölçümleri iş kaydına (detail.spans) ve /api/v1/metrics histogramlarına yazılır
+    spans = SpanRecorder()
+    prev_spans = spans.attach()
     try:
+        workers = resolve_workers(workers)
+        load_cached_rates()
         update_job_status(job_id, "running", 5, "Adım 1/5: Veri Setleri Yükleniyor...")
         
-        internal_df = pd.read_json(TEMP_RESULTS_DIR/f"internal_{ikey}.json")
+        sp = spans.phase('result_load')
+        internal_df = load_result_frame('internal', ikey, scaled={'Ic_Hazir_Fiyat': PRICE_SCALE})
         internal_df.columns=[c.lower() for c in internal_df.columns]
         
-        supplier_df = pd.read_json(TEMP_RESULTS_DIR/f"supplier_{skey}.json") if skey else pd.DataFrame()
+        supplier_df = load_result_frame('supplier', skey, scaled={'Maliyet': PRICE_SCALE, 'Ted_Hazir_Fiyat': PRICE_SCALE}) if skey else pd.DataFrame()
         if not supplier_df.empty: supplier_df.columns=[c.lower() for c in supplier_df.columns]
+        # Eski sonuçlarda match_code tablosu yoksa kod eşleşmesi seçilmiş tekliflerin ilk satırından yapılır
+        supplier_codes = supplier_df
+        if skey and (result_store_path('supplier_codes', skey) / "schema.json").exists():
+            supplier_codes = load_result_frame('supplier_codes', skey, scaled={'Maliyet': PRICE_SCALE, 'Ted_Hazir_Fiyat': PRICE_SCALE})
+            supplier_codes.columns = [c.lower() for c in supplier_codes.columns]
         
-        with open(TEMP_RESULTS_DIR/f"meta_internal_{ikey}.json") as f: meta_int = json.load(f)
+        meta_int = load_result_meta('internal', ikey)
+        sp['rows'] = len(internal_df) + len(supplier_df)
         
+        sp = spans.phase('file_read')
         mp_df = read_and_normalize_file(mp_path, mp_filename)
-        os.remove(mp_path)
+        sp['rows'] = len(mp_df)
         mp_tpl = load_template(tpl_n)
+        spans.phase('template_projection', len(mp_df))
         
         s_bc=mp_tpl.get('barcode'); s_sku=mp_tpl.get('sku'); s_stk=mp_tpl.get('stock_to_update'); s_prc=mp_tpl.get('current_price'); s_nam=mp_tpl.get('product_name'); s_brn=mp_tpl.get('brand')
         
@@ -765,70 +2971,75 @@ def run_matching_job(job_id, ikey, skey, mp_path, mp_filename, tpl_n, stock_stra
         else: mp['MP_SKU'] = 'YOK'
         if s_nam and s_nam in mp_df.columns: mp['MP_Urun_Adi'] = mp_df[s_nam].astype(str).fillna('')
         else: mp['MP_Urun_Adi'] = ''
-        if s_stk and s_stk in mp_df.columns: mp['MP_Eski_Stok'] = mp_df[s_stk].apply(parse_stock_value)
+        if s_stk and s_stk in mp_df.columns: mp['MP_Eski_Stok'] = parse_stock_column(mp_df[s_stk])
         else: mp['MP_Eski_Stok'] = 0
-        if s_prc and s_prc in mp_df.columns: mp['MP_Fiyat'] = mp_df[s_prc].apply(lambda x: decimal.Decimal(str(x).replace(',','.')) if pd.notna(x) and str(x).strip()!="" else decimal.Decimal(0))
-        else: mp['MP_Fiyat'] = decimal.Decimal(0)
+        if s_prc and s_prc in mp_df.columns: mp['MP_Fiyat'] = parse_money_column(mp_df[s_prc], KURUS_SCALE)
+        else: mp['MP_Fiyat'] = 0
         if s_brn and s_brn in mp_df.columns: mp['MP_Marka'] = mp_df[s_brn].astype(str).fillna('TANIMSIZ').str.upper()
         else: mp['MP_Marka'] = 'TANIMSIZ'
         mp['idx'] = mp.index
-        mp['bk_norm'] = mp['MP_Barkod'].apply(strict_normalize)
-        mp['sku_norm'] = mp['MP_SKU'].apply(strict_normalize)
-        internal_df['bk_norm'] = internal_df['barkod'].apply(strict_normalize)
-        internal_df['sku_norm'] = internal_df['anahtar_kod'].apply(strict_normalize)
+        mp['bk_norm'] = NORMALIZER.strict_column(mp['MP_Barkod'])
+        mp['sku_norm'] = NORMALIZER.strict_column(mp['MP_SKU'])
+        internal_df['bk_norm'] = NORMALIZER.strict_column(internal_df['barkod'])
+        internal_df['sku_norm'] = NORMALIZER.strict_column(internal_df['anahtar_kod'])
         
         results = []
-        processed = set()
         
         update_job_status(job_id, "running", 15, "Adım 2/5: Barkod ve SKU Taraması Yapılıyor...")
-        mp_valid = mp[mp['bk_norm'].str.len() > 4]
-        int_valid = internal_df[internal_df['bk_norm'].str.len() > 4]
-        if not mp_valid.empty and not int_valid.empty:
-            m1 = pd.merge(mp_valid, int_valid, on='bk_norm', how='inner', suffixes=('', '_ic'))
-            for _, r in m1.iterrows():
-                if r['idx'] not in processed:
-                    d = r.to_dict(); d['Eslestirme'] = 'Barkod'; results.append(d); processed.add(r['idx'])
-
-        rem = mp[~mp['idx'].isin(processed)]
-        rem_valid = rem[rem['sku_norm'].str.len() > 2]
-        int_valid_sku = internal_df[internal_df['sku_norm'].str.len() > 2]
-        if not rem_valid.empty and not int_valid_sku.empty:
-            m2 = pd.merge(rem_valid, int_valid_sku, on='sku_norm', how='inner', suffixes=('', '_ic'))
-            for _, r in m2.iterrows():
-                if r['idx'] not in processed:
-                    d = r.to_dict(); d['Eslestirme'] = 'SKU'; results.append(d); processed.add(r['idx'])
-
-        update_job_status(job_id, "running", 40, "Adım 3/5: Akıllı Eşleştirme Motoru (İsim Analizi)...")
-        remaining_mp = mp[~mp['idx'].isin(processed)].copy()
+        spans.phase('key_join', len(mp))
+        stages, open_ = exact_key_matches(mp, internal_df)
+        for label, col, mp_pos, int_pos in stages:
+            if not len(mp_pos): continue
+            with span(EXACT_KEY_SPANS[col]):
+                part = join_rows(mp, internal_df, mp_pos, int_pos, on=col)
+                part['Eslestirme'] = label
+            results.append(part)
+
+        stage3 = "Adım 3/5: Akıllı Eşleştirme Motoru (İsim Analizi)..."
+        update_job_status(job_id, "running", 40, stage3)
+        remaining_mp = mp[open_].copy()
+        spans.phase('matching', len(remaining_mp))
+        incremental = MATCH_INCREMENTAL if incremental is None else incremental
+        reused_rows = None
         if not remaining_mp.empty and not internal_df.empty:
-            matcher = UniversalSmartMatcher(internal_df, remaining_mp)
-            ai_results_df = matcher.run_engine()
+            matcher = UniversalSmartMatcher(internal_df, remaining_mp, index_key=ikey, workers=workers)
+            reuse = DeltaMatchState.load(tpl_n, matcher.INDEX_KEY) if incremental and matcher.INDEX_KEY else None
+            ai_results_df = matcher.run_engine(progress=StageProgress(job_id, 40, 59, stage3), reuse=reuse)
+            # Atamalar kalıcı indeksle her çalıştırmada saklanır; aynı şablon ve katalogla sonraki artımlı çalıştırma bunları kullanır
+            if matcher.assignments is not None and matcher.INDEX_KEY:
+                DeltaMatchState.save(tpl_n, matcher.INDEX_KEY, matcher.assignments, matcher.catalog_fp, matcher.engine_signature())
+            if incremental: reused_rows = matcher.reused
             if not ai_results_df.empty:
-                for _, row in ai_results_df.iterrows():
-                    if row['idx'] not in processed and row['Eslestirme'] != 'Eşleşmedi':
-                        d = row.to_dict(); results.append(d); processed.add(row['idx'])
-
-        unmatched = mp[~mp['idx'].isin(processed)]
-        for _, r in unmatched.iterrows():
-            d = r.to_dict(); d.update({'Eslestirme':'Eşleşmedi', 'nihai_stok':0, 'hesaplanan_stok':0, 'toplam_tedarikci_stok':0, 'maliyet':0, 'anahtar_kod':'YOK', 'marka':'YOK', 'ic_hazir_fiyat':0})
-            results.append(d)
+                accepted = (ai_results_df['Eslestirme'] != 'Eşleşmedi').to_numpy(dtype=bool)
+                if accepted.any():
+                    results.append(ai_results_df[accepted].reset_index(drop=True))
+                    open_[np.asarray(ai_results_df['idx'][accepted], dtype=np.int64)] = False
+
+        spans.phase('supplier_join', len(mp))
+        unmatched = mp[open_].reset_index(drop=True)
+        if not unmatched.empty:
+            for col, val in {'Eslestirme':'Eşleşmedi', 'nihai_stok':0, 'hesaplanan_stok':0, 'toplam_tedarikci_stok':0, 'maliyet':0, 'anahtar_kod':'YOK', 'marka':'YOK', 'ic_hazir_fiyat':0}.items():
+                unmatched[col] = val
+            results.append(unmatched)
             
-        final = pd.DataFrame(results)
+        final = pd.concat(results, ignore_index=True) if results else pd.DataFrame()
         
         if not supplier_df.empty:
             if 'match_code' not in final.columns: 
-                final['match_code'] = final['anahtar_kod'].apply(generate_match_code)
-            if 'match_code' not in supplier_df.columns:
-                supplier_df['match_code'] = supplier_df['anahtar_kod'].apply(generate_match_code)
-
-            sup_lookup = supplier_df[['match_code', 'toplam_tedarikci_stok', 'maliyet', 'marka', 'ted_hazir_fiyat']].rename(columns={'toplam_tedarikci_stok': 'sup_stok', 'maliyet': 'sup_maliyet', 'marka': 'sup_marka', 'ted_hazir_fiyat':'sup_hazir_fiyat'}).drop_duplicates(subset=['match_code'])
-            
-            final = pd.merge(final, sup_lookup, on='match_code', how='left')
-            final['toplam_tedarikci_stok'] = final['sup_stok'].fillna(0).astype(int)
-            final['maliyet'] = final['sup_maliyet'].fillna(0)
-            final['marka_ted'] = final['sup_marka'].fillna('TANIMSIZ')
-            final['Ted_Hazir_Fiyat'] = final['sup_hazir_fiyat'].fillna(0)
-            final.drop(columns=['sup_stok', 'sup_maliyet', 'sup_marka', 'sup_hazir_fiyat'], inplace=True)
+                final['match_code'] = NORMALIZER.match_code_column(final['anahtar_kod'])
+            for frame in (supplier_df, supplier_codes):
+                if 'match_code' not in frame.columns: frame['match_code'] = NORMALIZER.match_code_column(frame['anahtar_kod'])
+
+            bc_pos, code_pos = supplier_matches(final, supplier_df, supplier_codes)
+            by_bc, by_code = bc_pos >= 0, code_pos >= 0
+            def sup_col(col, default):
+                bc = supplier_df[col].to_numpy()[np.maximum(bc_pos, 0)]
+                code = supplier_codes[col].to_numpy()[np.maximum(code_pos, 0)]
+                return pd.Series(np.where(by_bc, bc, np.where(by_code, code, default)), index=final.index)
+            final['toplam_tedarikci_stok'] = sup_col('toplam_tedarikci_stok', 0).astype(int)
+            final['maliyet'] = sup_col('maliyet', 0).astype(np.int64)
+            final['marka_ted'] = sup_col('marka', 'TANIMSIZ')
+            final['Ted_Hazir_Fiyat'] = sup_col('ted_hazir_fiyat', 0).astype(np.int64)
         else: 
             final['toplam_tedarikci_stok'] = 0; final['maliyet'] = 0; final['marka_ted'] = 'TANIMSIZ'; final['Ted_Hazir_Fiyat'] = 0
         
@@ -836,9 +3047,10 @@ def run_matching_job(job_id, ikey, skey, mp_path, mp_filename, tpl_n, stock_stra
         final['marka_ted'] = final.get('marka_ted', pd.Series()).fillna('TANIMSIZ')
         final['MP_Marka'] = final.get('MP_Marka', pd.Series()).fillna('TANIMSIZ')
         final['MP_Eski_Stok'] = final.get('MP_Eski_Stok', pd.Series()).fillna(0).astype(int)
-        final['Ic_Hazir_Fiyat'] = final.get('ic_hazir_fiyat', pd.Series()).fillna(0).astype(float)
-        final['Ted_Hazir_Fiyat'] = final.get('Ted_Hazir_Fiyat', pd.Series()).fillna(0).astype(float)
+        final['Ic_Hazir_Fiyat'] = final.get('ic_hazir_fiyat', pd.Series()).fillna(0).astype(np.int64)
+        final['Ted_Hazir_Fiyat'] = final.get('Ted_Hazir_Fiyat', pd.Series()).fillna(0).astype(np.int64)
 
+        spans.phase('brand_resolve', len(final))
         def get_brand(r):
             if r['marka'] not in ['TANIMSIZ', 'YOK']: return r['marka']
             if r['marka_ted'] not in ['TANIMSIZ', 'YOK']: return r['marka_ted']
@@ -847,116 +3059,18 @@ def run_matching_job(job_id, ikey, skey, mp_path, mp_filename, tpl_n, stock_stra
         
         # --- NLP KURALLARINI PARSE ET ---
         update_job_status(job_id, "running", 60, "Adım 4/5: Akıllı Fiyat Hesaplama ve Kur Analizi...")
+        spans.phase('pricing', len(final))
         
         text_rules = price_strat.get('natural_language_text', '')
-        nlp_rules = parse_natural_language_rules(text_rules)
-        
-        def apply_vat(price, strategy):
-            if not strategy or not strategy.get('add_vat'): return price
-            try:
-                rate = decimal.Decimal(str(strategy.get('vat_rate', 20)))
-                return price * (1 + (rate / 100))
-            except: return price
-
-        def calc_p(r):
-            curr = decimal.Decimal(str(r.get('MP_Fiyat', 0)))
-            br = str(r.get('Nihai_Marka','')).upper()
-            prod_name = str(r.get('Urun_Adi','')).upper()
-            sku = str(r.get('MP_SKU')); bk = str(r.get('MP_Barkod'))
-            
-            if freeze_conf and (sku in freeze_conf.get('skus',[]) or bk in freeze_conf.get('barcodes',[])): 
-                return curr, "Manuel Dondurma"
-            
-            method = price_strat.get('method', 'calculated')
-            base_price = decimal.Decimal(0)
-            note = ""
-            
-            if method == 'stock_only':
-                base_price = curr
-                note = "Pazaryeri Fiyatı"
-            else:
-                source = price_strat.get('source', 'cost')
-                if source == 'internal': 
-                    base_price = decimal.Decimal(str(r.get('Ic_Hazir_Fiyat', 0)))
-                    note = "İç Liste"
-                elif source == 'supplier': 
-                    base_price = decimal.Decimal(str(r.get('Ted_Hazir_Fiyat', 0)))
-                    note = "Ted. Liste"
-                elif source == 'cost': 
-                    base_price = decimal.Decimal(str(r.get('maliyet', 0)))
-                    note = "Maliyet"
-            
-            if base_price <= 0 and method != 'stock_only' and source != 'cost':
-                   return (curr, "Kaynak Fiyat Yok") if curr > 0 else (decimal.Decimal(0), "Fiyat Yok")
-
-            candidate_price = decimal.Decimal(0)
-            
-            if method == 'stock_only':
-                candidate_price = base_price
-            elif method == 'ready_list':
-                candidate_price = base_price
-            else: # calculated
-                if base_price > 0:
-                    candidate_price = base_price * decimal.Decimal(str(price_strat.get('default_multiplier',1.5))) + decimal.Decimal(str(price_strat.get('default_addition',0)))
-                else:
-                    note = "Maliyet Yok"
-
-            if candidate_price > 0 or any(rule['action'] == 'fix_price' for rule in nlp_rules):
-                for rule in nlp_rules:
-                    is_match = False
-                    if rule['target'] == "ALL_PRODUCTS": is_match = True
-                    elif rule['target'] in br: is_match = True
-                    elif rule['target'] in prod_name: is_match = True
-                    elif rule['target'] in sku: is_match = True 
-                    
-                    if not is_match: continue
-                    
-                    if rule['action'] == 'fx_conversion':
-                        if rule['old_rate'] and rule['old_rate'] > 0:
-                            rate_curr = rule['currency'] if rule['currency'] else 'USD'
-                            new_rate = EXCHANGE_RATES.get(rate_curr, 1)
-                            candidate_price = (candidate_price / rule['old_rate']) * new_rate
-                            note += f" + Kur Farkı ({rate_curr})"
-
-                    elif rule['action'] == 'fx_index':
-                        rate_curr = rule['currency'] if rule['currency'] else 'USD'
-                        rate = EXCHANGE_RATES.get(rate_curr, 1)
-                        candidate_price = base_price * rate
-                        note = f"Döviz Endeksli ({rate_curr})"
-                        
-                    elif rule['action'] == 'multiplier':
-                        if rule['value'] > 1 or rule['value'] < 1: 
-                            candidate_price = candidate_price * rule['value']
-                        else: 
-                            candidate_price = candidate_price + rule['value']
-                        note += f" + NLP ({rule['target']})"
-
-                    elif rule['action'] == 'fix_price':
-                        p_val = rule['value']
-                        if rule['currency'] and rule['currency'] != 'TRY':
-                            rate = EXCHANGE_RATES.get(rule['currency'], 1)
-                            p_val = p_val * rate
-                        candidate_price = p_val
-                        note = f"Sabit Fiyat ({rule['target']})"
-
-            if candidate_price > 0:
-                candidate_price = apply_vat(candidate_price, price_strat)
-
-            if candidate_price <= 0:
-                return (curr, "Fiyat Korundu") if curr > 0 else (decimal.Decimal(0), note)
-
-            final_p = candidate_price.quantize(TWOPLACES)
-
-            if smart_freeze and curr > 0:
-                if final_p < curr:
-                    return curr, "Donduruldu (Düşüş Engellendi)"
-            
-            if final_p == curr: return curr, "Değişim Yok"
-            return final_p, note
+        rule_plan = PriceRulePlan(parse_natural_language_rules(text_rules))
         
-        pres = final.apply(calc_p, axis=1, result_type='expand')
-        final['Satis_Fiyati'] = pres[0]; final['Fiyat_Durumu'] = pres[1]
+        price_parts = parallel_map(lambda part: calculate_prices(part, price_strat, rule_plan, freeze_conf, smart_freeze), split_frame(final, workers), workers)
+        pres = pd.concat(price_parts)
+        final['Satis_Fiyati'] = pres['Satis_Fiyati']; final['Fiyat_Durumu'] = pres['Fiyat_Durumu']
+        # Fiyatlama girdisi simülasyon (/api/v1/simulate_nlp?job_id=...) için saklanır
+        pricing_in = final[[c for c in SIMULATION_COLUMNS if c in final.columns]]
         
+        spans.phase('stock', len(final))
         def calc_s(r):
             try:
                 i = int(float(str(r.get('nihai_stok',0) or 0)))
@@ -977,12 +3091,13 @@ def run_matching_job(job_id, ikey, skey, mp_path, mp_filename, tpl_n, stock_stra
             return r['Fiyat_Durumu']
         final['Durum'] = final.apply(get_stat, axis=1)
         
+        spans.phase('report_prep', len(final))
         orig_out = None
         if include_orig:
             orig_out = mp_df.copy()
             lookup = final.drop_duplicates(subset=['MP_SKU']).set_index('MP_SKU')[['Satis_Fiyati', 'Gonderilecek_Stok']]
             orig_out['__sku'] = orig_out[s_sku].astype(str).str.strip()
-            orig_out[s_prc] = orig_out['__sku'].map(lookup['Satis_Fiyati']).fillna(orig_out[s_prc]).apply(lambda x: float(x) if isinstance(x, decimal.Decimal) else x)
+            orig_out[s_prc] = orig_out['__sku'].map(lookup['Satis_Fiyati'] / 10 ** KURUS_SCALE).astype(object).fillna(orig_out[s_prc])
             orig_out[s_stk] = orig_out['__sku'].map(lookup['Gonderilecek_Stok']).fillna(orig_out[s_stk])
             orig_out.drop(columns=['__sku'], inplace=True)
         
@@ -991,9 +3106,13 @@ def run_matching_job(job_id, ikey, skey, mp_path, mp_filename, tpl_n, stock_stra
         cols_to_drop = ['tokens', 'idx', 'name_len', 'bk_norm', 'sku_norm', 'sup_stok', 'sup_maliyet', 'sup_marka', 'norm_name', 'ic_hazir_fiyat', 'Ted_Hazir_Fiyat', 'match_code']
         final_clean = final.drop(columns=[c for c in cols_to_drop if c in final.columns], errors='ignore')
 
-        for col in ['Satis_Fiyati', 'Eski_Fiyat', 'Maliyet']:
+        # Para kolonları rapor için yalnızca burada float'a çevrilir
+        for col, scale in [('Satis_Fiyati', KURUS_SCALE), ('Eski_Fiyat', KURUS_SCALE), ('Maliyet', PRICE_SCALE), ('Ic_Hazir_Fiyat', PRICE_SCALE)]:
             if col in final_clean.columns:
-                final_clean[col] = final_clean[col].apply(lambda x: float(x) if isinstance(x, decimal.Decimal) else x)
+                final_clean[col] = Money(final_clean[col].to_numpy(dtype=np.int64), scale).to_float()
+        for frame, cols in [(internal_df, ['ic_hazir_fiyat']), (supplier_df, ['maliyet', 'ted_hazir_fiyat'])]:
+            for col in cols:
+                if col in frame.columns: frame[col] = Money(frame[col].to_numpy(dtype=np.int64), PRICE_SCALE).to_float()
 
         matched_mp_only = final_clean[final_clean['Kaynak_Kod'] != 'YOK']
         unmatched_mp_only = final_clean[final_clean['Kaynak_Kod'] == 'YOK']
@@ -1012,45 +3131,82 @@ def run_matching_job(job_id, ikey, skey, mp_path, mp_filename, tpl_n, stock_stra
         matched_mp_only = matched_mp_only.sort_values(by=['SortKey']).drop(columns=['SortKey'])
         
         update_job_status(job_id, "running", 95, "Adım 5/5: Excel Raporu Yazılıyor...")
+        sp = spans.phase('excel_write')
+        
+        raw_mode = raw_sheets if raw_sheets in ('xlsx', 'csv', 'skip') else REPORT_RAW_SHEETS
+        raw = [('5. Pazaryeri Ham', 'pazaryeri_ham', mp_df),
+               ('6. İç Stok Ham', 'ic_stok_ham', internal_df.drop(columns=['bk_norm', 'sku_norm', 'norm_name', 'match_code'], errors='ignore'))]
+        if not supplier_df.empty: raw.append(('7. Tedarikçi Ham', 'tedarikci_ham', supplier_df.drop(columns=['bk_norm', 'sku_norm', 'match_code'], errors='ignore')))
         
         out_file = TEMP_RESULTS_DIR / f"{job_id}.xlsx"
-        with pd.ExcelWriter(out_file, engine='openpyxl') as writer:
-            summary_data = []
-            
-            summary_data.append({'Kategori': '!!! YASAL UYARI !!!', 'Açıklama': 'SORUMLULUK REDDİ', 'Değer': 'Bu yazılım karar destek amaçlıdır. Stokçu, fiyat ve stok güncellemelerinde %100 doğruluk garantisi vermez. Lütfen yükleme yapmadan önce verileri kontrol ediniz.'})
-            summary_data.append({'Kategori': 'BİLGİLENDİRME', 'Açıklama': 'Doğruluk Payı', 'Değer': 'Rapordaki "Algoritma Skoru" (0-100) eşleşme güvenini temsil eder. Düşük puanlı ürünleri manuel kontrol ediniz.'})
-            summary_data.append({'Kategori': ' ', 'Açıklama': ' ', 'Değer': ' '})
-
-            summary_data.append({'Kategori': 'İSTATİSTİK', 'Açıklama': 'Yüklenen Pazaryeri Listesi (Adet)', 'Değer': len(mp_df)})
-            summary_data.append({'Kategori': 'İSTATİSTİK', 'Açıklama': 'BAŞARILI EŞLEŞME (Yeşil Sayfa)', 'Değer': len(matched_mp_only)})
-            summary_data.append({'Kategori': 'İSTATİSTİK', 'Açıklama': 'EŞLEŞMEYEN (Kırmızı Sayfa)', 'Değer': len(unmatched_mp_only)})
-            summary_data.append({'Kategori': 'İSTATİSTİK', 'Açıklama': 'Bizde Olup MP\'de Olmayanlar', 'Değer': len(missing_in_mp)})
-            
-            summary_data.append({'Kategori': ' ', 'Açıklama': ' ', 'Değer': ' '}) 
-            summary_data.append({'Kategori': 'SÖZLÜK', 'Açıklama': 'MP_ (Prefix)', 'Değer': 'Pazaryeri (Marketplace) dosyasından gelen orijinal veriler.'})
-            summary_data.append({'Kategori': 'SÖZLÜK', 'Açıklama': 'Ic_ (Prefix)', 'Değer': 'Sizin yüklediğiniz İç Stok (Depo) verileri.'})
-            summary_data.append({'Kategori': 'SÖZLÜK', 'Açıklama': 'Ted_ (Prefix)', 'Değer': 'Tedarikçi listelerinden gelen veriler.'})
-            summary_data.append({'Kategori': 'SÖZLÜK', 'Açıklama': 'Satis_Fiyati', 'Değer': 'Hesaplanan yeni satış fiyatı.'})
-            summary_data.append({'Kategori': 'SÖZLÜK', 'Açıklama': 'Gonderilecek_Stok', 'Değer': 'Pazaryerine gönderilecek nihai stok miktarı.'})
-            summary_data.append({'Kategori': 'SÖZLÜK', 'Açıklama': 'Algoritma Skoru', 'Değer': 'Ürün isim ve özellik benzerlik oranı (100 = Tam Eşleşme).'})
-
-            pd.DataFrame(summary_data).to_excel(writer, sheet_name='1. Genel Özet', index=False)
-            matched_mp_only.to_excel(writer, sheet_name='2. Eşleşenler (Yeşil)', index=False)
-            unmatched_mp_only.to_excel(writer, sheet_name='3. Eşleşmeyenler (Kırmızı)', index=False)
-            missing_in_mp.to_excel(writer, sheet_name='4. Bizde Var MP Yok', index=False)
-            mp_df.to_excel(writer, sheet_name='5. Pazaryeri Ham', index=False)
-            internal_df.drop(columns=['bk_norm', 'sku_norm', 'norm_name', 'match_code'], errors='ignore').to_excel(writer, sheet_name='6. İç Stok Ham', index=False)
-            if not supplier_df.empty: supplier_df.drop(columns=['bk_norm', 'sku_norm', 'match_code'], errors='ignore').to_excel(writer, sheet_name='7. Tedarikçi Ham', index=False)
-            if orig_out is not None: orig_out.to_excel(writer, sheet_name='OPSİYONEL - Yükleme Formatı', index=False)
+        summary_data = []
         
-        update_job_status(job_id, "completed", 100, "Tamamlandı.", result_file=f"{job_id}.xlsx")
+        summary_data.append({'Kategori': '!!! YASAL UYARI !!!', 'Açıklama': 'SORUMLULUK REDDİ', 'Değer': 'Bu yazılım karar destek amaçlıdır. Stokçu, fiyat ve stok güncellemelerinde %100 doğruluk garantisi vermez. Lütfen yükleme yapmadan önce verileri kontrol ediniz.'})
+        summary_data.append({'Kategori': 'BİLGİLENDİRME', 'Açıklama': 'Doğruluk Payı', 'Değer': 'Rapordaki "Algoritma Skoru" (0-100) eşleşme güvenini temsil eder. Düşük puanlı ürünleri manuel kontrol ediniz.'})
+        summary_data.append({'Kategori': ' ', 'Açıklama': ' ', 'Değer': ' '})
+
+        summary_data.append({'Kategori': 'İSTATİSTİK', 'Açıklama': 'Yüklenen Pazaryeri Listesi (Adet)', 'Değer': len(mp_df)})
+        summary_data.append({'Kategori': 'İSTATİSTİK', 'Açıklama': 'BAŞARILI EŞLEŞME (Yeşil Sayfa)', 'Değer': len(matched_mp_only)})
+        summary_data.append({'Kategori': 'İSTATİSTİK', 'Açıklama': 'EŞLEŞMEYEN (Kırmızı Sayfa)', 'Değer': len(unmatched_mp_only)})
+        summary_data.append({'Kategori': 'İSTATİSTİK', 'Açıklama': 'Bizde Olup MP\'de Olmayanlar', 'Değer': len(missing_in_mp)})
+        if reused_rows is not None: summary_data.append({'Kategori': 'İSTATİSTİK', 'Açıklama': 'Önceki Çalıştırmadan Alınan İsim Eşleştirmesi (Artımlı)', 'Değer': reused_rows})
         
+        summary_data.append({'Kategori': ' ', 'Açıklama': ' ', 'Değer': ' '}) 
+        summary_data.append({'Kategori': 'SÖZLÜK', 'Açıklama': 'MP_ (Prefix)', 'Değer': 'Pazaryeri (Marketplace) dosyasından gelen orijinal veriler.'})
+        summary_data.append({'Kategori': 'SÖZLÜK', 'Açıklama': 'Ic_ (Prefix)', 'Değer': 'Sizin yüklediğiniz İç Stok (Depo) verileri.'})
+        summary_data.append({'Kategori': 'SÖZLÜK', 'Açıklama': 'Ted_ (Prefix)', 'Değer': 'Tedarikçi listelerinden gelen veriler.'})
+        summary_data.append({'Kategori': 'SÖZLÜK', 'Açıklama': 'Satis_Fiyati', 'Değer': 'Hesaplanan yeni satış fiyatı.'})
+        summary_data.append({'Kategori': 'SÖZLÜK', 'Açıklama': 'Gonderilecek_Stok', 'Değer': 'Pazaryerine gönderilecek nihai stok miktarı.'})
+        summary_data.append({'Kategori': 'SÖZLÜK', 'Açıklama': 'Algoritma Skoru', 'Değer': 'Ürün isim ve özellik benzerlik oranı (100 = Tam Eşleşme).'})
+
+        sidecars = []
+        if raw_mode == 'csv':
+            for _, slug, frame in raw:
+                name = f"{job_id}_{slug}.csv.gz"
+                write_csv_sidecar(TEMP_RESULTS_DIR / name, frame)
+                sidecars.append(name)
+            summary_data.append({'Kategori': 'BİLGİLENDİRME', 'Açıklama': 'Ham Veriler', 'Değer': 'Ham veri sayfaları ayrı .csv.gz dosyaları olarak indirilebilir: ' + ', '.join(sidecars)})
+
+        sheets = [('1. Genel Özet', pd.DataFrame(summary_data)),
+                  ('2. Eşleşenler (Yeşil)', matched_mp_only),
+                  ('3. Eşleşmeyenler (Kırmızı)', unmatched_mp_only),
+                  ('4. Bizde Var MP Yok', missing_in_mp)]
+        if raw_mode == 'xlsx': sheets += [(title, frame) for title, _, frame in raw]
+        if orig_out is not None: sheets.append(('OPSİYONEL - Yükleme Formatı', orig_out))
+        write_xlsx_report(out_file, sheets)
+        sp['rows'] = sum(len(frame) for _, frame in sheets)
+        # Yükleme dosyası ve eşleşen/eşleşmeyen kümeler CSV/JSONL indirmeleri için kolonsal olarak saklanır
+        parts = {'upload': orig_out, 'matched': matched_mp_only, 'unmatched': unmatched_mp_only}
+        spans.phase('result_save', sum(len(f) for f in parts.values() if f is not None))
+        for part, frame in parts.items():
+            if frame is not None: save_result_frame(f"job_{part}", job_id, frame)
+        save_result_frame('job_pricing', job_id, pricing_in, meta={"price_strategy": price_strat, "freeze": freeze_conf, "smart_freeze": bool(smart_freeze)},
+                          scales={c: sc for c, sc in SIMULATION_SCALES.items() if c in pricing_in.columns})
+        result_detail = {"parts": [p for p, f in parts.items() if f is not None]}
+        if sidecars: result_detail["sidecars"] = sidecars
+        spans.close()
+        result_detail["spans"] = spans.summary()
+        
+        update_job_status(job_id, "completed", 100, "Tamamlandı.", result_file=f"{job_id}.xlsx", detail=result_detail)
+        record_stage_metrics('match', result_detail["spans"], 'completed')
+        
+    except JobCancelled:
+        spans.close()
+        update_job_status(job_id, "cancelled", 0, "İptal edildi.")
+        record_stage_metrics('match', spans.summary(), 'cancelled')
     except Exception as e:
         traceback.print_exc()
-        update_job_status(job_id, "error", 0, "Hata oluştu", error=str(e))
+        spans.close()
+        update_job_status(job_id, "error", 0, "Hata oluştu", error=str(e), detail={"spans": spans.summary()})
+        record_stage_metrics('match', spans.summary(), 'error')
+    finally:
+        # Yükleme iş bitene kadar tutulur; süreç iş ortasında ölürse iş yeniden kuyruğa alınıp baştan çalışabilir
+        if mp_path and os.path.exists(mp_path): os.remove(mp_path)
+        spans.detach(prev_spans)
 
 @app.route('/api/v1/calculate_stock', methods=['POST'])
 def api_calculate_stock():
+    spans = SpanRecorder()
     try:
         uploaded_files = request.files.getlist('files')
         template_names = request.form.get('template_names', '').split(',')
@@ -1063,67 +3219,106 @@ def api_calculate_stock():
             amt = decimal.Decimal(request.form.get('security_amount', 0))
 
         processed_files = []
-        for i, f in enumerate(uploaded_files):
-            t_path = tempfile.NamedTemporaryFile(delete=False, suffix=Path(f.filename).suffix).name
-            f.save(t_path)
-            
-            tpl_name = template_names[i] if i < len(template_names) else ""
-            tpl = load_template(tpl_name)
-            
-            df = read_and_normalize_file(t_path, f.filename)
-            os.remove(t_path)
-            
-            label = labels[i] if i < len(labels) else "+"
-            processed_files.append({
-                'dataframe': df,
-                'template': tpl,
-                'label': label,
-                'filename': f.filename
-            })
-
-        result_df, meta = calculate_internal_stock(processed_files, thr, amt)
+        temp_paths = []
+        try:
+            for i, f in enumerate(uploaded_files):
+                t_path = tempfile.NamedTemporaryFile(delete=False, suffix=Path(f.filename).suffix).name
+                f.save(t_path)
+                temp_paths.append(t_path)
+                
+                tpl_name = template_names[i] if i < len(template_names) else ""
+                tpl = load_template(tpl_name)
+                
+                label = labels[i] if i < len(labels) else "+"
+                processed_files.append({
+                    'path': t_path,
+                    'columns': template_columns(tpl),
+                    'template': tpl,
+                    'label': label,
+                    'filename': f.filename
+                })
+
+            with spans.active():
+                sp = spans.phase('ingest')
+                result_df, meta = calculate_internal_stock(processed_files, thr, amt, request.form.get('workers'))
+                sp['rows'] = sum(m["rows"] for m in meta.values())
+                key = str(uuid.uuid4())
+                spans.phase('result_save', len(result_df))
+                save_result_frame('internal', key, result_df, meta=meta, scales={'Ic_Hazir_Fiyat': PRICE_SCALE})
+        finally:
+            for t_path in temp_paths:
+                if os.path.exists(t_path): os.remove(t_path)
         
-        key = str(uuid.uuid4())
-        result_df.to_json(TEMP_RESULTS_DIR / f"internal_{key}.json")
-        with open(TEMP_RESULTS_DIR / f"meta_internal_{key}.json", 'w') as f:
-            json.dump(meta, f)
-            
-        return jsonify({"result_key": key})
+        record_stage_metrics('internal', spans.summary(), 'completed')
+        return jsonify({"result_key": key, "files": meta})
 
     except Exception as e:
         traceback.print_exc()
+        record_stage_metrics('internal', spans.summary(), 'error')
         return jsonify({"hata": str(e)}), 500
 
 @app.route('/api/v1/consolidate_suppliers', methods=['POST'])
 def api_consolidate_suppliers():
+    spans = SpanRecorder()
     try:
         uploaded_files = request.files.getlist('files')
         template_names = request.form.get('template_names', '').split(',')
         
         processed_files = []
-        for i, f in enumerate(uploaded_files):
-            t_path = tempfile.NamedTemporaryFile(delete=False, suffix=Path(f.filename).suffix).name
-            f.save(t_path)
-            
-            tpl_name = template_names[i] if i < len(template_names) else ""
-            tpl = load_template(tpl_name)
-            
-            df = read_and_normalize_file(t_path, f.filename)
-            os.remove(t_path)
-            
-            processed_files.append({
-                'dataframe': df,
-                'template': tpl,
-                'filename': f.filename
-            })
-            
-        result_df, meta = consolidate_suppliers(processed_files)
-        
-        key = str(uuid.uuid4())
-        result_df.to_json(TEMP_RESULTS_DIR / f"supplier_{key}.json")
+        temp_paths = []
+        try:
+            for i, f in enumerate(uploaded_files):
+                t_path = tempfile.NamedTemporaryFile(delete=False, suffix=Path(f.filename).suffix).name
+                f.save(t_path)
+                temp_paths.append(t_path)
+                
+                tpl_name = template_names[i] if i < len(template_names) else ""
+                tpl = load_template(tpl_name)
+                
+                processed_files.append({
+                    'path': t_path,
+                    'columns': template_columns(tpl),
+                    'template': tpl,
+                    'filename': f.filename
+                })
+                
+            strategy = request.form.get('offer_strategy') or SUPPLIER_OFFER_STRATEGY
+            if strategy not in SUPPLIER_OFFER_STRATEGIES: return jsonify({"hata": f"Geçersiz teklif stratejisi: {strategy}"}), 400
+            preferred = request.form.get('preferred_suppliers', '').split(',')
+            load_cached_rates()
+            with spans.active():
+                sp = spans.phase('ingest')
+                result_df, offers, meta = consolidate_suppliers(processed_files, request.form.get('workers'), strategy, preferred)
+                sp['rows'] = sum(m["rows"] for m in meta.values())
+                key = str(uuid.uuid4())
+                spans.phase('result_save', len(result_df))
+                save_supplier_result(key, result_df, offers, meta, strategy, preferred)
+        finally:
+            for t_path in temp_paths:
+                if os.path.exists(t_path): os.remove(t_path)
         
-        return jsonify({"result_key": key})
+        record_stage_metrics('supplier', spans.summary(), 'completed')
+        return jsonify({"result_key": key, "files": meta, **offer_summary(offers, strategy)})
+
+    except Exception as e:
+        traceback.print_exc()
+        record_stage_metrics('supplier', spans.summary(), 'error')
+        return jsonify({"hata": str(e)}), 500
 
+@app.route('/api/v1/consolidate_suppliers/<key>/select', methods=['POST'])
+def api_select_supplier_offers(key):
+    # Saklanan teklif tablosundan dosyaları yeniden okumadan başka bir stratejiyle seçim yapar; sonuç yeni anahtarla kaydedilir
+    try:
+        strategy = request.form.get('offer_strategy') or SUPPLIER_OFFER_STRATEGY
+        if strategy not in SUPPLIER_OFFER_STRATEGIES: return jsonify({"hata": f"Geçersiz teklif stratejisi: {strategy}"}), 400
+        if not (result_store_path('supplier_offers', key) / "schema.json").exists(): return jsonify({"hata": "Teklif tablosu bulunamadı."}), 404
+        offers = load_result_frame('supplier_offers', key, scaled={'Maliyet': PRICE_SCALE, 'Ted_Hazir_Fiyat': PRICE_SCALE})
+        meta = load_result_meta('supplier_offers', key)
+        preferred = request.form.get('preferred_suppliers', '').split(',')
+        result_df = select_best_offers(offers, strategy, preferred)
+        new_key = str(uuid.uuid4())
+        save_supplier_result(new_key, result_df, offers, meta, strategy, preferred)
+        return jsonify({"result_key": new_key, "files": meta, **offer_summary(offers, strategy)})
     except Exception as e:
         traceback.print_exc()
         return jsonify({"hata": str(e)}), 500
@@ -1157,47 +3352,124 @@ def step3_async():
         else:
             price_strat['add_vat'] = False
 
-        args = (
-            job_id,
-            request.form.get('internal_stock_key'),
-            request.form.get('supplier_stock_key'),
-            "", 
-            request.files.get('marketplace_file').filename,
-            request.form.get('template_name'),
-            request.form.get('stock_strategy'),
-            price_strat,
-            request.form.get('orphan_strategy'),
-            request.form.get('smart_freeze') == 'true',
-            json.loads(request.form.get('freeze_config_json', '{}')),
-            request.form.get('brand_extraction_strategy'),
-            request.form.get('include_original_format') == 'true'
+        kwargs = dict(
+            ikey=request.form.get('internal_stock_key'),
+            skey=request.form.get('supplier_stock_key'),
+            mp_filename=request.files.get('marketplace_file').filename,
+            tpl_n=request.form.get('template_name'),
+            stock_strat=request.form.get('stock_strategy'),
+            price_strat=price_strat,
+            orphan_strat=request.form.get('orphan_strategy'),
+            smart_freeze=request.form.get('smart_freeze') == 'true',
+            freeze_conf=json.loads(request.form.get('freeze_config_json', '{}')),
+            brand_strat=request.form.get('brand_extraction_strategy'),
+            include_orig=request.form.get('include_original_format') == 'true',
+            workers=request.form.get('workers'),
+            raw_sheets=request.form.get('raw_sheets'),
+            incremental={'true': True, 'false': False}.get(request.form.get('incremental'))
         )
+        if job_queue_full(): return jsonify({"hata": "İş kuyruğu dolu, lütfen daha sonra tekrar deneyin."}), 429
         mp = request.files.get('marketplace_file')
-        t_path = tempfile.NamedTemporaryFile(delete=False, suffix=Path(mp.filename).suffix).name
+        # Dosya kuyruk dizinine yazılır: ayrı worker süreci de aynı dizini görür
+        t_path = str(JOB_QUEUE_DIR / f"{job_id}{Path(mp.filename).suffix}")
         mp.save(t_path)
-        args_list = list(args)
-        args_list[3] = t_path
-        thread = threading.Thread(target=run_matching_job, args=tuple(args_list))
-        thread.start()
-        return jsonify({"job_id": job_id})
+        priority = parse_job_priority(request.form.get('priority'))
+        if not enqueue_job(job_id, t_path, kwargs, priority):
+            os.remove(t_path)
+            return jsonify({"hata": "İş kuyruğu dolu, lütfen daha sonra tekrar deneyin."}), 429
+        return jsonify({"job_id": job_id, "queue_position": queue_position(job_id)})
+    except Exception as e:
+        return jsonify({"hata": str(e)}), 500
+
+@app.route('/api/v1/jobs', methods=['GET'])
+def list_jobs():
+    try:
+        expire_jobs()
+        scope = request.args.get('scope', 'recent')
+        limit = min(max(int(request.args.get('limit', 50)), 1), 500)
+        jobs = JOB_STORE.list(JOB_ACTIVE_STATUSES if scope == 'active' else None, limit)
+        for j in jobs:
+            if j.get("status") == "queued": j["queue_position"] = queue_position(j["job_id"])
+        return jsonify({"jobs": jobs})
     except Exception as e:
         return jsonify({"hata": str(e)}), 500
 
 @app.route('/api/v1/jobs/<job_id>', methods=['GET'])
 def get_job_status(job_id):
     try:
-        p = JOBS_DIR / f"{job_id}.json"
-        if not p.exists(): return jsonify({"status": "not_found"}), 404
-        with open(p, 'r') as f: return jsonify(json.load(f))
+        data = read_job_status(job_id)
+        if data is None: return jsonify({"status": "not_found"}), 404
+        if data.get("status") == "queued": data["queue_position"] = queue_position(job_id)
+        return jsonify(data)
     except: return jsonify({"status": "error"}), 500
 
+@app.route('/api/v1/jobs/<job_id>/events', methods=['GET'])
+def job_events(job_id):
+    # Server-sent events: durum her değiştiğinde "progress", iş bitince "end" olayı gönderilir.
+    # Bağlantı JOB_EVENTS_MAX_S sonra kapanır, EventSource kendiliğinden yeniden bağlanır.
+    if read_job_status(job_id) is None: return jsonify({"status": "not_found"}), 404
+    def stream():
+        yield "retry: 2000\n\n"
+        last, started, idle = None, time.time(), 0.0
+        while time.time() - started < JOB_EVENTS_MAX_S:
+            data = read_job_status(job_id)
+            if data is None:
+                yield 'event: end\ndata: {"status": "not_found"}\n\n'
+                return
+            if data.get("status") == "queued": data["queue_position"] = queue_position(job_id)
+            key = (data.get("timestamp"), data.get("queue_position"))
+            if key != last:
+                last, idle = key, 0.0
+                yield f"event: progress\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+                if data.get("status") not in JOB_ACTIVE_STATUSES:
+                    yield f"event: end\ndata: {json.dumps({'status': data.get('status')})}\n\n"
+                    return
+            elif idle >= 15:
+                idle = 0.0
+                yield ": ping\n\n"
+            time.sleep(JOB_EVENTS_POLL_S)
+            idle += JOB_EVENTS_POLL_S
+    return Response(stream(), mimetype='text/event-stream', headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.route('/api/v1/jobs/<job_id>', methods=['DELETE'])
+def delete_job(job_id):
+    try:
+        status = cancel_job(job_id)
+        if status is None: return jsonify({"status": "not_found"}), 404
+        if status == "cancelled": return jsonify({"status": "cancelled"})
+        if status == "cancelling": return jsonify({"status": "cancelling"}), 202
+        return jsonify({"hata": "İş zaten sonlanmış.", "status": status}), 409
+    except Exception as e:
+        return jsonify({"hata": str(e)}), 500
+
 @app.route('/api/v1/download/<job_id>', methods=['GET'])
 def download_result(job_id):
+    # ?part=upload|matched|unmatched&format=csv|csv.gz|jsonl: parça saklanan kolonsal sonuçtan akıtılarak üretilir
+    part, fmt = request.args.get('part'), request.args.get('format')
+    if part or fmt:
+        part, fmt = part or 'upload', fmt or 'csv'
+        if part not in JOB_RESULT_PARTS or fmt not in EXPORT_FORMATS: return jsonify({"hata": "Geçersiz parça veya biçim."}), 400
+        data = read_job_status(job_id)
+        if data is None or part not in (data.get("detail") or {}).get("parts", []): return "Dosya yok", 404
+        if not (result_store_path(f"job_{part}", job_id) / "schema.json").exists(): return "Dosya yok", 404
+        df = load_result_frame(f"job_{part}", job_id)
+        mimetype, ext = EXPORT_FORMATS[fmt]
+        name = f"Stokcu_{part}_{datetime.now().strftime('%H%M')}.{ext}"
+        return Response(iter_export(df, fmt), mimetype=mimetype, headers={"Content-Disposition": f"attachment; filename={name}"})
     p = TEMP_RESULTS_DIR / f"{job_id}.xlsx"
     if p.exists():
         return send_file(p, download_name=f"Stokcu_Raporu_{datetime.now().strftime('%H%M')}.xlsx", as_attachment=True)
     return "Dosya yok", 404
 
+@app.route('/api/v1/download/<job_id>/<name>', methods=['GET'])
+def download_sidecar(job_id, name):
+    # Yalnızca işin kaydında listelenen ek dosyalar indirilebilir
+    data = read_job_status(job_id)
+    if data is None or name not in (data.get("detail") or {}).get("sidecars", []): return "Dosya yok", 404
+    p = TEMP_RESULTS_DIR / name
+    if not p.exists(): return "Dosya yok", 404
+    return send_file(p, download_name=name, as_attachment=True, mimetype='application/gzip')
+
 @app.route('/api/v1/download_template/freeze', methods=['GET'])
 def get_freeze_template():
     try:
@@ -1215,5 +3487,14 @@ def static_proxy(path):
     if not (STATIC_DIR / path).exists(): return send_from_directory(STATIC_DIR, 'index.html')
     return send_from_directory(STATIC_DIR, path)
 
+def run_job_worker():
+    print(f"Is kuyrugu worker sureci baslatildi ({JOB_WORKERS} slot).", flush=True)
+    start_reclaim()
+    start_job_workers()
+    if RATES_REFRESHER: start_rate_refresher()
+    _BACKGROUND_STATE["pid"] = os.getpid()
+    while True: time.sleep(3600)
+
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5000)
+    if sys.argv[1:2] == ['worker']: run_job_worker()
+    else: app.run(host='0.0.0.0', port=5000)
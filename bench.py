@@ -0,0 +1,388 @@
+# -*- coding: utf-8 -*-
+"""Stokçu kıyaslama (benchmark) takımı.
+
+Sentetik ama gerçekçi bir Türkçe el aleti kataloğu üretir (brands.json markaları, model kodları, set adetleri,
+birimler, EAN-13 barkodlar, TRY/USD/EUR tedarikçi fiyatları, şablon biçiminde kolonlar) ve boru hattının her
+aşamasını ayrı bir süreçte çalıştırıp süre ve bellek tepe değerini ölçer:
+
+    python bench.py run --sizes 1k,10k,100k,500k --out rapor.json
+    python bench.py compare eski.json yeni.json [--fail-above 1.25]
+
+Aşamalar: generate, calculate_internal_stock, consolidate_suppliers, run_matching_job (run_engine süresi ayrıca).
+Kurlar sabittir (ölçüm ağa bağlı değildir) ve WORK_DIR geçici bir dizine alınır; üretim sonuçlarına dokunmaz.
+"""
+import argparse
+import decimal
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import traceback
+import uuid
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+app = None
+REPORT_VERSION = 1
+BENCH_RATES = {'USD': decimal.Decimal('32.50'), 'EUR': decimal.Decimal('35.25')}
+MP_TEMPLATE = 'Trendyol'
+SIZE_SUFFIXES = {'k': 1000, 'm': 1000000}
+
+# Şablon biçimindeki kolonlar: iç stok ve tedarikçi dosyaları bu şablonlarla okunur
+INTERNAL_TEMPLATE = {'sku': 'Stok Kodu', 'barcode': 'Barkod', 'product_name': 'Stok Adı', 'brand': 'Marka', 'stock': 'Miktar', 'selling_price': 'Satış Fiyatı'}
+SUPPLIER_TEMPLATE = {'sku': 'Ürün Kodu', 'barcode': 'Barkod', 'product_name': 'Ürün Adı', 'brand': 'Marka', 'stock': 'Stok', 'cost': 'Liste Fiyatı', 'selling_price': 'PSF', 'currency_column': 'Döviz'}
+
+# (ürün adı, ölçü birimi, ölçü değerleri)
+PRODUCT_KINDS = [
+    ('Darbeli Matkap', 'W', [550, 650, 750, 850, 1100]),
+    ('Şarjlı Vidalama', 'V', [12, 14.4, 18, 20]),
+    ('Kırıcı Delici', 'W', [800, 900, 1500]),
+    ('Avuç Taşlama', 'mm', [115, 125, 180, 230]),
+    ('Dekupaj Testere', 'W', [500, 650, 710]),
+    ('Kombinasyon Pense', 'mm', [160, 180, 200]),
+    ('Yan Keski', 'mm', [140, 160, 180]),
+    ('Papağan Pense', 'mm', [180, 250, 300]),
+    ('Tornavida Seti', None, []),
+    ('Lokma Takımı', None, []),
+    ('Kombine Anahtar Takımı', 'mm', [6, 8, 10, 12, 13, 17, 19]),
+    ('Alyan Anahtar Seti', None, []),
+    ('Su Terazisi', 'cm', [40, 60, 80, 100, 120]),
+    ('Şerit Metre', 'mt', [3, 5, 8, 10]),
+    ('Matkap Ucu Seti', 'mm', [3, 5, 6, 8, 10]),
+    ('Kompresör', 'lt', [24, 50, 100]),
+    ('Zımpara Kağıdı', 'gr', [60, 80, 120, 180, 240]),
+    ('Kaynak Makinesi', 'A', [140, 160, 200]),
+    ('Akü Şarj Cihazı', 'A', [2, 4, 6]),
+    ('Çekiç', 'gr', [300, 500, 800, 1000]),
+]
+MODEL_PREFIXES = ['GSB', 'GSR', 'GWS', 'DHP', 'DTD', 'HP', 'KX', 'CF', 'TS', 'PRO', 'DCD', 'IZ', 'RT', 'HD', 'BT']
+SET_COUNTS = [2, 3, 5, 6, 7, 10, 12, 24, 40, 72, 108]
+TITLE_NOISE = ['Orijinal', 'Kargo Bedava', 'Yeni Model', 'Garantili', 'Profesyonel', 'İthal']
+STOCK_WORDS = ['Tükendi', 'stokta yok', 'Temin Edilir']
+
+# --- SENTETİK KATALOG ---
+def parse_size(text):
+    text = str(text).strip().lower()
+    return int(float(text[:-1]) * SIZE_SUFFIXES[text[-1]]) if text[-1:] in SIZE_SUFFIXES else int(text)
+
+def size_label(n):
+    for suffix, mul in sorted(SIZE_SUFFIXES.items(), key=lambda kv: -kv[1]):
+        if n >= mul and n % mul == 0: return f"{n // mul}{suffix}"
+    return str(n)
+
+def ean13(body):
+    # 12 haneli gövdeye EAN-13 kontrol hanesi eklenir
+    digits = (np.frombuffer(''.join(body).encode('ascii'), dtype=np.uint8).reshape(len(body), 12) - 48).astype(np.int64)
+    check = (10 - (digits[:, 0::2].sum(1) + 3 * digits[:, 1::2].sum(1)) % 10) % 10
+    return [b + str(c) for b, c in zip(body, check)]
+
+def tr_number(values, decimals=2):
+    # 1234.5 -> '1.234,50' (Türkçe yerel biçim)
+    return [f"{v:,.{decimals}f}".replace(',', '#').replace('.', ',').replace('#', '.') for v in values]
+
+def stock_strings(rng, n, high=200):
+    qty = rng.integers(0, high, n)
+    out = qty.astype(str).astype(object)
+    r = rng.random(n)
+    words = rng.choice(STOCK_WORDS, n)
+    out[r < 0.06] = words[r < 0.06]
+    adet = (r >= 0.06) & (r < 0.12)
+    out[adet] = [f"{q} adet" for q in qty[adet]]
+    big = (r >= 0.12) & (r < 0.15)
+    out[big] = tr_number(qty[big] * 10 + 1000, 0)
+    out[(r >= 0.15) & (r < 0.17)] = ''
+    return out
+
+def generate_catalog(n, seed=0):
+    """n ürünlük ana katalog: marka (Zipf dağılımlı), model kodu, ürün türü, ölçü, set adedi, barkod, SKU ve TRY maliyet."""
+    rng = np.random.default_rng(seed)
+    brands = sorted(app.BRAND_INDEX.brands)
+    weights = 1.0 / np.arange(1, len(brands) + 1)
+    brand = np.asarray(brands, dtype=object)[rng.choice(len(brands), n, p=weights / weights.sum())]
+    kind = rng.integers(0, len(PRODUCT_KINDS), n)
+    model = [f"{p}{'-' if d % 3 == 0 else ''}{d}" for p, d in zip(rng.choice(MODEL_PREFIXES, n), rng.integers(10, 9999, n))]
+    sets = np.where(rng.random(n) < 0.35, rng.choice(SET_COUNTS, n), 0)
+    titles, measures = [], rng.random(n)
+    for b, k, m, s, u in zip(brand, kind, model, sets, measures):
+        name, unit, values = PRODUCT_KINDS[k]
+        t = f"{b} {m} {name}"
+        if unit: t += f" {values[int(u * len(values))]} {unit}"
+        if s: t += f" {s} Parça"
+        titles.append(t)
+    tags = [''.join(ch for ch in b.upper() if ch.isalnum())[:4] for b in brand]
+    sku = [f"{t}-{m}-{i:06d}" for i, (t, m) in enumerate(zip(tags, model))]
+    barcode = ean13([f"869{v:09d}" for v in rng.choice(10 ** 9, n, replace=False)])
+    cost = np.round(rng.lognormal(np.log(400), 1.0, n), 2)
+    return pd.DataFrame({'sku': sku, 'barcode': barcode, 'title': titles, 'brand': brand, 'model': model, 'cost': cost})
+
+def internal_files(cat, rng):
+    # Ana depo tüm ürünleri (+), çıkış listesi ürünlerin ~%15'ini (-) içerir
+    base = pd.DataFrame({'Stok Kodu': cat['sku'], 'Barkod': cat['barcode'], 'Stok Adı': cat['title'], 'Marka': cat['brand'],
+                         'Miktar': stock_strings(rng, len(cat)), 'Satış Fiyatı': tr_number(cat['cost'] * 1.4)})
+    out = base.sample(frac=0.15, random_state=int(rng.integers(2 ** 31))).copy()
+    out['Miktar'] = rng.integers(1, 10, len(out)).astype(str)
+    return [('depo.csv', base, '+'), ('cikis.csv', out, '-')]
+
+def supplier_files(cat, rng, rates):
+    # İki tedarikçi kataloğun ~%60'ını taşır; bir kısmı kendi kodunu ve farklı yazımlı başlık kullanır, barkod kimi zaman boş
+    files = []
+    for i in range(2):
+        sub = cat.sample(frac=0.6, random_state=int(rng.integers(2 ** 31)))
+        n = len(sub)
+        currency = rng.choice(['TRY', 'USD', 'EUR'], n, p=[0.7, 0.2, 0.1])
+        rate = np.array([float(rates.get(c, 1)) for c in currency])
+        cost = sub['cost'].to_numpy() * rng.uniform(0.9, 1.1, n) / rate
+        own = rng.random(n) < 0.3
+        sku = np.where(own, [f"T{i}{j:07d}" for j in range(n)], sub['sku'].to_numpy())
+        title = np.where(rng.random(n) < 0.5, sub['title'].str.lower().to_numpy(), sub['title'].to_numpy())
+        bc = np.where(rng.random(n) < 0.3, '', sub['barcode'].to_numpy())
+        files.append((f"tedarikci{i + 1}.csv", pd.DataFrame({
+            'Ürün Kodu': sku, 'Barkod': bc, 'Ürün Adı': title, 'Marka': sub['brand'].to_numpy(),
+            'Stok': stock_strings(rng, n, 50), 'Liste Fiyatı': tr_number(cost), 'PSF': tr_number(cost * 1.5), 'Döviz': currency})))
+    return files
+
+def marketplace_file(cat, rng, seed):
+    """Pazaryeri listesi (Trendyol kolonları): %45 barkodla, %15 yalnız SKU ile, %30 yalnız isim benzerliğiyle bulunan
+    ürünler; kalan %10 katalogda olmayan ürünler."""
+    n = len(cat)
+    src = cat.iloc[rng.permutation(n)].reset_index(drop=True)
+    alien = generate_catalog(n, seed + 1)
+    r = rng.random(n)
+    by_sku, by_name, unknown = (r >= 0.45) & (r < 0.60), (r >= 0.60) & (r < 0.90), r >= 0.90
+    barcode = src['barcode'].to_numpy().copy()
+    sku = src['sku'].to_numpy().copy()
+    title = src['title'].to_numpy().copy()
+    brand = src['brand'].to_numpy().copy()
+    other = ~(r < 0.45)
+    barcode[other] = [f"TY{j:011d}" for j in np.flatnonzero(other)]
+    sku[by_name | unknown] = [f"MP-{j}" for j in np.flatnonzero(by_name | unknown)]
+    noise = rng.choice(TITLE_NOISE, n)
+    title[by_name] = [f"{t} {z}" if k % 2 else f"{t.upper()} - {z}" for k, (t, z) in enumerate(zip(title[by_name], noise[by_name]))]
+    title[unknown] = alien['title'].to_numpy()[unknown]
+    brand[unknown] = alien['brand'].to_numpy()[unknown]
+    return pd.DataFrame({
+        'Barkod': barcode, 'Model Kodu': sku, 'Ürün Adı': title, 'Marka': brand,
+        'Ürün Stok Adedi': rng.integers(0, 20, n).astype(str),
+        "Trendyol'da Satılacak Fiyat (KDV Dahil)": [f"{v:.2f}" for v in src['cost'].to_numpy() * rng.uniform(1.2, 2.0, n)],
+        'Ürün Açıklaması': 'Sentetik kıyaslama ürünü'})
+
+def write_input(path, df, fmt):
+    if fmt == 'xlsx': app.write_xlsx_report(path, [('Sheet1', df)])
+    else: df.to_csv(path, index=False)
+    return path
+
+def generate_inputs(n, folder, seed=0, fmt='csv'):
+    """Boyut n için girdi dosyalarını folder altına yazar; dosya yolları ve satır sayılarını döner."""
+    rng = np.random.default_rng(seed + 7)
+    cat = generate_catalog(n, seed)
+    ext = f".{fmt}"
+    internal = [(write_input(folder / name.replace('.csv', ext), df, fmt), lbl, len(df)) for name, df, lbl in internal_files(cat, rng)]
+    supplier = [(write_input(folder / name.replace('.csv', ext), df, fmt), len(df)) for name, df in supplier_files(cat, rng, app.EXCHANGE_RATES)]
+    mp = marketplace_file(cat, rng, seed)
+    mp_path = write_input(folder / f"pazaryeri{ext}", mp, fmt)
+    return {'internal': internal, 'supplier': supplier, 'marketplace': (mp_path, len(mp))}
+
+# --- AŞAMA ÖLÇÜMÜ ---
+def clean_template(tpl):
+    # load_template ile aynı: kolon adları dosya başlıkları gibi temizlenir
+    return {k: app.clean_column_name(v) for k, v in tpl.items()}
+
+def _rss_mb():
+    try:
+        with open('/proc/self/statm') as f: return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except OSError: return 0.0
+
+def _maxrss_mb(who):
+    # Linux'ta ru_maxrss KB cinsindendir
+    return resource.getrusage(who).ru_maxrss / 1024
+
+def _stage_child(conn, func):
+    start = _rss_mb()
+    t0 = time.perf_counter()
+    try:
+        out = func() or {}
+        out = dict(out, seconds=round(time.perf_counter() - t0, 3))
+    except Exception as e:
+        traceback.print_exc()
+        out = {'error': f"{type(e).__name__}: {e}", 'seconds': round(time.perf_counter() - t0, 3)}
+    # Çocuk süreç ana sürecin sayfalarını paylaşarak başlar; tepe değer başlangıca göre ölçülür
+    out['peak_rss_mb'] = round(max(_maxrss_mb(resource.RUSAGE_SELF) - start, 0.0), 1)
+    out['workers_peak_rss_mb'] = round(_maxrss_mb(resource.RUSAGE_CHILDREN), 1)
+    conn.send(out)
+    conn.close()
+
+def run_stage(func):
+    """func'ı ayrı (fork) süreçte çalıştırır; süre, bellek tepe değeri ve func'ın döndürdüğü sayaçları döner.
+    Süreç bellek yetersizliğinden öldürülürse sonuç 'error' alanıyla kaydedilir."""
+    ctx = multiprocessing.get_context('fork')
+    parent, child = ctx.Pipe(duplex=False)
+    proc = ctx.Process(target=_stage_child, args=(child, func))
+    t0 = time.perf_counter()
+    proc.start()
+    child.close()
+    try: out = parent.recv()
+    except EOFError: out = None
+    proc.join()
+    if out is None: out = {'error': f"süreç sonlandı (çıkış kodu {proc.exitcode})", 'seconds': round(time.perf_counter() - t0, 3)}
+    return out
+
+def _throughput(stage, rows):
+    if not stage.get('error') and stage.get('seconds'): stage['rows_per_s'] = round(rows / stage['seconds'], 1)
+    return stage
+
+def bench_size(n, folder, seed=0, fmt='csv', workers=None):
+    """Tek boyut için tüm aşamaları sırayla ölçer. Ara sonuçlar (iç stok / tedarikçi anahtarları) sonuç deposundan aktarılır."""
+    stages = {}
+    t0 = time.perf_counter()
+    inputs = generate_inputs(n, folder, seed, fmt)
+    stages['generate'] = {'seconds': round(time.perf_counter() - t0, 3), 'rows': n}
+    ikey, skey, job_id = f"bench-{uuid.uuid4()}", f"bench-{uuid.uuid4()}", f"bench-{uuid.uuid4()}"
+
+    def internal():
+        tpl = clean_template(INTERNAL_TEMPLATE)
+        files = [{'path': str(p), 'filename': p.name, 'template': tpl, 'columns': app.template_columns(tpl), 'label': lbl} for p, lbl, _ in inputs['internal']]
+        df, meta = app.calculate_internal_stock(files, 3, decimal.Decimal(1), workers)
+        app.save_result_frame('internal', ikey, df, meta=meta, scales={'Ic_Hazir_Fiyat': app.PRICE_SCALE})
+        return {'rows_out': len(df)}
+
+    def supplier():
+        tpl = clean_template(SUPPLIER_TEMPLATE)
+        files = [{'path': str(p), 'filename': p.name, 'template': tpl, 'columns': app.template_columns(tpl)} for p, _ in inputs['supplier']]
+        df, _, meta = app.consolidate_suppliers(files, workers)
+        app.save_result_frame('supplier', skey, df, meta=meta, scales={'Maliyet': app.PRICE_SCALE, 'Ted_Hazir_Fiyat': app.PRICE_SCALE})
+        return {'rows_out': len(df)}
+
+    def matching():
+        engine = {}
+        run_engine = app.UniversalSmartMatcher.run_engine
+        def timed(self, *a, **k):
+            t = time.perf_counter()
+            try: return run_engine(self, *a, **k)
+            finally: engine.update(seconds=round(time.perf_counter() - t, 3), rows=len(self.mp_df))
+        app.UniversalSmartMatcher.run_engine = timed
+        mp_path, _ = inputs['marketplace']
+        # run_matching_job girdi dosyasını siler; kopya verilir
+        job_path = folder / f"job{mp_path.suffix}"
+        shutil.copyfile(mp_path, job_path)
+        price = {'method': 'calculated', 'source': 'cost', 'default_multiplier': 1.35, 'add_vat': True, 'vat_rate': 20,
+                 'natural_language_text': 'BOSCH %10 ZAM\nMAKITA 500 TL OLSUN\nTUM URUNLER 3 EKLE'}
+        app.run_matching_job(job_id, ikey, skey, str(job_path), job_path.name, MP_TEMPLATE, 'min', price, 'zero', False, {}, None, True, workers)
+        rec = app.read_job_status(job_id) or {}
+        if rec.get('status') != 'completed': raise RuntimeError(rec.get('error') or rec.get('status'))
+        return {'engine': engine}
+
+    in_rows = sum(r for _, _, r in inputs['internal'])
+    stages['calculate_internal_stock'] = _throughput(dict(run_stage(internal), rows=in_rows), in_rows)
+    sup_rows = sum(r for _, r in inputs['supplier'])
+    stages['consolidate_suppliers'] = _throughput(dict(run_stage(supplier), rows=sup_rows), sup_rows)
+    mp_rows = inputs['marketplace'][1]
+    match = run_stage(matching)
+    engine = match.pop('engine', None)
+    stages['run_matching_job'] = _throughput(dict(match, rows=mp_rows), mp_rows)
+    if engine: stages['run_engine'] = _throughput(engine, engine['rows'])
+    return stages
+
+def environment():
+    try: rev = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=app.APP_DIR, capture_output=True, text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError): rev = None
+    import sklearn
+    return {
+        'git_rev': rev, 'python': platform.python_version(), 'platform': platform.platform(), 'cpu_count': os.cpu_count(),
+        'pandas': pd.__version__, 'numpy': np.__version__, 'sklearn': sklearn.__version__,
+        'settings': {k: getattr(app, k) for k in ('MATCH_WORKERS', 'INGEST_WORKERS', 'MATCH_TOP_K', 'MATCH_MEMORY_BUDGET_MB', 'MATCH_INDEX_ENABLED',
+                                                  'FILE_CHUNK_ROWS', 'PARSE_CACHE_ENABLED', 'REPORT_RAW_SHEETS')},
+    }
+
+def print_table(report, out=sys.stdout):
+    print(f"{'boyut':>8} {'aşama':<26} {'süre(sn)':>10} {'satır/sn':>12} {'tepe MB':>9} {'worker MB':>10}", file=out)
+    for run in report['runs']:
+        for name, st in run['stages'].items():
+            if st.get('error'):
+                print(f"{run['label']:>8} {name:<26} {st['seconds']:>10} HATA: {st['error']}", file=out)
+                continue
+            print(f"{run['label']:>8} {name:<26} {st['seconds']:>10} {st.get('rows_per_s', ''):>12} {st.get('peak_rss_mb', ''):>9} {st.get('workers_peak_rss_mb', ''):>10}", file=out)
+
+def load_app():
+    """app modülünü yalıtılmış bir WORK_DIR ile içe aktarır (WORK_DIR zaten verilmişse o kullanılır).
+    Silinmesi gereken geçici dizini döner."""
+    global app
+    bench_dir = None
+    if 'WORK_DIR' not in os.environ:
+        bench_dir = Path(tempfile.mkdtemp(prefix='stokcu_bench_'))
+        os.environ['WORK_DIR'] = str(bench_dir)
+    # Kıyaslama sabit kurlarla (BENCH_RATES) çalışır; arka planda ağdan kur çekilmez
+    os.environ.setdefault('RATES_REFRESHER', '0')
+    # Kıyaslama tek thread'li süreçte çalışır; --workers > 1 fork edebilsin diye ayrı worker kipi seçilir
+    os.environ.setdefault('JOB_RUNNER', 'external')
+    import app as app_module
+    app = app_module
+    app.EXCHANGE_RATES.update(BENCH_RATES)
+    return bench_dir
+
+def cmd_run(args):
+    bench_dir = load_app()
+    report = {'version': REPORT_VERSION, 'created': time.strftime('%Y-%m-%dT%H:%M:%S'), 'seed': args.seed, 'input_format': args.format,
+              'workers': args.workers, 'environment': environment(), 'runs': []}
+    try:
+        for n in map(parse_size, args.sizes.split(',')):
+            folder = Path(tempfile.mkdtemp(prefix=f"inputs_{n}_", dir=app.WORK_DIR))
+            print(f"[{size_label(n)}] ölçülüyor...", file=sys.stderr, flush=True)
+            report['runs'].append({'size': n, 'label': size_label(n), 'stages': bench_size(n, folder, args.seed, args.format, args.workers)})
+            shutil.rmtree(folder, ignore_errors=True)
+            # Rapor her boyuttan sonra yazılır: büyük boyutta süreç öldürülse bile önceki ölçümler kalır
+            with open(args.out, 'w', encoding='utf-8') as f: json.dump(report, f, ensure_ascii=False, indent=2)
+    finally:
+        if bench_dir is not None and not args.keep: shutil.rmtree(bench_dir, ignore_errors=True)
+    print_table(report)
+    print(f"Rapor: {args.out}", file=sys.stderr)
+    return 0
+
+def cmd_compare(args):
+    """İki raporu boyut/aşama bazında karşılaştırır; --fail-above verilirse bu orandan fazla yavaşlayan aşamada 1 döner."""
+    with open(args.base, encoding='utf-8') as f: base = json.load(f)
+    with open(args.new, encoding='utf-8') as f: new = json.load(f)
+    old_runs = {r['size']: r['stages'] for r in base['runs']}
+    print(f"{'boyut':>8} {'aşama':<26} {'eski sn':>9} {'yeni sn':>9} {'oran':>7} {'eski MB':>9} {'yeni MB':>9}")
+    regressions = []
+    for run in new['runs']:
+        old = old_runs.get(run['size'], {})
+        for name, st in run['stages'].items():
+            prev = old.get(name)
+            if not prev or prev.get('error') or st.get('error'):
+                print(f"{run['label']:>8} {name:<26} {'-' if not prev else prev.get('error') or prev['seconds']!s:>9} {st.get('error') or st['seconds']!s:>9}")
+                continue
+            ratio = st['seconds'] / prev['seconds'] if prev['seconds'] else float('inf')
+            print(f"{run['label']:>8} {name:<26} {prev['seconds']:>9} {st['seconds']:>9} {ratio:>7.2f} {prev.get('peak_rss_mb', '')!s:>9} {st.get('peak_rss_mb', '')!s:>9}")
+            if args.fail_above and ratio > args.fail_above: regressions.append(f"{run['label']}/{name} x{ratio:.2f}")
+    if regressions:
+        print("Yavaşlayan aşamalar: " + ', '.join(regressions), file=sys.stderr)
+        return 1
+    return 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Stokçu boru hattı kıyaslaması")
+    sub = parser.add_subparsers(dest='command', required=True)
+    run = sub.add_parser('run', help="sentetik katalog üretip aşamaları ölçer")
+    run.add_argument('--sizes', default='1k,10k', help="virgülle ayrılmış satır sayıları (örn. 1k,10k,100k,500k)")
+    run.add_argument('--seed', type=int, default=0)
+    run.add_argument('--format', choices=['csv', 'xlsx'], default='csv', help="girdi dosyası biçimi")
+    run.add_argument('--workers', default=None, help="iş/okuma süreç sayısı (varsayılan: MATCH_WORKERS/INGEST_WORKERS)")
+    run.add_argument('--out', default='bench_report.json')
+    run.add_argument('--keep', action='store_true', help="geçici WORK_DIR silinmesin")
+    cmp_ = sub.add_parser('compare', help="iki raporu karşılaştırır")
+    cmp_.add_argument('base')
+    cmp_.add_argument('new')
+    cmp_.add_argument('--fail-above', type=float, default=None, help="bu orandan fazla yavaşlama varsa çıkış kodu 1")
+    args = parser.parse_args(argv)
+    return cmd_run(args) if args.command == 'run' else cmd_compare(args)
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -5,5 +5,7 @@ echo "Starting cron daemon..."
 cron
 
 # 2. Gunicorn'u ön planda başlat (ana işlem bu olacak)
+# gunicorn.conf.py: post_fork kancası iş worker thread'lerini ve kur yenileyiciyi her worker'da başlatır.
+# --preload: uygulama (sklearn, marka tabloları, kur önbelleği) ana süreçte bir kez yüklenir, worker'lar copy-on-write paylaşır
 echo "Starting Gunicorn server..."
-exec gunicorn --workers 4 --bind 0.0.0.0:5000 "app:app"
+exec gunicorn --config gunicorn.conf.py --preload --workers 4 --worker-class gthread --threads 16 --bind 0.0.0.0:5000 "app:app"
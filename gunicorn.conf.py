@@ -0,0 +1,8 @@
+# Gunicorn kancaları (ayarlar entrypoint.sh / docker-compose.yml komut satırındadır).
+# İş worker thread'leri ve kur yenileyici her worker süreci fork edildikten hemen sonra başlatılır;
+# böylece yeniden başlatma sonrası kuyrukta bekleyen işler ilk HTTP isteğini beklemez.
+# --preload ile app ana süreçte zaten yüklüdür; burada yalnızca modül referansı alınır.
+
+def post_fork(server, worker):
+    import app
+    app.start_background_threads()
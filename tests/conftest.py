@@ -0,0 +1,32 @@
+# Testler depo kökündeki app modülünü doğrudan içe aktarır; ortam içe aktarmadan önce ayarlanır:
+# sonuçlar, iş kayıtları ve önbellekler geçici bir WORK_DIR'a yazılır, arka planda kur yenileyici başlatılmaz.
+import decimal
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+os.environ['WORK_DIR'] = tempfile.mkdtemp(prefix='stokcu-test-')
+os.environ['RATES_REFRESHER'] = '0'
+os.environ.setdefault('LOG_LEVEL', 'WARNING')
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import app as app_module  # noqa: E402
+
+@pytest.fixture
+def app():
+    return app_module
+
+@pytest.fixture
+def forking(monkeypatch):
+    # parallel_map yalnızca ayrı worker kipinde (JOB_RUNNER=external) fork eder
+    monkeypatch.setattr(app_module, 'JOB_RUNNER', 'external')
+
+@pytest.fixture
+def rates(monkeypatch):
+    # Sabit kurlar: USD 32.5, EUR 35.25
+    table = {app_module.BASE_CURRENCY: decimal.Decimal(1), 'USD': decimal.Decimal('32.5'), 'EUR': decimal.Decimal('35.25')}
+    monkeypatch.setattr(app_module, 'EXCHANGE_RATES', table)
+    return table
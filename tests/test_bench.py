@@ -0,0 +1,43 @@
+# Kıyaslama aracı: sentetik katalog tohuma göre belirlenimli, küçük bir boyut uçtan uca hatasız ölçülmeli
+import json
+
+import pytest
+
+import bench
+
+@pytest.fixture
+def bench_app(app, rates, monkeypatch):
+    monkeypatch.setattr(bench, 'app', app, raising=False)
+    return bench
+
+@pytest.mark.parametrize('text,n,label', [('1k', 1000, '1k'), ('2.5k', 2500, '2500'), ('1m', 10 ** 6, '1m'), ('750', 750, '750')])
+def test_sizes(text, n, label):
+    assert bench.parse_size(text) == n and bench.size_label(n) == label
+
+def test_ean13_check_digit():
+    assert bench.ean13(['400638133393', '869000000001']) == ['4006381333931', '8690000000012']
+
+def test_tr_number():
+    assert bench.tr_number([1234.5, 0.456, 1234567]) == ['1.234,50', '0,46', '1.234.567,00']
+
+def test_catalog_is_deterministic(bench_app):
+    a, b, c = bench_app.generate_catalog(500, seed=3), bench_app.generate_catalog(500, seed=3), bench_app.generate_catalog(500, seed=4)
+    assert a.equals(b) and not a.equals(c)
+    assert a['barcode'].is_unique and a['sku'].is_unique and a['barcode'].str.len().eq(13).all()
+    assert set(a['brand']) <= bench_app.app.BRAND_INDEX.brands
+
+def test_small_run_end_to_end(bench_app, tmp_path):
+    stages = bench_app.bench_size(300, tmp_path, seed=1)
+    assert set(stages) >= {'generate', 'calculate_internal_stock', 'consolidate_suppliers', 'run_matching_job', 'run_engine'}
+    assert not [name for name, st in stages.items() if st.get('error')], stages
+    assert stages['run_engine']['rows'] > 0 and stages['calculate_internal_stock']['rows_per_s'] > 0
+
+def test_compare_flags_regressions(tmp_path, capsys):
+    def report(name, seconds):
+        p = tmp_path / name
+        p.write_text(json.dumps({'runs': [{'size': 1000, 'label': '1k', 'stages': {'run_engine': {'seconds': seconds}}}]}))
+        return str(p)
+    base, slow = report('a.json', 1.0), report('b.json', 1.5)
+    assert bench.main(['compare', base, slow]) == 0
+    assert bench.main(['compare', base, slow, '--fail-above', '1.25']) == 1
+    assert bench.main(['compare', base, base, '--fail-above', '1.25']) == 0
@@ -0,0 +1,57 @@
+# BrandIndex, markaları en uzundan kısaya tek tek arayan eski extract_brand_from_title ile aynı markayı bulmalı;
+# eşit uzunluktaki markalar arasında alfabetik ilk seçilir
+import re
+
+import numpy as np
+import pandas as pd
+import pytest
+
+def reference_extract(brands, title):
+    title_upper = str(title).upper().replace('İ', 'I')
+    for b in sorted(brands, key=lambda b: (-len(b), b)):
+        if re.search(r'\b' + re.escape(b) + r'\b', title_upper): return b
+    if "IZEL" in title_upper: return "IZELTAS"
+    return "TANIMSIZ"
+
+def reference_conflict(brands, conflicts, b1, b2):
+    if b1 == "TANIMSIZ" or b2 == "TANIMSIZ" or b1 == b2: return False
+    if b1 in b2 or b2 in b1: return False
+    if b2 in conflicts.get(b1, []) or b1 in conflicts.get(b2, []): return True
+    return b1 in brands and b2 in brands
+
+@pytest.mark.parametrize('title,expected', [
+    ('Bosch GSR 120', 'BOSCH'),
+    ('MAKITA ve BOSCH seti', 'MAKITA'),          # eşit uzunluk (6): alfabetik ilk
+    ('bosch makita', 'MAKITA'),
+    ('KNIPEX pense', 'KNIPEX'),
+    ('Knipex ve Makita', 'KNIPEX'),               # eşit uzunluk: KNIPEX < MAKITA
+    ('BLACK DECKER matkap', 'BLACK DECKER'),      # en uzun marka kısa olanı içerse de kazanır
+    ('BLACK kablo', 'BLACK'),
+    ('BOSCHMAN çanta', 'TANIMSIZ'),               # kelime sınırı
+    ('İzeltaş pense', 'IZELTAS'),                 # bilinmeyen, IZEL geçiyor
+    ('', 'TANIMSIZ'),
+    (None, 'TANIMSIZ'),
+])
+def test_extract_table(app, title, expected):
+    brands = ['BOSCH', 'MAKITA', 'KNIPEX', 'BLACK', 'BLACK DECKER', 'CETA']
+    index = app.BrandIndex(brands, {})
+    assert index.extract(title) == expected == reference_extract(brands, title)
+
+def test_extract_column_matches_reference(app):
+    index = app.BRAND_INDEX
+    brands = sorted(index.brands)
+    rng = np.random.default_rng(11)
+    noise = ['matkap', 'set', '12V', 'pense', 'IZEL', 'X', '-', 'Çelik']
+    titles = pd.Series([' '.join(rng.choice(brands + noise, rng.integers(0, 5))) for _ in range(2000)])
+    got = index.extract_column(titles)
+    assert got.tolist() == [reference_extract(brands, t) for t in titles]
+    assert got.index.equals(titles.index)
+
+def test_conflicts_are_symmetric(app):
+    conflicts = {'BOSCH': ['MAKITA'], 'CETA FORM': ['IZELTAS'], 'X': ['X']}
+    brands = ['BOSCH', 'MAKITA', 'CETA FORM', 'IZELTAS', 'KNIPEX']
+    index = app.BrandIndex(brands, conflicts)
+    names = brands + ['CETA', 'TANIMSIZ', 'NOVA', 'X']
+    for b1 in names:
+        for b2 in names:
+            assert index.is_conflict(b1, b2) == index.is_conflict(b2, b1) == reference_conflict(brands, conflicts, b1, b2)
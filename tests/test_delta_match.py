@@ -0,0 +1,92 @@
+# Artımlı eşleştirme: önceki atamalar yalnızca aynı şablon ve katalogla, satır değişmediyse yeniden kullanılmalı; sonuç tam çalıştırmayla aynı
+import numpy as np
+import pandas as pd
+import pytest
+
+TITLES = ['Bosch GSB 180-LI Darbeli Matkap 18V', 'Makita HR2470 Kırıcı Delici 780W', 'Knipex 0301 Pense 180 mm',
+          'Ceta Form K-310 Tornavida Seti 6 Parca', 'Izeltas Lokma Takımı 12 Parca', 'Dewalt D25133K Kırıcı 800W',
+          'Bosch GBH 2-26 Kırıcı Delici 830W', 'Makita DF333D Vidalama 12V']
+
+def frames():
+    int_df = pd.DataFrame({'ic_urun_adi': TITLES, 'marka': [t.split()[0].upper() for t in TITLES],
+                           'anahtar_kod': [f"K{i}" for i in range(len(TITLES))], 'barkod': [f"869{i}" for i in range(len(TITLES))]})
+    rng = np.random.default_rng(1)
+    picks = rng.integers(len(TITLES), size=30)
+    mp_df = pd.DataFrame({'MP_Urun_Adi': [TITLES[i].replace('Parca', 'Parça').lower() for i in picks] + ['Tamamen Alakasız Ürün'] * 3,
+                          'MP_Marka': '', 'MP_SKU': [f"S{i}" for i in range(33)], 'MP_Barkod': 'YOK'})
+    return int_df, mp_df
+
+@pytest.fixture
+def state_dir(app, tmp_path, monkeypatch):
+    # Artımlı eşleştirme kalıcı katalog indeksiyle çalışır
+    monkeypatch.setattr(app, 'MATCH_STATE_DIR', tmp_path)
+    monkeypatch.setattr(app, 'MATCH_INDEX_ENABLED', True)
+    monkeypatch.setattr(app, 'TEMP_RESULTS_DIR', tmp_path)
+    monkeypatch.setattr(app, 'MATCHER_INDEX_LATEST', tmp_path / 'matcher_index_latest.json')
+    return tmp_path
+
+def run(app, int_df, mp_df, reuse=None, store_key='ic1'):
+    m = app.UniversalSmartMatcher(int_df, mp_df, index_key=store_key)
+    out = m.run_engine(reuse=reuse)
+    return m, out
+
+def saved_state(app, m, name='tpl'):
+    app.DeltaMatchState.save(name, m.INDEX_KEY, m.assignments, m.catalog_fp, m.engine_signature())
+    return app.DeltaMatchState.load(name, m.INDEX_KEY)
+
+def test_unchanged_inputs_reuse_everything(app, state_dir):
+    int_df, mp_df = frames()
+    m, full = run(app, int_df, mp_df)
+    assert (full['anahtar_kod'] != 'YOK').any() and (full['anahtar_kod'] == 'YOK').any()
+    state = saved_state(app, m)
+    assert state.meta['catalog'] == m.catalog_fp and state.meta['store'] == 'ic1' and len(state.frame) == len(mp_df)
+    m2, again = run(app, int_df, mp_df, state)
+    assert m2.reused == len(mp_df)
+    pd.testing.assert_frame_equal(again, full)
+
+def test_edited_rows_incremental_equals_full(app, state_dir):
+    int_df, mp_df = frames()
+    m, _ = run(app, int_df, mp_df)
+    state = saved_state(app, m)
+    edited = mp_df.copy()
+    edited.loc[[0, 5, 31], 'MP_Urun_Adi'] = ['knipex 0301 pense 180 mm yeni', 'yepyeni ürün', 'bosch gbh 2-26 kırıcı delici']
+    m2, incremental = run(app, int_df, edited, state)
+    assert m2.reused == len(mp_df) - 3
+    _, full = run(app, int_df, edited)
+    pd.testing.assert_frame_equal(incremental, full)
+
+def test_state_is_per_catalog(app, state_dir):
+    int_df, mp_df = frames()
+    m, _ = run(app, int_df, mp_df)
+    state = saved_state(app, m)
+    # Yeni katalog yüklemesi yeni anahtar alır: önceki atamalar bulunmaz
+    assert app.DeltaMatchState.load('tpl', 'ic2') is None
+    # Anahtar aynı olsa da katalog özeti tutmazsa (ör. K2'nin adı değişmiş) hiçbir atama kullanılmaz
+    changed = int_df.copy()
+    changed.loc[2, 'ic_urun_adi'] = 'Knipex 0301 Kombine Pense 200 mm'
+    m2, _ = run(app, changed, mp_df, state, store_key='ic2')
+    assert m2.reused == 0
+
+def test_engine_signature_change_disables_reuse(app, state_dir):
+    int_df, mp_df = frames()
+    m, _ = run(app, int_df, mp_df)
+    state = saved_state(app, m)
+    m2 = app.UniversalSmartMatcher(int_df, mp_df, index_key='ic1')
+    m2.THRESHOLD_HIGH = 0.8
+    m2.run_engine(reuse=state)
+    assert m2.reused == 0
+
+def test_reuse_needs_persistent_index(app, state_dir, monkeypatch):
+    int_df, mp_df = frames()
+    m, _ = run(app, int_df, mp_df)
+    state = saved_state(app, m)
+    monkeypatch.setattr(app, 'MATCH_INDEX_ENABLED', False)
+    m2, _ = run(app, int_df, mp_df, state)
+    assert m2.INDEX_KEY is None and m2.reused == 0
+
+def test_state_is_per_template(app, state_dir):
+    int_df, mp_df = frames()
+    m, _ = run(app, int_df, mp_df)
+    saved_state(app, m, 'trendyol')
+    assert app.DeltaMatchState.load('hepsiburada', 'ic1') is None
+    assert app.DeltaMatchState.load('trendyol', 'ic1').meta['template'] == 'trendyol'
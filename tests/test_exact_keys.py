@@ -0,0 +1,62 @@
+# Barkod/SKU birebir eşleştirmesi: önce barkod, kalanlar için SKU; katalogda tekrarlanan anahtarda ilk satır kazanır
+import numpy as np
+import pandas as pd
+
+def reference_stages(mp, internal_df, stages):
+    # pd.merge ile satır çiftleri; pazaryeri satırı başına katalogdaki ilk geçerli satır
+    open_ = np.ones(len(mp), dtype=bool)
+    out = []
+    for col, min_len, label in stages:
+        left = mp.assign(_l=np.arange(len(mp)))[open_ & (mp[col].str.len() > min_len).to_numpy()]
+        right = internal_df.assign(_r=np.arange(len(internal_df)))
+        right = right[(right[col].str.len() > min_len).to_numpy()]
+        pairs = pd.merge(left[['_l', col]], right[['_r', col]], on=col).sort_values(['_l', '_r']).drop_duplicates('_l')
+        out.append((label, col, pairs['_l'].to_numpy(), pairs['_r'].to_numpy()))
+        open_[pairs['_l'].to_numpy()] = False
+    return out, open_
+
+def frames():
+    mp = pd.DataFrame({
+        'MP_SKU': ['A1', 'A2', 'A3', 'A4', 'A5', 'A6', 'A7', 'A8'],
+        'bk_norm': ['8690001', '8690002', '123', '8690009', '', '8690001', '8690003', '8690003'],
+        'sku_norm': ['SKU1', 'SKU2', 'SKU3', 'SKU1', 'AB', 'SKU9', 'SKU3', 'NONE'],
+    })
+    internal_df = pd.DataFrame({
+        'anahtar_kod': ['K1', 'K2', 'K3', 'K4', 'K5', 'K6'],
+        'bk_norm': ['8690001', '8690002', '8690001', '123', '8690003', 'x'],
+        'sku_norm': ['SKU1', 'SKU3', 'SKU3', 'AB', 'SKU2', 'SKU9'],
+        'MP_SKU': ['i1', 'i2', 'i3', 'i4', 'i5', 'i6'],
+    })
+    return mp, internal_df
+
+def test_first_row_wins_table(app):
+    mp, internal_df = frames()
+    stages, open_ = app.exact_key_matches(mp, internal_df)
+    got = {label: dict(zip(rows.tolist(), pos.tolist())) for label, _, rows, pos in stages}
+    # 8690001 iki kez geçer (K1, K3): ilk satır K1; SKU3 (K2, K3): ilk satır K2; kısa anahtarlar (123, AB) yok sayılır
+    assert got == {'Barkod': {0: 0, 1: 1, 5: 0, 6: 4, 7: 4}, 'SKU': {2: 1, 3: 0}}
+    assert open_.tolist() == [False, False, False, False, True, False, False, False]
+
+def test_matches_merge_reference(app):
+    rng = np.random.default_rng(5)
+    keys = [f"{k:05d}" for k in range(60)] + ['12', '']
+    mp = pd.DataFrame({'bk_norm': rng.choice(keys, 800), 'sku_norm': rng.choice(keys, 800)})
+    internal_df = pd.DataFrame({'bk_norm': rng.choice(keys, 300), 'sku_norm': rng.choice(keys, 300)})
+    stages, open_ = app.exact_key_matches(mp, internal_df)
+    ref_stages, ref_open = reference_stages(mp, internal_df, app.EXACT_KEY_STAGES)
+    for (label, col, rows, pos), (r_label, r_col, r_rows, r_pos) in zip(stages, ref_stages):
+        assert (label, col) == (r_label, r_col)
+        np.testing.assert_array_equal(rows, r_rows)
+        np.testing.assert_array_equal(pos, r_pos)
+    np.testing.assert_array_equal(open_, ref_open)
+
+def test_join_rows_matches_merge_layout(app):
+    mp, internal_df = frames()
+    stages, _ = app.exact_key_matches(mp, internal_df)
+    _, col, rows, pos = stages[0]
+    joined = app.join_rows(mp, internal_df, rows, pos, col)
+    expected = pd.merge(mp.iloc[rows].reset_index(drop=True).assign(_o=np.arange(len(rows))),
+                        internal_df.iloc[pos].reset_index(drop=True).assign(_o=np.arange(len(rows))),
+                        on=['_o', col], suffixes=('', '_ic')).drop(columns='_o')
+    pd.testing.assert_frame_equal(joined, expected)
+    assert list(joined.columns) == ['MP_SKU', 'bk_norm', 'sku_norm', 'anahtar_kod', 'sku_norm_ic', 'MP_SKU_ic']
@@ -0,0 +1,45 @@
+# iter_export: csv, csv.gz ve jsonl çıktıları parça boyundan bağımsız olarak tek seferlik to_csv/to_json ile aynı olmalı
+import gzip
+import io
+
+import numpy as np
+import pandas as pd
+import pytest
+
+def sample(n=9):
+    return pd.DataFrame({'MP_Barkod': [f"869{i}" for i in range(n)], 'Satis_Fiyati': np.arange(n) * 1.25,
+                         'MP_Urun_Adi': ['Çelik "Pense", 180 mm', 'a\nb', None] * (n // 3), 'Stok': np.arange(n) - 2})
+
+@pytest.mark.parametrize('chunk_rows', [1, 4, 100])
+def test_formats_match_single_write(app, chunk_rows):
+    df = sample()
+    csv = b''.join(app.iter_export(df, 'csv', chunk_rows))
+    assert csv == df.to_csv(index=False).encode('utf-8')
+    assert gzip.decompress(b''.join(app.iter_export(df, 'csv.gz', chunk_rows))) == csv
+    jsonl = b''.join(app.iter_export(df, 'jsonl', chunk_rows)).decode('utf-8')
+    assert jsonl == df.to_json(orient='records', lines=True, force_ascii=False).rstrip('\n') + '\n'
+    pd.testing.assert_frame_equal(pd.read_json(io.StringIO(jsonl), lines=True, dtype=False), df, check_dtype=False)
+
+def test_empty_frame_keeps_header(app):
+    df = sample().iloc[:0]
+    assert b''.join(app.iter_export(df, 'csv')) == b'MP_Barkod,Satis_Fiyati,MP_Urun_Adi,Stok\n'
+    assert gzip.decompress(b''.join(app.iter_export(df, 'csv.gz'))) == b'MP_Barkod,Satis_Fiyati,MP_Urun_Adi,Stok\n'
+    assert b''.join(app.iter_export(df, 'jsonl')) == b''
+
+def test_download_parts(app, tmp_path, monkeypatch):
+    monkeypatch.setattr(app, 'TEMP_RESULTS_DIR', tmp_path)
+    monkeypatch.setattr(app, 'JOBS_DIR', tmp_path)
+    monkeypatch.setattr(app, 'JOB_STORE', app.SQLiteJobStore(tmp_path / 'jobs.db'))
+    monkeypatch.setattr(app, 'JOB_RUNNER', 'external')
+    df = sample()
+    app.save_result_frame('job_matched', 'j', df)
+    app.update_job_status('j', 'completed', 100, 'Tamamlandı.', result_file='j.xlsx', detail={'parts': ['matched']})
+    client = app.app.test_client()
+    res = client.get('/api/v1/download/j?part=matched&format=csv.gz')
+    assert res.status_code == 200 and res.mimetype == 'application/gzip'
+    assert gzip.decompress(res.get_data()) == df.to_csv(index=False).encode('utf-8')
+    assert client.get('/api/v1/download/j?part=upload').status_code == 404
+    assert client.get('/api/v1/download/j?part=matched&format=xml').status_code == 400
+    monkeypatch.setattr(app, 'JOB_TTL_HOURS', -1)
+    app.expire_jobs(force=True)
+    assert not app.result_store_path('job_matched', 'j').exists()
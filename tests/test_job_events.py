@@ -0,0 +1,61 @@
+# İlerleme akışı (SSE) ve aşama içi ilerleme kaydı
+import json
+import threading
+import time
+
+import pytest
+
+@pytest.fixture
+def store(app, tmp_path, monkeypatch):
+    monkeypatch.setattr(app, 'JOBS_DIR', tmp_path)
+    monkeypatch.setattr(app, 'JOB_QUEUE_DIR', tmp_path)
+    monkeypatch.setattr(app, 'JOB_STORE', app.SQLiteJobStore(tmp_path / 'jobs.db'))
+    monkeypatch.setattr(app, 'JOB_EVENTS_POLL_S', 0.01)
+    monkeypatch.setattr(app, 'JOB_RUNNER', 'external')
+    return app.JOB_STORE
+
+def events(body):
+    out = []
+    for block in body.split('\n\n'):
+        lines = dict(l.split(': ', 1) for l in block.splitlines() if l.startswith(('event', 'data')))
+        if 'event' in lines: out.append((lines['event'], json.loads(lines['data'])))
+    return out
+
+def test_stream_follows_job_until_end(app, store):
+    app.update_job_status('a', 'running', 10, 'Başladı')
+    def finish():
+        for p in (30, 60):
+            time.sleep(0.05); app.update_job_status('a', 'running', p, 'Sürüyor')
+        time.sleep(0.05); app.update_job_status('a', 'completed', 100, 'Bitti', result_file='a.xlsx')
+    t = threading.Thread(target=finish); t.start()
+    res = app.app.test_client().get('/api/v1/jobs/a/events')
+    body = res.get_data(as_text=True)
+    t.join()
+    assert res.mimetype == 'text/event-stream' and body.startswith('retry: ')
+    got = events(body)
+    assert [e for e, _ in got] == ['progress'] * 4 + ['end']
+    assert [d['progress'] for _, d in got[:-1]] == [10, 30, 60, 100]
+    assert got[-1][1] == {'status': 'completed'}
+
+def test_stream_unknown_job(app, store):
+    assert app.app.test_client().get('/api/v1/jobs/yok/events').status_code == 404
+
+def test_stream_closes_after_max_duration(app, store, monkeypatch):
+    monkeypatch.setattr(app, 'JOB_EVENTS_MAX_S', 0.1)
+    app.update_job_status('b', 'running', 10, 'Uzun iş')
+    got = events(app.app.test_client().get('/api/v1/jobs/b/events').get_data(as_text=True))
+    assert [e for e, _ in got] == ['progress']
+
+def test_stage_progress_maps_rows_to_band(app, store):
+    app.update_job_status('c', 'running', 40, 'Aşama')
+    p = app.StageProgress('c', 40, 59, 'Aşama', min_interval=3600)
+    p(0, 200)
+    rec = store.get('c')
+    assert rec['progress'] == 40 and rec['detail']['rows_done'] == 0 and rec['detail']['rows_total'] == 200
+    p(100, 200)   # aralık dolmadan yazılmaz
+    assert store.get('c')['detail']['rows_done'] == 0
+    time.sleep(0.01)
+    p(200, 200)   # son bildirim her zaman yazılır
+    rec = store.get('c')
+    assert rec['progress'] == 59 and rec['detail']['rows_done'] == 200 and rec['detail']['rows_per_sec'] > 0
+    assert rec['message'].startswith('%59 - Aşama (200/200 satır')
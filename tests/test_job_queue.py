@@ -0,0 +1,113 @@
+# Dosya tabanlı iş kuyruğu: öncelik + FIFO sırası, dolu kuyruk, iptal ve flock slotları
+import pytest
+
+@pytest.fixture
+def queue(app, tmp_path, monkeypatch):
+    monkeypatch.setattr(app, 'JOBS_DIR', tmp_path)
+    monkeypatch.setattr(app, 'JOB_QUEUE_DIR', tmp_path / 'queue')
+    monkeypatch.setattr(app, 'JOB_STORE', app.SQLiteJobStore(tmp_path / 'jobs.db'))
+    monkeypatch.setattr(app, 'JOB_QUEUE_MAX', 4)
+    monkeypatch.setattr(app, 'JOB_WORKERS', 2)
+    (tmp_path / 'queue').mkdir()
+    return tmp_path
+
+def enqueue(app, tmp_path, job_id, *priority):
+    upload = tmp_path / f"{job_id}.xlsx"
+    upload.write_bytes(b'x')
+    return app.enqueue_job(job_id, str(upload), {'tpl_n': 'tpl'}, *priority)
+
+def test_priority_then_fifo(app, queue):
+    for job_id, prio in (('a', 5), ('b', 9), ('c', 5), ('d', 0)):
+        assert enqueue(app, queue, job_id, prio)
+    assert [app.queue_position(j) for j in 'abcd'] == [2, 1, 3, 4]
+    assert app.read_job_status('a')['status'] == 'queued'
+    assert [app._claim_next_job()['job_id'] for _ in range(4)] == ['b', 'a', 'c', 'd']
+    assert app._claim_next_job() is None
+
+def test_spec_kwargs_named_and_legacy(app, queue):
+    enqueue(app, queue, 'k', 3)
+    spec = app._claim_next_job()
+    assert spec['priority'] == 3
+    assert app.job_spec_kwargs(spec) == {'tpl_n': 'tpl', 'job_id': 'k', 'mp_path': str(queue / 'k.xlsx')}
+    # Eski konumsal kayıt run_matching_job parametre adlarıyla eşlenir
+    legacy = app.job_spec_kwargs({'job_id': 'e', 'args': ['e', 'tpl', None, '/tmp/e.xlsx']})
+    assert list(legacy) == list(app.inspect.signature(app.run_matching_job).parameters)[:4]
+    assert legacy['job_id'] == 'e' and legacy['mp_path'] == '/tmp/e.xlsx'
+
+def test_full_queue_is_rejected(app, queue):
+    for i in range(4): assert enqueue(app, queue, f"j{i}")
+    assert not enqueue(app, queue, 'fazla')
+    assert app.read_job_status('fazla') is None and app.queue_position('fazla') is None
+
+@pytest.mark.parametrize('value,expected', [('9', 9), (12, 9), (-3, 0), ('abc', 5), (None, 5)])
+def test_parse_priority(app, value, expected):
+    assert app.parse_job_priority(value) == expected
+
+def test_cancel_queued_and_running(app, queue):
+    enqueue(app, queue, 'q')
+    assert app.cancel_job('q') == 'cancelled'
+    assert app.queue_position('q') is None and not (queue / 'q.xlsx').exists()
+    assert app.read_job_status('q')['status'] == 'cancelled'
+    # Çalışan işe bayrak bırakılır; iş bir sonraki adım geçişinde JobCancelled ile durur
+    app.update_job_status('r', 'running', 10, 'adım')
+    assert app.cancel_job('r') == 'cancelling'
+    with pytest.raises(app.JobCancelled):
+        app.update_job_status('r', 'running', 20, 'sonraki adım')
+    app.update_job_status('s', 'completed', 100, 'bitti')
+    assert app.cancel_job('s') == 'completed'
+    assert app.cancel_job('yok') is None
+
+def test_slots_cap_concurrency(app, queue):
+    first, second = app._acquire_job_slot(), app._acquire_job_slot()
+    assert first is not None and second is not None and app._acquire_job_slot() is None
+    first.close()
+    third = app._acquire_job_slot()
+    assert third is not None
+    second.close(); third.close()
+
+def test_http_status_and_delete(app, queue, monkeypatch):
+    monkeypatch.setattr(app, 'JOB_RUNNER', 'external')
+    client = app.app.test_client()
+    enqueue(app, queue, 'h')
+    assert client.get('/api/v1/jobs/h').get_json()['queue_position'] == 1
+    assert client.delete('/api/v1/jobs/h').get_json() == {'status': 'cancelled'}
+    app.update_job_status('t', 'completed', 100, 'bitti')
+    assert client.delete('/api/v1/jobs/t').status_code == 409
+    assert client.get('/api/v1/jobs/yok').status_code == 404
+
+def test_orphaned_running_jobs_are_requeued(app, queue):
+    enqueue(app, queue, 'a', 7)
+    enqueue(app, queue, 'b')
+    slot = app._acquire_job_slot()
+    spec = app._claim_next_job(slot)
+    app.update_job_status('a', 'running', 40, 'adım')
+    assert spec['job_id'] == 'a' and app.queue_position('a') is None
+    # Sahip süreç yaşıyor ve slot kilidi tutuluyor: dokunulmaz
+    assert app.reclaim_orphaned_jobs() == 0
+    slot.close()
+    # Slot kilidi düştü: iş aynı önceliğiyle yeniden sıraya girer
+    assert app.reclaim_orphaned_jobs() == 1
+    assert app.queue_position('a') == 1 and app.read_job_status('a')['status'] == 'queued'
+    spec = app._claim_next_job(app._acquire_job_slot())
+    app._release_job_claim(spec)
+    assert not list((queue / 'queue').glob('*.running'))
+
+def test_dead_owner_missing_upload_and_cancel(app, queue):
+    import json, subprocess
+    dead = subprocess.Popen(['true']); dead.wait()
+    slots = [app._acquire_job_slot() for _ in range(2)]
+    for job_id in ('d', 'm', 'c'):
+        enqueue(app, queue, job_id)
+        app._claim_next_job(slots[0])
+        app.update_job_status(job_id, 'running', 40, 'adım')
+    # Slot başka bir iş tarafından tutulsa da aynı makinedeki sahip PID ölmüşse iş sahipsizdir
+    for claim in (queue / 'queue').glob('*.running'):
+        spec = json.loads(claim.read_text())
+        spec['owner']['pid'] = dead.pid
+        claim.write_text(json.dumps(spec))
+    (queue / 'm.xlsx').unlink()
+    app.JOB_STORE.request_cancel('c')
+    assert app.reclaim_orphaned_jobs() == 3
+    assert [app.read_job_status(j)['status'] for j in 'dmc'] == ['queued', 'error', 'cancelled']
+    assert app.queue_position('d') == 1 and not (queue / 'c.xlsx').exists()
+    for s in slots: s.close()
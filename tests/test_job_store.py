@@ -0,0 +1,58 @@
+# İş durumu depoları (SQLite ve dosya) aynı arayüzü aynı anlamla sunmalı
+import time
+
+import pytest
+
+@pytest.fixture(params=['sqlite', 'files'])
+def store(app, tmp_path, monkeypatch, request):
+    monkeypatch.setattr(app, 'JOBS_DIR', tmp_path)
+    monkeypatch.setattr(app, 'TEMP_RESULTS_DIR', tmp_path)
+    monkeypatch.setattr(app, 'JOB_STORE', app.JOB_STORE_BACKENDS[request.param]())
+    return app.JOB_STORE
+
+def test_put_get_keeps_created(app, store):
+    app.update_job_status('a', 'queued', 0, 'Sırada')
+    first = store.get('a')
+    time.sleep(0.01)
+    app.update_job_status('a', 'running', 40, 'Eşleştiriliyor')
+    rec = store.get('a')
+    assert {k: rec[k] for k in app.JOB_FIELDS} == {'status': 'running', 'progress': 40, 'message': '%40 - Eşleştiriliyor',
+                                                   'result_file': None, 'error': None, 'detail': None}
+    assert rec['job_id'] == 'a' and rec['created'] == first['created'] < rec['timestamp']
+    assert store.get('yok') is None
+
+def test_list_filters_and_orders(app, store):
+    for job_id, status in (('a', 'completed'), ('b', 'running'), ('c', 'queued'), ('d', 'failed')):
+        app.update_job_status(job_id, status, 0, '')
+        time.sleep(0.01)
+    assert [r['job_id'] for r in store.list()] == ['d', 'c', 'b', 'a']
+    assert [r['job_id'] for r in store.list(app.JOB_ACTIVE_STATUSES)] == ['c', 'b']
+    assert len(store.list(limit=2)) == 2
+
+def test_cancel_request(app, store):
+    app.update_job_status('a', 'running', 10, '')
+    assert not store.cancel_requested('a')
+    store.request_cancel('a')
+    assert store.cancel_requested('a')
+    with pytest.raises(app.JobCancelled):
+        app.update_job_status('a', 'running', 20, '')
+
+def test_expire_removes_records_and_reports(app, store, tmp_path, monkeypatch):
+    app.update_job_status('eski', 'completed', 100, '', result_file='eski.xlsx')
+    app.update_job_status('calisan', 'running', 10, '')
+    (tmp_path / 'eski.xlsx').write_bytes(b'x')
+    assert app.expire_jobs(force=True) == 0
+    monkeypatch.setattr(app, 'JOB_TTL_HOURS', -1)
+    assert app.expire_jobs(force=True) == 2
+    assert store.get('eski') is None and not (tmp_path / 'eski.xlsx').exists()
+    # Zorlanmayan temizlik JOB_PURGE_INTERVAL_S dolmadan tekrar çalışmaz
+    app.update_job_status('yeni', 'running', 10, '')
+    assert app.expire_jobs() == 0 and store.get('yeni') is not None
+
+def test_list_endpoint(app, store, monkeypatch):
+    monkeypatch.setattr(app, 'JOB_RUNNER', 'external')
+    app.update_job_status('a', 'completed', 100, '')
+    app.update_job_status('b', 'running', 10, '')
+    client = app.app.test_client()
+    assert [j['job_id'] for j in client.get('/api/v1/jobs?scope=active').get_json()['jobs']] == ['b']
+    assert {j['job_id'] for j in client.get('/api/v1/jobs').get_json()['jobs']} == {'a', 'b'}
@@ -0,0 +1,114 @@
+# Eşleştirme motoru: blok blok seyrek top-k araması yoğun benzerlik matrisiyle aynı adayları vermeli
+import numpy as np
+import pandas as pd
+import pytest
+from scipy import sparse
+
+def normalized(rng, rows, cols, density):
+    m = sparse.random(rows, cols, density=density, format='csr', random_state=rng, dtype=np.float32)
+    norms = np.sqrt(np.asarray(m.multiply(m).sum(axis=1)).ravel()); norms[norms == 0] = 1
+    return (sparse.diags(1 / norms) @ m).tocsr().astype(np.float32)
+
+def dense_top_k(q, idx, k):
+    # Skor azalan, eşitlikte küçük indeks önce
+    sims = (q @ idx.T).toarray()
+    order = np.lexsort((np.broadcast_to(np.arange(sims.shape[1]), sims.shape), -sims), axis=-1)[:, :k]
+    return order, np.take_along_axis(sims, order, axis=1)
+
+@pytest.mark.parametrize('k', [1, 3])
+@pytest.mark.parametrize('budget_mb', [256, 0.001])   # 0.001 MB: her blok tek satır
+def test_sparse_top_k_matches_dense(app, k, budget_mb):
+    rng = np.random.default_rng(1)
+    q, idx = normalized(rng, 40, 30, 0.2), normalized(rng, 25, 30, 0.2)
+    top_idx, top_score = app.sparse_top_k(q, idx, k=k, memory_budget_mb=budget_mb)
+    ref_idx, ref_score = dense_top_k(q, idx, k)
+    np.testing.assert_allclose(top_score, ref_score, rtol=1e-6)
+    # Skoru eşit olmayan adaylar aynı sırada gelmeli
+    distinct = np.abs(ref_score[:, :, None] - ref_score[:, None, :]) + np.eye(k)[None] > 1e-6
+    rows = distinct.all(axis=(1, 2))
+    np.testing.assert_array_equal(top_idx[rows], ref_idx[rows])
+
+def test_sparse_top_k_ties_and_empty(app):
+    idx = sparse.csr_matrix(np.array([[1, 0], [1, 0], [0, 1]], dtype=np.float32))
+    q = sparse.csr_matrix(np.array([[1, 0], [0, 0]], dtype=np.float32))
+    top_idx, top_score = app.sparse_top_k(q, idx, k=2)
+    assert top_idx[0].tolist() == [0, 1] and top_score[0].tolist() == [1.0, 1.0]
+    assert top_score[1].tolist() == [0.0, 0.0]
+    top_idx, _ = app.sparse_top_k(q, idx, k=5)          # k katalogdan büyükse katalog boyuna indirilir
+    assert top_idx.shape == (2, 3)
+    empty_idx, empty_score = app.sparse_top_k(q[:0], idx, k=1)
+    assert empty_idx.shape == (0, 1) and empty_score.shape == (0, 1)
+
+BRANDS = ['BOSCH', 'MAKITA', 'CETA FORM', 'IZELTAS', 'KNIPEX', 'DEWALT', '']
+PRODUCTS = ['Darbeli Matkap', 'Pense', 'Tornavida Seti', 'Kırıcı Delici', 'Avuç Taşlama', 'Lokma Takımı']
+CODES = ['GSB 180-LI', 'HR2470', 'D25133K', 'K-310', '', '', '', '']
+EXTRAS = ['18V', '13 mm', '6 Parca', '12 Parca', '2 Akülü', '750W', '']
+
+def catalog(rng, n):
+    pick = lambda xs: xs[rng.integers(len(xs))]
+    rows = [(pick(BRANDS), f"{pick(PRODUCTS)} {pick(CODES)} {pick(EXTRAS)} {pick(EXTRAS)}") for _ in range(n)]
+    return [(b, f"{b} {t}" if b and rng.random() < 0.5 else t) for b, t in rows]
+
+def variants(rng, rows, n):
+    # Katalog satırlarından türetilmiş pazaryeri satırları (marka düşer/değişir, bir ek değişir) ve kaynak satırları
+    src = rng.integers(len(rows), size=n)
+    out = []
+    for i in src:
+        brand, title = rows[i]
+        if rng.random() < 0.3: brand = BRANDS[rng.integers(len(BRANDS))]
+        if rng.random() < 0.5:
+            product = next(p for p in PRODUCTS if p in title)
+            title = title.replace(product, PRODUCTS[rng.integers(len(PRODUCTS))])
+        if rng.random() < 0.4:
+            extra = [e for e in EXTRAS if e and e in title]
+            if extra: title = title.replace(extra[0], EXTRAS[rng.integers(len(EXTRAS))], 1)
+        out.append((brand, title))
+    return out, src
+
+def reference_decision(m, mp_row, int_row, vector_score):
+    # Eski run_engine döngüsündeki satır bazlı karar ağacı
+    if vector_score < 0.15: return "Eşleşmedi", 0.0
+    mp_title, int_title = str(mp_row['MP_Urun_Adi']), str(int_row['ic_urun_adi'])
+    b1, b2 = m.detect_brand_smart(mp_row, 'mp'), m.detect_brand_smart(int_row, 'int')
+    brand_conflict = m.is_brand_conflict(b1, b2)
+    brands_match = b1 == b2 and b1 != "TANIMSIZ"
+    n1, n2 = m.get_numbers(m.normalize_text(mp_title)), m.get_numbers(m.normalize_text(int_title))
+    numeric = bool(n1 and n2 and (n1 <= n2 or n2 <= n1))
+    codes1, codes2 = m.extract_identity_codes(mp_title), m.extract_identity_codes(int_title)
+    strong = any(len(c) >= 3 for c in codes1 & codes2)
+    if not strong:
+        compact = m.normalize_text(mp_title).replace(" ", "")
+        strong = any(len(c) > 3 and c.lower() in compact for c in codes2)
+    set_conflict = m.check_set_count_conflict(mp_title, int_title)
+    score = m.calculate_hybrid_score(vector_score, mp_title, int_title)
+    if brand_conflict:
+        d = "Füzyon (Marka Farklı ama Kod ve Sayılar Aynı)" if strong and not set_conflict and numeric else "Eşleşmedi (Marka Çatışması)"
+    elif set_conflict: d = "Eşleşmedi (Set Sayısı Farkı)"
+    elif strong: d = "Füzyon (Altın Kod)"
+    elif brands_match:
+        d = "Füzyon (Güvenli Marka)" if score > m.THRESHOLD_TRUSTED else "Füzyon (Marka + Sayısal Eşleşme)" if numeric and score > 0.25 else "Eşleşmedi"
+    elif numeric and score > m.THRESHOLD_NUMERIC: d = "Füzyon (Güçlü Sayısal Benzerlik)"
+    elif score > m.THRESHOLD_HIGH: d = "Füzyon (Yüksek Metin Benzerliği)"
+    else: d = "Eşleşmedi"
+    return d, score
+
+@pytest.mark.parametrize('k', [1, 3])
+def test_evaluate_candidates_matches_row_rules(app, k):
+    rng = np.random.default_rng(k)
+    rows = catalog(rng, 60)
+    int_df = pd.DataFrame(rows, columns=['marka', 'ic_urun_adi'])
+    mp_rows, src = variants(rng, rows, 300)
+    mp_df = pd.DataFrame(mp_rows, columns=['MP_Marka', 'MP_Urun_Adi'])
+    m = app.UniversalSmartMatcher(int_df, mp_df)
+    mp_f = m.build_side_features(mp_df, 'MP_Marka', 'MP_Urun_Adi')
+    int_f = m.build_side_features(int_df, 'marka', 'ic_urun_adi')
+    top_idx = rng.integers(0, len(int_df), (len(mp_df), k))
+    top_idx[:, 0] = src
+    top_scores = np.sort(np.round(rng.uniform(0.05, 1.0, (len(mp_df), k)), 3).astype(np.float32), axis=1)[:, ::-1].copy()
+    decision, score, cand, accepted = m.evaluate_candidates(mp_f, int_f, top_idx, top_scores)
+    for i in range(len(mp_df)):
+        # Adaylar sırayla denenir: ilk kabul edilen kazanır, yoksa en iyi adayın kararı
+        refs = [reference_decision(m, mp_df.iloc[i], int_df.iloc[top_idx[i, j]], float(top_scores[i, j])) for j in range(k)]
+        j = next((j for j, (d, _) in enumerate(refs) if d.startswith("Füzyon")), 0)
+        assert (decision[i], cand[i], bool(accepted[i])) == (refs[j][0], top_idx[i, j], refs[j][0].startswith("Füzyon"))
+        assert score[i] == pytest.approx(refs[j][1], abs=1e-5)
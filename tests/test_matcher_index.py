@@ -0,0 +1,70 @@
+# Kalıcı iç katalog indeksi: diske yazılıp okunan ve artımlı güncellenen indeks, aynı sözlükle sıfırdan vektörleştirmeyle aynı olmalı
+import shutil
+
+import numpy as np
+import pandas as pd
+import pytest
+
+TITLES = ['Bosch GSB 180-LI Darbeli Matkap 18V', 'Makita HR2470 Kırıcı Delici 780W', 'Knipex 0301 Pense 180 mm',
+          'Ceta Form K-310 Tornavida Seti 6 Parca', 'Izeltas Lokma Takımı 12 Parca', 'Dewalt D25133K Kırıcı 800W',
+          'Bosch GWS 750 Avuç Taşlama 115 mm', 'Makita DF333 Vidalama 12V 2 Akülü']
+
+@pytest.fixture
+def index_dir(app, tmp_path, monkeypatch):
+    monkeypatch.setattr(app, 'TEMP_RESULTS_DIR', tmp_path)
+    monkeypatch.setattr(app, 'MATCHER_INDEX_LATEST', tmp_path / 'matcher_index_latest.json')
+    return tmp_path
+
+def catalog(app, titles):
+    df = pd.DataFrame({'ic_urun_adi': titles, 'marka': [t.split()[0].upper() for t in titles]})
+    matcher = app.UniversalSmartMatcher(df, pd.DataFrame({'MP_Urun_Adi': []}))
+    df['norm_name'] = df['ic_urun_adi'].map(matcher.normalize_text)
+    return df, matcher
+
+def test_save_load_round_trip(app, index_dir):
+    df, matcher = catalog(app, TITLES)
+    index = app.MatcherIndex.fit(df, matcher)
+    index.save(app.matcher_index_path('k1'))
+    loaded = app.MatcherIndex.load(app.matcher_index_path('k1'))
+    assert loaded.vocabulary == index.vocabulary and loaded.n_docs == index.n_docs
+    np.testing.assert_array_equal(loaded.idf, index.idf)
+    np.testing.assert_array_equal(loaded.row_keys, index.row_keys)
+    np.testing.assert_array_equal(loaded.matrix.toarray(), index.matrix.toarray())
+    pd.testing.assert_frame_equal(loaded.features, index.features)
+
+def test_update_equals_transform_with_same_vocabulary(app, index_dir):
+    df, matcher = catalog(app, TITLES)
+    index = app.MatcherIndex.fit(df, matcher)
+    # Bir satır değişti, bir satır eklendi, sıra değişti
+    edited = TITLES[::-1] + ['Knipex 0302 Pense 200 mm']
+    edited[2] = 'Ceta Form K-310 Tornavida Seti 8 Parca'
+    df2, _ = catalog(app, edited)
+    updated = index.update(df2, matcher)
+    np.testing.assert_allclose(updated.matrix.toarray(), index.transform(df2['norm_name']).toarray(), rtol=1e-6)
+    fresh = matcher.build_side_features(df2, 'marka', 'ic_urun_adi').reset_index(drop=True)
+    pd.testing.assert_frame_equal(updated.features, fresh)
+    assert (updated.locate(app.catalog_row_keys(df2)) == np.arange(len(df2))).all()
+
+def test_load_matcher_index_reuses_saved_index(app, index_dir, monkeypatch):
+    df, matcher = catalog(app, TITLES)
+    first = app.load_matcher_index('k1', df, matcher)
+    again = app.load_matcher_index('k1', df, matcher)
+    assert again.built_at == first.built_at
+    # Başka bir anahtar, son kaydedilen indeksten artımlı kurulur (aynı sözlük)
+    other = app.load_matcher_index('k2', df.iloc[:-1].reset_index(drop=True), matcher)
+    assert other.built_at == first.built_at and other.vocabulary == first.vocabulary
+    # Yaş sınırı aşılınca sıfırdan kurulur
+    monkeypatch.setattr(app, 'MATCH_INDEX_MAX_AGE_H', -1)
+    assert app.load_matcher_index('k1', df, matcher).built_at > first.built_at
+
+def test_no_pickle_and_old_format_is_refit(app, index_dir):
+    df, matcher = catalog(app, TITLES)
+    first = app.load_matcher_index('k1', df, matcher)
+    path = app.matcher_index_path('k1')
+    assert not list(path.rglob('*.pkl'))
+    # Eski sürümün indeksinde özellikler features.pkl içindeydi: okunmaz, indeks yeniden kurulur
+    shutil.rmtree(app.result_store_path('index', 'features', root=path))
+    (path / 'features.pkl').write_bytes(b'eski')
+    with pytest.raises(Exception):
+        app.MatcherIndex.load(path)
+    assert app.load_matcher_index('k1', df, matcher).built_at > first.built_at
@@ -0,0 +1,82 @@
+# Aşama ölçümleri: span kaydı (iç içe, paralel parçalar), birikimli histogramlar ve Prometheus metin çıktısı
+import time
+
+import pytest
+
+@pytest.fixture
+def metrics(app, tmp_path, monkeypatch):
+    monkeypatch.setattr(app, 'JOBS_DIR', tmp_path)
+    monkeypatch.setattr(app, 'METRICS_FILE', tmp_path / 'metrics.json')
+    monkeypatch.setattr(app, 'JOB_QUEUE_DIR', tmp_path / 'queue')
+    monkeypatch.setattr(app, 'JOB_STORE', app.SQLiteJobStore(tmp_path / 'jobs.db'))
+    (tmp_path / 'queue').mkdir()
+    return tmp_path
+
+def test_span_without_recorder_is_noop(app):
+    assert app.current_spans() is None
+    with app.span('okuma', rows=3) as sp: sp['rows'] = 5
+    assert app.current_spans() is None
+
+def test_nested_and_repeated_spans(app):
+    with app.SpanRecorder().active() as rec:
+        assert app.current_spans() is rec
+        with app.span('dis', rows=10):
+            with app.span('ic') as sp:
+                time.sleep(0.02)
+                sp['rows'] = 4
+            with app.span('ic', rows=6): pass
+    assert app.current_spans() is None
+    totals = rec.totals
+    assert totals['ic']['calls'] == 2 and totals['ic']['rows'] == 10
+    assert totals['dis']['calls'] == 1 and totals['dis']['rows'] == 10
+    assert totals['dis']['wall_s'] >= totals['ic']['wall_s'] >= 0.02
+    assert totals['dis']['peak_rss_mb'] > 0
+    summary = rec.summary()
+    assert [s['stage'] for s in summary] == ['ic', 'dis', 'total']
+
+def test_phases_close_previous(app):
+    rec = app.SpanRecorder()
+    prev = rec.attach()
+    rec.phase('a', rows=1)
+    rec.phase('b')['rows'] = 2
+    rec.detach(prev)
+    assert {k: (t['calls'], t['rows']) for k, t in rec.totals.items()} == {'a': (1, 1), 'b': (1, 2)}
+    assert app.current_spans() is None
+
+def test_parallel_spans_are_merged(app, monkeypatch, forking):
+    monkeypatch.setattr(app, 'PARALLEL_MIN_ITEMS', 0)
+    def work(shard):
+        with app.span('parca', rows=len(shard)): return sum(shard)
+    with app.SpanRecorder().active() as rec:
+        out = app.parallel_map(work, [[1, 2], [3], [4, 5, 6]], workers=3)
+    assert out == [3, 3, 15]
+    assert rec.totals['parca']['calls'] == 3 and rec.totals['parca']['rows'] == 6
+
+def test_record_and_render(app, metrics):
+    summary = [{'stage': 'file_read', 'wall_s': 0.2, 'cpu_s': 0.1, 'peak_rss_mb': 40.0, 'rows': 100, 'calls': 1},
+               {'stage': 'total', 'wall_s': 7.0}]
+    app.record_stage_metrics('match', summary, 'completed')
+    app.record_stage_metrics('match', summary, 'error')
+    text = app.render_metrics()
+    assert 'stokcu_stage_wall_seconds_bucket{pipeline="match",stage="file_read",le="0.1"} 0' in text
+    assert 'stokcu_stage_wall_seconds_bucket{pipeline="match",stage="file_read",le="0.25"} 2' in text
+    assert 'stokcu_stage_wall_seconds_bucket{pipeline="match",stage="total",le="5"} 0' in text
+    assert 'stokcu_stage_wall_seconds_count{pipeline="match",stage="total"} 2' in text
+    assert 'stokcu_stage_cpu_seconds_sum{pipeline="match",stage="file_read"} 0.200000' in text
+    assert 'stokcu_stage_peak_rss_bytes_bucket{pipeline="match",stage="file_read",le="67108864"} 2' in text
+    assert 'stokcu_stage_peak_rss_bytes_bucket{pipeline="match",stage="file_read",le="33554432"} 0' in text
+    assert 'stokcu_stage_rows_total{pipeline="match",stage="file_read"} 200' in text
+    assert 'stage="total"} 200' not in text and 'stokcu_stage_cpu_seconds_count{pipeline="match",stage="total"}' not in text
+    assert 'stokcu_runs_total{pipeline="match",status="completed"} 1' in text
+    assert 'stokcu_runs_total{pipeline="match",status="error"} 1' in text
+    assert 'stokcu_job_queue_length 0' in text and 'stokcu_jobs_running 0' in text
+
+def test_metrics_endpoint(app, metrics):
+    app.record_stage_metrics('supplier', [{'stage': 'file_read', 'wall_s': 1.0, 'cpu_s': 0.5, 'rows': 3}], 'completed')
+    with app.app.test_request_context('/api/v1/metrics'):
+        resp = app.metrics()
+    assert resp.content_type.startswith('text/plain; version=0.0.4')
+    body = resp.get_data(as_text=True)
+    assert 'stokcu_runs_total{pipeline="supplier",status="completed"} 1' in body
+    assert '# TYPE stokcu_stage_wall_seconds histogram' in body
+    assert 'stokcu_normalizer_cache_hits{cache=' in body
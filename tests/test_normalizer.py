@@ -0,0 +1,77 @@
+# TextNormalizer, önbelleksiz eski normalize fonksiyonlarıyla aynı metni üretmeli
+import re
+
+import numpy as np
+import pandas as pd
+
+def ref_units(text):
+    if not text: return ""
+    text = text.lower()
+    text = re.sub(r'(\d+)\s+(mm|cm|mt|m|gr|kg|w|v|lt|ml|bar|adet|pcs|set)\b', r'\1\2', text)
+    replacements = {"watt": "w", "volt": "v", "amper": "amp", "siyah": "", "beyaz": "", "kirmizi": "", "mavi": "", "sari": "",
+                    "yesil": "", "turuncu": "", "takim": "set", "cift": "set"}
+    for k, v in replacements.items(): text = re.sub(r'\b' + k + r'\b', v, text)
+    return text
+
+def ref_strict(text):
+    if not text: return ""
+    text = str(text).lower()
+    text = text.replace('ı', 'i').replace('ğ', 'g').replace('ü', 'u').replace('ş', 's').replace('ö', 'o').replace('ç', 'c')
+    return re.sub(r'[^a-z0-9]', '', ref_units(text))
+
+def ref_match_code(code):
+    if not code or pd.isna(code): return "KOD_YOK"
+    s = str(code).upper().strip()
+    for pre in ["CETA", "IZELTAS", "BOSCH", "MAKITA", "DEWALT", "KNIPEX", "CERPA", "ELTA", "RTR", "ATTLAS"]:
+        if s.startswith(pre):
+            s = re.sub(f'^{pre}[-\\s\\.]*', '', s)
+            break
+    return re.sub(r'[^A-Z0-9]', '', s)
+
+def ref_title(text):
+    if not isinstance(text, str): return ""
+    text = re.sub(r'\b(rm_|tyc_|hbv|akn_|frkn)\w*', '', text.lower())
+    text = text.replace("frkn", "").translate(str.maketrans("ğüşıöçâêîôû", "gusiocaeiou"))
+    text = ref_units(text)
+    for w in ["orijinal", "ithal", "yerli", "uretim", "yeni", "kampanya", "kargo", "bedava", "firsati", "garantili"]:
+        text = text.replace(w, "")
+    text = re.sub(r'[^a-z0-9\s]', ' ', text)
+    return re.sub(r'\s+', ' ', text).strip()
+
+WORDS = ['Bosch', 'BOSCH-GSR', 'ceta.form', 'Makita', 'RTRMAX', 'watt', 'Volt', 'siyah', 'Takım', 'çift', 'kırmızı', '12',
+         '750', 'W', 'mm', 'set', 'adet', 'rm_x1', 'TYC_99', 'frkn', 'Orijinal', 'yeniden', 'İzeltaş', 'Şarjlı', 'âlet',
+         '-', '/', '  ', '\t', '2 Akülü', '13 mm', 'kargo', 'ATTLAS 7']
+
+def texts(n=3000, seed=4):
+    rng = np.random.default_rng(seed)
+    return [' '.join(rng.choice(WORDS, rng.integers(0, 6))) for _ in range(n)] + ['', None, float('nan'), 12, 'BOSCH', 'bosch']
+
+def test_scalar_functions_match_reference(app):
+    n = app.TextNormalizer(maxsize=64)
+    for t in texts():
+        s = t if isinstance(t, str) else ''
+        assert n.units(s) == ref_units(s)
+        assert n.strict(t) == ref_strict(t)
+        assert n.match_code(t) == ref_match_code(t)
+        assert n.title(t) == ref_title(t)
+        assert n.tokens(t) == frozenset(ref_title(t).split())
+
+def test_columns_and_wrappers(app):
+    # Hat bu kolonlara boşları doldurulmuş metin verir
+    values = pd.Series([t for t in texts(500) if isinstance(t, str)])
+    values.index = values.index * 3
+    n = app.TextNormalizer()
+    assert n.match_code_column(values).tolist() == [ref_match_code(v) for v in values]
+    assert n.strict_column(values).tolist() == [ref_strict(v) for v in values]
+    assert n.title_column(values).tolist() == [ref_title(v) for v in values]
+    assert app.generate_match_code('CETA-FORM 12') == ref_match_code('CETA-FORM 12')
+    assert app.strict_normalize('Çift 12 mm') == ref_strict('Çift 12 mm')
+
+def test_stats_and_clear(app):
+    n = app.TextNormalizer(maxsize=2)
+    for t in ['a', 'b', 'a', 'c', 'a']: n.match_code(t)  # c, b'yi düşürür
+    assert n.stats()['match_code'] == {'hits': 2, 'misses': 3, 'size': 2, 'maxsize': 2}
+    n.clear()
+    assert n.stats()['match_code']['size'] == 0
+    with app.app.app_context():
+        assert set(app.normalizer_stats().get_json()) == {'units', 'strict', 'match_code', 'title', 'tokens'}
@@ -0,0 +1,89 @@
+# Çok süreçli çalıştırma: parçalara bölüp fork ile çalıştırmak, aynı işi tek süreçte yapmakla aynı sonucu vermeli
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+pytestmark = pytest.mark.usefixtures('forking')
+
+def test_parallel_map_keeps_order_and_forks(app):
+    parent = os.getpid()
+    out = app.parallel_map(lambda s: (s, os.getpid()), list(range(7)), workers=3)
+    assert [s for s, _ in out] == list(range(7))
+    assert all(pid != parent for _, pid in out)
+    assert app.parallel_map(lambda s: (s, os.getpid()), [1, 2], workers=1) == [(1, parent), (2, parent)]
+
+def test_small_work_runs_inline(app, monkeypatch):
+    parent = os.getpid()
+    monkeypatch.setattr(app, 'PARALLEL_MIN_ITEMS', 10)
+    # Çerçeve/liste parçalarında toplam satır sayısı, diğerlerinde verilen items eşikle karşılaştırılır
+    shards = [pd.DataFrame({'a': range(3)}), pd.DataFrame({'a': range(4)})]
+    assert app.parallel_map(lambda s: os.getpid(), shards, workers=2) == [parent, parent]
+    assert all(pid != parent for pid in app.parallel_map(lambda s: os.getpid(), shards * 2, workers=2))
+    assert app.parallel_map(lambda s: os.getpid(), [1, 2], workers=2, items=9) == [parent, parent]
+    s = pd.Series(['a', 'b', 'a'] * 10)
+    assert app.map_unique(s, lambda v: os.getpid(), workers=2).eq(parent).all()
+
+def test_embedded_runner_never_forks(app, monkeypatch):
+    # Gömülü kipte (gthread worker'ı) MATCH_WORKERS da iş bazındaki workers da 1'e iner
+    parent = os.getpid()
+    monkeypatch.setattr(app, 'JOB_RUNNER', 'embedded')
+    monkeypatch.setattr(app, 'PARALLEL_MIN_ITEMS', 0)
+    monkeypatch.setattr(app, 'MATCH_WORKERS', 4)
+    assert app.parallel_map(lambda s: os.getpid(), list(range(4)), workers=app.MATCH_WORKERS) == [parent] * 4
+    assert app.parallel_map(lambda s: os.getpid(), list(range(4)), workers='3') == [parent] * 4
+
+@pytest.mark.parametrize('rows,n', [(10, 3), (2, 5), (0, 2), (7, 1)])
+def test_split_frame(app, rows, n):
+    df = pd.DataFrame({'a': range(rows)})
+    parts = app.split_frame(df, n)
+    assert len(parts) == max(1, min(n, rows))
+    assert all(len(p) for p in parts) or rows == 0
+    pd.testing.assert_frame_equal(pd.concat(parts), df)
+
+def test_map_unique_parallel(app):
+    s = pd.Series(['b', 'a', None, 'b', 'c', 'a'] * 5)
+    inline = app.map_unique(s, lambda v: f"<{v}>")
+    assert inline.tolist() == [f"<{v}>" for v in s]
+    pd.testing.assert_series_equal(app.map_unique(s, lambda v: f"<{v}>", workers=3), inline)
+
+def engine_frames():
+    titles = ['Bosch GSB 180-LI Darbeli Matkap 18V', 'Makita HR2470 Kırıcı Delici 780W', 'Knipex 0301 Pense 180 mm',
+              'Ceta Form K-310 Tornavida Seti 6 Parca', 'Izeltas Lokma Takımı 12 Parca', 'Dewalt D25133K Kırıcı 800W']
+    int_df = pd.DataFrame({'ic_urun_adi': titles, 'marka': [t.split()[0].upper() for t in titles],
+                           'anahtar_kod': [f"K{i}" for i in range(len(titles))]})
+    rng = np.random.default_rng(0)
+    mp_df = pd.DataFrame({'MP_Urun_Adi': [titles[i].replace('Parca', 'Parça').lower() for i in rng.integers(len(titles), size=40)],
+                          'MP_Marka': ''})
+    return int_df, mp_df
+
+def test_run_engine_workers_match_single_process(app, monkeypatch):
+    monkeypatch.setattr(app, 'PARALLEL_MIN_ITEMS', 0)
+    int_df, mp_df = engine_frames()
+    results = []
+    for workers in (1, 3):
+        m = app.UniversalSmartMatcher(int_df, mp_df)
+        m.WORKERS = workers   # resolve_workers çekirdek sayısıyla sınırlar; burada doğrudan ayarlanır
+        results.append(m.run_engine())
+    pd.testing.assert_frame_equal(results[0], results[1])
+    assert (results[0]['anahtar_kod'] != 'YOK').any()
+
+def test_run_engine_progress_shards_do_not_change_result(app, monkeypatch):
+    int_df, mp_df = engine_frames()
+    expected = app.UniversalSmartMatcher(int_df, mp_df).run_engine()
+    monkeypatch.setattr(app, 'MATCH_PROGRESS_ROWS', 7)
+    calls = []
+    out = app.UniversalSmartMatcher(int_df, mp_df).run_engine(progress=lambda done, total: calls.append((done, total)))
+    pd.testing.assert_frame_equal(out, expected)
+    assert [d for d, _ in calls] == sorted(d for d, _ in calls) and calls[-1][0] == calls[-1][1] and len(calls) >= 5
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_parallel_map_on_result_in_order_and_stops(app, workers):
+    seen = []
+    assert app.parallel_map(lambda s: s * 2, list(range(5)), workers, lambda i, r: seen.append((i, r))) == [0, 2, 4, 6, 8]
+    assert seen == [(i, 2 * i) for i in range(5)]
+    def stop(i, r):
+        if i == 1: raise RuntimeError('iptal')
+    with pytest.raises(RuntimeError):
+        app.parallel_map(lambda s: s, list(range(5)), workers, stop)
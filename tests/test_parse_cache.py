@@ -0,0 +1,123 @@
+# Ayrıştırma önbelleği: isabet, ıska ile aynı parçaları vermeli; anahtar içerik ve kolonlara bağlı; budama yaş ve boyuta göre
+import json
+import os
+import time
+import tracemalloc
+
+import pandas as pd
+import pytest
+
+@pytest.fixture
+def cache(app, tmp_path, monkeypatch):
+    d = tmp_path / 'cache'
+    d.mkdir()
+    monkeypatch.setattr(app, 'PARSE_CACHE_DIR', d)
+    monkeypatch.setattr(app, 'PARSE_CACHE_ENABLED', True)
+    return d
+
+def entries(cache):
+    return sorted(p.name for p in cache.iterdir() if p.name.startswith('parse_') and '.tmp' not in p.name)
+
+def write_csv(path, n=7, extra=''):
+    path.write_text('Barkod,Stok,Ürün Adı,Fiyat\n' + ''.join(f"869{i},{i},Ürün {i}{extra},\n" for i in range(n)), encoding='utf-8')
+
+def write_xlsx(path, n=7):
+    pd.DataFrame({'Barkod': [f"869{i}" for i in range(n)], 'Stok': range(n), 'Fiyat': [None] * n}).to_excel(path, index=False)
+
+@pytest.mark.parametrize('name,writer', [('f.csv', write_csv), ('f.xlsx', write_xlsx)])
+@pytest.mark.parametrize('columns', [None, {'barkod', 'fiyat'}])
+def test_hit_equals_miss(app, cache, tmp_path, name, writer, columns):
+    path = tmp_path / name
+    writer(path)
+    miss = list(app.iter_normalized_chunks(path, name, columns, chunk_rows=3))
+    assert len(entries(cache)) == 1
+    hit = list(app.iter_normalized_chunks(path, name, columns, chunk_rows=3))
+    assert [len(c) for c in hit] == [len(c) for c in pd.concat(miss).pipe(lambda d: [d.iloc[i:i + 3] for i in range(0, len(d), 3)])]
+    pd.testing.assert_frame_equal(pd.concat(hit, ignore_index=True), pd.concat(miss, ignore_index=True))
+
+def test_key_depends_on_content_columns_and_type(app, cache, tmp_path):
+    a, b = tmp_path / 'a.csv', tmp_path / 'b.csv'
+    write_csv(a); write_csv(b)
+    assert app.parse_cache_key(a, 'a.csv') == app.parse_cache_key(b, 'yeni_ad.csv')
+    assert app.parse_cache_key(a, 'a.csv', {'barkod'}) == app.parse_cache_key(a, 'a.csv', ['barkod'])
+    assert app.parse_cache_key(a, 'a.csv', {'barkod'}) != app.parse_cache_key(a, 'a.csv')
+    assert app.parse_cache_key(a, 'a.csv') != app.parse_cache_key(a, 'a.xls')
+    write_csv(b, extra='x')
+    assert app.parse_cache_key(a, 'a.csv') != app.parse_cache_key(b, 'b.csv')
+
+def test_disabled_and_duplicate_columns_are_not_cached(app, cache, tmp_path, monkeypatch):
+    path = tmp_path / 'd.csv'
+    path.write_text('Barkod,barkod \n1,2\n', encoding='utf-8')   # temizlenince iki kolon da "barkod"
+    assert list(app.iter_normalized_chunks(path, 'd.csv'))[0].columns.tolist() == ['barkod', 'barkod']
+    assert entries(cache) == []
+    monkeypatch.setattr(app, 'PARSE_CACHE_ENABLED', False)
+    write_csv(path)
+    list(app.iter_normalized_chunks(path, 'd.csv'))
+    assert entries(cache) == []
+
+def test_prune_by_age_and_size(app, cache, tmp_path, monkeypatch):
+    for i in range(3):
+        path = tmp_path / f"{i}.csv"
+        write_csv(path, n=50 + i)
+        list(app.iter_normalized_chunks(path, path.name))
+    old = cache / entries(cache)[0]
+    os.utime(old, (time.time() - 7200, time.time() - 7200))
+    monkeypatch.setattr(app, 'PARSE_CACHE_MAX_AGE_H', 1)
+    app.prune_parse_cache()
+    assert len(entries(cache)) == 2 and not old.exists()
+    # Boyut sınırı aşılınca en uzun süredir kullanılmayan önce gider; isabet kullanım zamanını günceller
+    first, second = (cache / e for e in entries(cache))
+    os.utime(first, (time.time() - 60, time.time() - 60))
+    os.utime(second, (time.time() - 30, time.time() - 30))
+    size = lambda d: sum(f.stat().st_size for f in d.rglob('*') if f.is_file())
+    monkeypatch.setattr(app, 'PARSE_CACHE_MAX_MB', (size(first) + size(second) - 1) / 1024 / 1024)
+    app.prune_parse_cache()
+    assert not first.exists() and second.exists()
+
+def peak_mb(fn):
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1] / 2 ** 20
+    finally: tracemalloc.stop()
+
+def test_multi_chunk_file_is_cached_in_parts_with_bounded_memory(app, cache, tmp_path, monkeypatch):
+    path = tmp_path / 'buyuk.csv'
+    path.write_text('Barkod,Stok,Ürün Adı,Fiyat\n' + ''.join(f"869{i:010d},{i % 50},Ürün adı {i},{i}.5\n" for i in range(30000)),
+                    encoding='utf-8')
+    def stream():
+        rows = 0
+        for chunk in app.iter_normalized_chunks(path, path.name, None, chunk_rows=500):
+            assert len(chunk) == 500
+            rows += len(chunk)
+        assert rows == 30000
+    monkeypatch.setattr(app, 'PARSE_CACHE_ENABLED', False)
+    whole = peak_mb(lambda: app.read_and_normalize_file(path, path.name))
+    plain = peak_mb(stream)
+    monkeypatch.setattr(app, 'PARSE_CACHE_ENABLED', True)
+    miss, hit = peak_mb(stream), peak_mb(stream)
+    [entry] = entries(cache)
+    with open(cache / entry / 'schema.json') as f: assert len(json.load(f)['parts']) == 60
+    # Iska da isabet de önbelleksiz akış kadar bellek kullanır: her parça ayrı yazılır ve ayrı okunur, dosyanın tamamı tutulmaz
+    assert whole > 1.5 * plain
+    assert miss < 1.25 * plain and hit < 1.25 * plain
+
+def test_abandoned_read_is_not_cached(app, cache, tmp_path):
+    path = tmp_path / 'f.csv'
+    write_csv(path, n=9)
+    chunks = app.iter_normalized_chunks(path, path.name, None, chunk_rows=3)
+    next(chunks)
+    chunks.close()
+    assert os.listdir(cache) == []
+    assert sum(len(c) for c in app.iter_normalized_chunks(path, path.name, None, chunk_rows=3)) == 9
+    assert len(entries(cache)) == 1
+
+def test_lookups_are_counted_in_metrics(app, cache, tmp_path, monkeypatch):
+    monkeypatch.setattr(app, 'JOBS_DIR', tmp_path)
+    monkeypatch.setattr(app, 'METRICS_FILE', tmp_path / 'metrics.json')
+    path = tmp_path / 'f.csv'
+    write_csv(path)
+    for _ in range(3): list(app.iter_normalized_chunks(path, 'f.csv', None, chunk_rows=3))
+    text = app.render_metrics()
+    assert 'stokcu_parse_cache_lookups_total{result="hit"} 2' in text
+    assert 'stokcu_parse_cache_lookups_total{result="miss"} 1' in text
@@ -0,0 +1,55 @@
+# Kolon ayrıştırıcıları (parse_*_column) skaler karşılıklarıyla birebir aynı sonucu vermeli
+import decimal
+
+import numpy as np
+import pytest
+
+STOCK_VALUES = [None, float('nan'), '', ' ', 'nan', 'None', '0', '5', ' 12 ', '12.9', '12,9', '-3', '+7', '1e3', '1E2', '.5',
+                'Stokta Yok', 'tükendi', 'gelince', '10 adet', 'yaklaşık 4', 'abc', '3\xa0', '1\xa0000', 7, 7.8, -2.5, 0,
+                '99999999999999999999', '4611686018427387904', '9223372036854775807', '1e30', 'inf', '-inf']
+
+PRICE_VALUES = [None, float('nan'), '', '0', 'nan', 'none', '12', '12.5', '12,5', '1.234,56', '1,234.56', '1.234.567,8',
+                ' 99 TL', '€ 1 250,00', '$12.345', '0,005', '1.2345675', '1.2345665', '12.3456785', '.5', ',75',
+                '1.2.3', 'abc', '-15,5', 12.5, 3, 0.1, '12\xa0345,67', '999999999999', '9999999999999', '99999999999999999999,5']
+
+MONEY_VALUES = [None, float('nan'), '', '12', '12.5', '12,5', '-4,25', '+3', '.5', '0.005', '0.015', '1.234', 7, 7.25, -0.5,
+                '99999999999999999', '123456789012345678901']
+
+def scaled_or_zero(value):
+    # Kolon ayrıştırıcılar int64'e sığmayan sonuçları 0 sayar
+    return value if -2 ** 63 < value < 2 ** 63 else 0
+
+def test_stock_column_matches_scalar(app):
+    expected = [scaled_or_zero(app.parse_stock_value(v)) for v in STOCK_VALUES]
+    assert app.parse_stock_column(STOCK_VALUES).tolist() == expected
+
+@pytest.mark.parametrize('scale', [2, 6])
+def test_price_column_matches_scalar(app, scale):
+    expected = [scaled_or_zero(app.decimal_to_scaled(app.parse_price_value(v), scale)) for v in PRICE_VALUES]
+    assert app.parse_price_column(PRICE_VALUES, scale).tolist() == expected
+
+def test_money_column_matches_decimal(app):
+    def ref(v):
+        if v is None or v != v or str(v).strip() == '': return 0
+        return scaled_or_zero(app.decimal_to_scaled(decimal.Decimal(str(v).replace(',', '.')), app.KURUS_SCALE))
+    assert app.parse_money_column(MONEY_VALUES).tolist() == [ref(v) for v in MONEY_VALUES]
+
+def test_money_column_rejects_invalid(app):
+    with pytest.raises(decimal.InvalidOperation):
+        app.parse_money_column(['12', 'on iki'])
+
+def test_columns_on_random_numbers(app):
+    # Rastgele tutarlar, nokta/virgül ve binlik ayraçlı biçimlerde
+    rng = np.random.default_rng(7)
+    cents = rng.integers(0, 10 ** 9, 500)
+    texts = [f"{c // 100}.{c % 100:02d}" for c in cents] + [f"{c // 100:,}".replace(',', '.') + f",{c % 100:02d}" for c in cents]
+    expected = [app.decimal_to_scaled(app.parse_price_value(t), app.KURUS_SCALE) for t in texts]
+    assert app.parse_price_column(texts, app.KURUS_SCALE).tolist() == expected
+    stocks = [str(v) for v in rng.integers(-50, 10 ** 6, 500)] + [f"{v:.3f}".replace('.', ',') for v in rng.uniform(0, 1000, 500)]
+    assert app.parse_stock_column(stocks).tolist() == [app.parse_stock_value(v) for v in stocks]
+
+def test_all_empty_chunk(app):
+    # Parça halinde okunan dosyada bir parçanın tüm değerleri boş olabilir
+    assert app.parse_price_column([None, None]).tolist() == [0, 0]
+    assert app.parse_stock_column([None]).tolist() == [0]
+    assert app.parse_money_column([None, '']).tolist() == [0, 0]
@@ -0,0 +1,48 @@
+# PriceRulePlan.rule_masks, her kural için ayrı yapılan alt dizgi kontrolüyle (eski calc_p) aynı satırları seçmeli
+import numpy as np
+import pandas as pd
+
+# İç içe / örtüşen hedefler: BLACK ⊂ BLACK DECKER, DECK ⊂ DECKER, X ⊂ KX, AB hem SKU önekinde hem isimde
+RULES = ("BLACK %5 ZAM\nBLACK DECKER %10 ZAM\nDECK 3 EKLE\nKX 2 DUS\nX %1 INDIRIM\nAB 100 TL OLSUN\n"
+         "TUM URUNLER %2 ZAM\nÇELİK %3 ZAM\nMAKITA 50 TL OLSUN\nMAKITA %7 ZAM")
+
+def reference_masks(df, rules):
+    out = np.zeros((len(df), len(rules)), dtype=bool)
+    for i, (_, row) in enumerate(df.iterrows()):
+        br, name, sku = str(row['Nihai_Marka']).upper(), str(row['Urun_Adi']).upper(), str(row['MP_SKU'])
+        for k, r in enumerate(rules):
+            out[i, k] = r['target'] == "ALL_PRODUCTS" or r['target'] in br or r['target'] in name or r['target'] in sku
+    return out
+
+def frame(rows):
+    return pd.DataFrame(rows, columns=['Nihai_Marka', 'Urun_Adi', 'MP_SKU'])
+
+def test_masks_table(app):
+    df = frame([
+        ('BLACK DECKER', 'Matkap', '1001'),
+        ('black', 'decker şarjlı', '1002'),
+        ('', 'Blackdeckerx', 'AB-1'),
+        ('MAKITA', 'Çelik Testere', 'kx-9'),
+        ('TANIMSIZ', 'Vida', 'KX9'),
+        (None, None, None),
+        ('DECKER', 'Set', 'X'),
+        ('', '', ''),
+    ])
+    rules = app.parse_natural_language_rules(RULES)
+    plan = app.PriceRulePlan(rules)
+    np.testing.assert_array_equal(plan.rule_masks(app.price_rule_columns(df), len(df)), reference_masks(df, rules))
+
+def test_masks_random(app):
+    rng = np.random.default_rng(3)
+    words = ['BLACK', 'DECKER', 'BLACKDECKER', 'KX', 'X', 'AB', 'MAKITA', 'ÇELİK', 'celik', 'deck', 'matkap', 'ucu', '12V']
+    n = 1000
+    df = frame([(' '.join(rng.choice(words, rng.integers(0, 2))), ' '.join(rng.choice(words, rng.integers(0, 4))),
+                 ''.join(rng.choice(['AB', 'KX', 'x', '-', '7', 'Q'], rng.integers(0, 4)))) for _ in range(n)])
+    rules = app.parse_natural_language_rules(RULES)
+    plan = app.PriceRulePlan(rules)
+    np.testing.assert_array_equal(plan.rule_masks(app.price_rule_columns(df), n), reference_masks(df, rules))
+
+def test_only_all_products(app):
+    plan = app.PriceRulePlan(app.parse_natural_language_rules("TUM URUNLER %10 ZAM"))
+    assert plan.targets == []
+    assert plan.rule_masks(app.price_rule_columns(frame([('A', 'B', 'C')] * 3)), 3).all()
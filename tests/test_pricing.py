@@ -0,0 +1,106 @@
+# calculate_prices (sabit noktalı Money) ile satır bazlı Decimal hesabının (eski calc_p) karşılaştırması
+import decimal
+
+import numpy as np
+import pandas as pd
+import pytest
+
+D = decimal.Decimal
+RULES = ("BOSCH %10 ZAM\nCETA %5 INDIRIM\nMAKITA 500 TL OLSUN\nKNIPEX 100 USD OLSUN\nDEWALT DOLAR KURUNA ESITLE\n"
+         "TUM URUNLER 3 EKLE\nSTANLEY ESKI_KUR=30 USD\nKX 2 DUS\nBLACK DECKER 12,5 EUR SABITLE")
+BRANDS = ['BOSCH', 'CETA', 'MAKITA', 'KNIPEX', 'DEWALT', 'STANLEY', 'BLACK DECKER', 'IZELTAS', 'TANIMSIZ']
+
+def reference_price(row, strat, rules, exchange_rate, freeze_conf=None, smart_freeze=False):
+    # Eski satır bazlı hesap: Decimal aritmetiği, yuvarlama yalnızca sonda kuruşa
+    curr = D(int(row['MP_Fiyat'])).scaleb(-2)
+    br, name, sku = str(row['Nihai_Marka']).upper(), str(row['Urun_Adi']).upper(), str(row['MP_SKU'])
+    if freeze_conf and (sku in freeze_conf.get('skus', []) or str(row['MP_Barkod']) in freeze_conf.get('barcodes', [])):
+        return curr, "Manuel Dondurma"
+    method, source = strat.get('method', 'calculated'), strat.get('source', 'cost')
+    base, note = D(0), ""
+    if method == 'stock_only': base, note = curr, "Pazaryeri Fiyatı"
+    elif source == 'internal': base, note = D(int(row['Ic_Hazir_Fiyat'])).scaleb(-6), "İç Liste"
+    elif source == 'supplier': base, note = D(int(row['Ted_Hazir_Fiyat'])).scaleb(-6), "Ted. Liste"
+    elif source == 'cost': base, note = D(int(row['maliyet'])).scaleb(-6), "Maliyet"
+    if base <= 0 and method != 'stock_only' and source != 'cost':
+        return (curr, "Kaynak Fiyat Yok") if curr > 0 else (D(0), "Fiyat Yok")
+    cand = D(0)
+    if method in ('stock_only', 'ready_list'): cand = base
+    elif base > 0: cand = base * D(str(strat.get('default_multiplier', 1.5))) + D(str(strat.get('default_addition', 0)))
+    else: note = "Maliyet Yok"
+    if cand > 0 or any(r['action'] == 'fix_price' for r in rules):
+        for r in rules:
+            if not (r['target'] == "ALL_PRODUCTS" or r['target'] in br or r['target'] in name or r['target'] in sku): continue
+            cur = r['currency'] or 'USD'
+            if r['action'] == 'fx_conversion' and r['old_rate'] and r['old_rate'] > 0:
+                cand = (cand / r['old_rate']) * exchange_rate(cur); note += f" + Kur Farkı ({cur})"
+            elif r['action'] == 'fx_index':
+                cand = base * exchange_rate(cur); note = f"Döviz Endeksli ({cur})"
+            elif r['action'] == 'multiplier':
+                cand = cand * r['value'] if r['value'] != 1 else cand + r['value']; note += f" + NLP ({r['target']})"
+            elif r['action'] == 'fix_price':
+                cand = r['value'] * exchange_rate(r['currency']) if r['currency'] and r['currency'] != 'TRY' else r['value']
+                note = f"Sabit Fiyat ({r['target']})"
+    if cand > 0 and strat.get('add_vat'): cand = cand * (1 + D(str(strat.get('vat_rate', 20))) / 100)
+    if cand <= 0: return (curr, "Fiyat Korundu") if curr > 0 else (D(0), note)
+    final = cand.quantize(D('0.01'))
+    if smart_freeze and curr > 0 and final < curr: return curr, "Donduruldu (Düşüş Engellendi)"
+    if final == curr: return curr, "Değişim Yok"
+    return final, note
+
+def random_catalog(n, seed):
+    rng = np.random.default_rng(seed)
+    def amounts(scale, zero_share):
+        v = rng.integers(1, 5000 * 10 ** scale, n)
+        v[rng.random(n) < zero_share] = 0
+        return v
+    brands = rng.choice(BRANDS, n)
+    df = pd.DataFrame({
+        'MP_Fiyat': amounts(2, 0.15), 'Ic_Hazir_Fiyat': amounts(6, 0.2), 'Ted_Hazir_Fiyat': amounts(6, 0.2), 'maliyet': amounts(6, 0.2),
+        'Nihai_Marka': brands,
+        'Urun_Adi': [f"{b if rng.random() < 0.7 else rng.choice(BRANDS)} MATKAP {rng.integers(1, 99)}" for b in brands],
+        'MP_SKU': [f"{rng.choice(['KX', 'AB', 'ST'])}-{i}" for i in range(n)],
+        'MP_Barkod': [f"8690{i:09d}" for i in range(n)],
+    })
+    # Bazı satırlarda hesaplanan fiyat mevcut fiyata eşit olsun ("Değişim Yok")
+    same = rng.random(n) < 0.05
+    df.loc[same, 'Ic_Hazir_Fiyat'] = df.loc[same, 'MP_Fiyat'] * 10 ** 4
+    return df
+
+STRATEGIES = [
+    {'method': 'calculated', 'source': 'cost', 'default_multiplier': 1.35, 'default_addition': 5},
+    {'method': 'calculated', 'source': 'cost', 'default_multiplier': '1.18', 'default_addition': '0.99', 'add_vat': True, 'vat_rate': 20},
+    {'method': 'ready_list', 'source': 'internal'},
+    {'method': 'ready_list', 'source': 'supplier', 'add_vat': True, 'vat_rate': '10'},
+    {'method': 'calculated', 'source': 'supplier', 'default_multiplier': 1.5},
+    {'method': 'stock_only'},
+]
+
+@pytest.mark.parametrize('strat', STRATEGIES)
+@pytest.mark.parametrize('rules_text', ['', RULES])
+@pytest.mark.parametrize('smart_freeze', [False, True])
+def test_calculate_prices_matches_decimal(app, rates, strat, rules_text, smart_freeze):
+    df = random_catalog(300, seed=len(rules_text) + 3 * smart_freeze + 11 * STRATEGIES.index(strat))
+    freeze_conf = {'skus': list(df['MP_SKU'][:5]), 'barcodes': list(df['MP_Barkod'][10:12])}
+    rules = app.parse_natural_language_rules(rules_text)
+    out = app.calculate_prices(df, strat, app.PriceRulePlan(rules), freeze_conf, smart_freeze)
+    expected = [reference_price(r, strat, rules, app.exchange_rate, freeze_conf, smart_freeze) for _, r in df.iterrows()]
+    assert out['Satis_Fiyati'].tolist() == [app.decimal_to_scaled(p, app.KURUS_SCALE) for p, _ in expected]
+    assert out['Fiyat_Durumu'].tolist() == [s for _, s in expected]
+
+def test_money_rescale_is_half_even(app):
+    values = np.array([5, 15, 25, -5, -15, 149, 150, 151, 250], dtype=np.int64)
+    got = app.Money(values, 3).rescale(2).values.tolist()
+    assert got == [int(D(int(v)).scaleb(-3).quantize(D('0.01')).scaleb(2)) for v in values]
+
+def test_money_multiply_promotes_instead_of_overflowing(app):
+    big = app.Money(np.array([2 ** 62, 3], dtype=np.int64), 2)
+    out = (big * D('1.5')).rescale(2)
+    assert [int(v) for v in out.values] == [int(D(2 ** 62) * D('1.5')), int((D(3) * D('1.5')).quantize(D(1)))]
+
+def test_missing_rate_stops_pricing(app, monkeypatch):
+    monkeypatch.setattr(app, 'EXCHANGE_RATES', {app.BASE_CURRENCY: D(1)})
+    df = random_catalog(20, seed=1)
+    df['Nihai_Marka'] = 'DEWALT'
+    with pytest.raises(app.MissingExchangeRate):
+        app.calculate_prices(df, STRATEGIES[0], app.PriceRulePlan(app.parse_natural_language_rules("DEWALT DOLAR KURUNA ESITLE")))
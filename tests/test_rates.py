@@ -0,0 +1,121 @@
+# Kur önbelleği: süreçler rates.json değiştikçe kurları yeniden yükler; bozuk dosya mevcut kurları bozmaz.
+# Açılışta ağa çıkılmaz; ilk çekimi yenileyici thread hemen yapar.
+import decimal
+import json
+import os
+import subprocess
+import sys
+import time
+import types
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+D = decimal.Decimal
+
+@pytest.fixture
+def cache(app, tmp_path, monkeypatch):
+    monkeypatch.setattr(app, 'RATES_FILE', tmp_path / 'rates.json')
+    monkeypatch.setattr(app, '_RATES_STATE', {"mtime": None, "pid": None})
+    monkeypatch.setattr(app, 'EXCHANGE_RATES', {app.BASE_CURRENCY: D(1)})
+    monkeypatch.setattr(app, 'RATE_LAST_UPDATE', 'Henüz Güncellenmedi')
+    return tmp_path / 'rates.json'
+
+def test_store_and_reload(app, cache):
+    assert not app.load_cached_rates()
+    app.store_cached_rates({app.BASE_CURRENCY: D(1), 'USD': D('32.5'), 'EUR': D('35.25')}, '01-02-2026 10:00')
+    assert app.load_cached_rates()
+    assert app.EXCHANGE_RATES == {'TRY': D(1), 'USD': D('32.5'), 'EUR': D('35.25')}
+    assert app.RATE_LAST_UPDATE == '01-02-2026 10:00'
+    # Değişmeyen dosya yeniden okunmaz
+    assert not app.load_cached_rates()
+
+def test_picks_up_changes_from_other_process(app, cache):
+    app.store_cached_rates({'USD': D('32.5')}, 'ilk')
+    assert app.load_cached_rates()
+    # Başka bir süreç (yenileyici) dosyayı günceller
+    cache.write_text(json.dumps({"rates": {"USD": "33.1", "GBP": "41.2"}, "last_update": "ikinci"}))
+    st = cache.stat()
+    os.utime(cache, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+    assert app.load_cached_rates()
+    assert app.EXCHANGE_RATES == {'TRY': D(1), 'USD': D('33.1'), 'GBP': D('41.2')}
+    assert app.RATE_LAST_UPDATE == 'ikinci'
+
+def test_broken_cache_keeps_rates(app, cache):
+    app.store_cached_rates({'USD': D('32.5')}, 'ilk')
+    app.load_cached_rates()
+    cache.write_text('{"rates": {"USD": "otuz"}}')
+    st = cache.stat()
+    os.utime(cache, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+    assert not app.load_cached_rates()
+    assert app.EXCHANGE_RATES['USD'] == D('32.5') and app.RATE_LAST_UPDATE == 'ilk'
+
+def test_import_does_not_fetch(tmp_path):
+    # Modül yüklenirken ağa çıkılmaz; önbellekteki kurlar okunur
+    (tmp_path / 'rates.json').write_text(json.dumps({"rates": {"USD": "30"}, "last_update": "dün"}))
+    code = ("import requests\n"
+            "def fail(*a, **k): raise SystemExit('ağa çıkıldı')\n"
+            "requests.get = fail\n"
+            "import app\n"
+            "assert str(app.EXCHANGE_RATES['USD']) == '30' and app.RATE_LAST_UPDATE == 'dün'\n")
+    env = {**os.environ, 'WORK_DIR': str(tmp_path), 'RATES_REFRESHER': '1', 'LOG_LEVEL': 'WARNING'}
+    out = subprocess.run([sys.executable, '-c', code], cwd=Path(__file__).resolve().parent.parent, env=env, capture_output=True, text=True)
+    assert out.returncode == 0, out.stderr
+
+class StopLoop(Exception):
+    pass
+
+@pytest.mark.parametrize('age,fetches', [(None, 1), (10, 0), (7200, 1)])
+def test_refresher_fetches_first_when_cache_missing_or_stale(app, cache, monkeypatch, age, fetches):
+    if age is not None:
+        app.store_cached_rates({'USD': D('32.5')}, 'ilk')
+        os.utime(cache, (time.time() - age, time.time() - age))
+    calls, sleeps = [], []
+    monkeypatch.setattr(app, 'fetch_exchange_rates', lambda: calls.append(1) or (True, ''))
+    def sleep(s):
+        sleeps.append(s)
+        raise StopLoop
+    monkeypatch.setattr(app, 'time', types.SimpleNamespace(time=time.time, sleep=sleep))
+    with pytest.raises(StopLoop):
+        app._rate_refresher_loop()
+    # Bekleme ilk çekimden sonra gelir; taze önbellekte yalnızca kalan süre kadar beklenir
+    assert len(calls) == fetches
+    if fetches: assert sleeps == [app.RATES_REFRESH_S]
+    else: assert 0 < sleeps[0] < app.RATES_REFRESH_S
+
+def test_missing_rate_fails_with_clear_message(app, cache):
+    # İlk çekim henüz yapılmadıysa dövizli maliyet 0/1 kurla çevrilmez
+    df = pd.DataFrame({'kod': ['A1', 'A2'], 'maliyet': ['10', '12,5'], 'birim': ['USD', 'TRY']})
+    tpl = {'sku': 'kod', 'cost': 'maliyet', 'currency_column': 'birim'}
+    with pytest.raises(app.MissingExchangeRate, match='USD kuru yüklenemedi'):
+        app.supplier_frame(df, tpl)
+    app.store_cached_rates({'USD': D('32.5')}, 'ilk')
+    app.load_cached_rates()
+    assert app.supplier_frame(df, tpl)['Maliyet_TRY'].tolist() == [325 * 10 ** 6, 125 * 10 ** 5]
+
+@pytest.mark.parametrize('raw,expected', [(' tl ', 'TRY'), ('TRL', 'TRY'), ('try', 'TRY'), ('usd ', 'USD'), (' Eur', 'EUR'), ('xyz', 'XYZ')])
+def test_normalize_currency(app, raw, expected):
+    assert app.normalize_currency(raw) == expected
+
+def test_unknown_currencies_are_counted_not_fatal(app, rates):
+    df = pd.DataFrame({'kod': [f"A{i}" for i in range(7)], 'maliyet': ['10'] * 7,
+                       'birim': [' tl', 'usd', 'XYZ', 'xyz ', '', 'Eur', 'ABC']})
+    unknown = {}
+    out = app.supplier_frame(df, {'sku': 'kod', 'cost': 'maliyet', 'currency_column': 'birim'}, unknown)
+    assert out['Para_Birimi'].tolist() == ['TRY', 'USD', 'XYZ', 'XYZ', '', 'EUR', 'ABC']
+    assert out['Maliyet_TRY'].tolist() == [10 * 10 ** 6, 325 * 10 ** 6, 0, 0, 0, int(352.5 * 10 ** 6), 0]
+    assert unknown == {'XYZ': 2, 'ABC': 1}
+    # Şablondaki sabit para birimi de normalize edilir
+    assert app.supplier_frame(df, {'sku': 'kod', 'cost': 'maliyet', 'currency': 'TL'})['Maliyet_TRY'].tolist() == [10 * 10 ** 6] * 7
+
+def test_consolidation_reports_unknown_currencies_per_file(app, rates):
+    frame = lambda cur: pd.DataFrame({'barkod': ['8690001', '8690002', '8690003'], 'stok': ['1', '2', '3'],
+                                      'maliyet': ['5', '6', '7'], 'birim': cur})
+    tpl = {'barcode': 'barkod', 'stock': 'stok', 'cost': 'maliyet', 'currency_column': 'birim'}
+    files = [{'dataframe': frame(['TL', 'GBPX', 'GBPX']), 'template': tpl, 'filename': 'a.csv'},
+             {'dataframe': frame(['USD', 'TRY', 'TRY']), 'template': tpl, 'filename': 'b.csv'}]
+    final, _, meta = app.consolidate_suppliers(files)
+    assert meta['a.csv']['unknown_currencies'] == {'GBPX': 2} and 'unknown_currencies' not in meta['b.csv']
+    # Tanınmayan satırların maliyeti 0 kabul edilir; diğer tedarikçinin maliyeti korunur
+    assert final.set_index('Barkod')['Maliyet'].to_dict() == {'8690001': 5 * 10 ** 6, '8690002': 0, '8690003': 0}
@@ -0,0 +1,146 @@
+# Akış halinde okuma: parçaların birleşimi tek seferde okunan dosyayla aynı olmalı; stok/tedarikçi hesapları parça boyundan bağımsız
+import csv
+import decimal
+
+import numpy as np
+import pandas as pd
+import pytest
+
+HEADER = [' Barkod ', 'Stok\tAdedi', 'Stok\tAdedi', 'Ürün  Adı', 'Fiyat', 'Kullanılmayan']
+
+def rows(n, seed=2):
+    rng = np.random.default_rng(seed)
+    out = []
+    for i in range(n):
+        bc = rng.choice([f"869{i % 7:04d}", '', 'ABC'])
+        out.append([bc, str(rng.integers(-3, 40)), rng.choice(['Var', 'yok', '5']), rng.choice(['Matkap', 'Çekiç', '']),
+                    rng.choice(['12,50', '1.250,75', '', 'abc', '99']), 'x'])
+    return out
+
+def write_csv(path, data, encoding='utf-8', header=HEADER):
+    with open(path, 'w', newline='', encoding=encoding) as f:
+        csv.writer(f).writerows([header] + data)
+
+def write_xlsx(path, data, blank_at=()):
+    from openpyxl import Workbook
+    wb = Workbook(); ws = wb.active
+    ws.append(HEADER)
+    for i, r in enumerate(data):
+        if i in blank_at: ws.append([None] * len(HEADER))
+        ws.append([int(v) if v.lstrip('-').isdigit() else (v or None) for v in r])
+    wb.save(path)
+
+def whole(app, path, filename, columns=None):
+    # Eski davranış: tüm dosya tek seferde okunur, kolon adları temizlenir
+    df = pd.read_csv(path, dtype=str) if filename.endswith('.csv') else pd.read_excel(path, dtype=str)
+    df.columns = [app.clean_column_name(c) for c in df.columns]
+    if columns is not None: df = df[[c for c in df.columns if c in columns]]
+    return df.where(pd.notnull(df), None)
+
+def read(app, path, filename, columns=None, chunk_rows=3):
+    chunks = list(app.iter_normalized_chunks(path, filename, columns, chunk_rows))
+    return chunks, pd.concat(chunks, ignore_index=True)
+
+@pytest.mark.parametrize('ext', ['csv', 'xlsx'])
+@pytest.mark.parametrize('columns', [None, {'barkod', 'stok adedi', 'ürün adı'}])
+def test_chunks_concat_to_whole_file(app, tmp_path, ext, columns):
+    path = tmp_path / f"f.{ext}"
+    (write_csv if ext == 'csv' else write_xlsx)(path, rows(10))
+    chunks, got = read(app, path, path.name, columns)
+    if columns is not None: assert [len(c) for c in chunks] == [3, 3, 3, 1]
+    pd.testing.assert_frame_equal(got, whole(app, path, path.name, columns), check_dtype=False)
+
+def test_duplicate_and_whitespace_headers(app, tmp_path):
+    path = tmp_path / 'f.csv'
+    write_csv(path, rows(4))
+    _, got = read(app, path, path.name)
+    assert list(got.columns) == ['barkod', 'stok adedi', 'stok adedi.1', 'ürün adı', 'fiyat', 'kullanılmayan']
+    # Projeksiyon temizlenmiş adlara göre; tekrarlanan başlığın pandas'ın verdiği ikinci adı ayrıca seçilmeli
+    _, got = read(app, path, path.name, {'stok adedi'})
+    assert list(got.columns) == ['stok adedi']
+
+def test_projection_without_match_keeps_row_count(app, tmp_path):
+    for name, writer in (('f.csv', write_csv), ('f.xlsx', write_xlsx)):
+        path = tmp_path / name
+        writer(path, rows(7))
+        chunks, got = read(app, path, name, {'olmayan'})
+        assert got.shape == (7, 0) and [len(c) for c in chunks] == [3, 3, 1]
+
+def test_xlsx_keeps_inner_blank_rows(app, tmp_path):
+    path = tmp_path / 'f.xlsx'
+    write_xlsx(path, rows(6), blank_at=(2, 4))
+    _, got = read(app, path, path.name, {'barkod', 'fiyat'}, chunk_rows=2)
+    pd.testing.assert_frame_equal(got, whole(app, path, path.name, {'barkod', 'fiyat'}), check_dtype=False)
+    assert len(got) == 8
+
+def test_xls_falls_back_to_whole_read(app, tmp_path):
+    # .xls uzantılı ama aslında xlsx olan dosya: xlrd hata verir, openpyxl ile tamamı okunup parçalanır
+    path = tmp_path / 'eski.xls'
+    write_xlsx(path, rows(5))
+    chunks, got = read(app, path, path.name, {'barkod'}, chunk_rows=2)
+    assert [len(c) for c in chunks] == [2, 2, 1] and list(got.columns) == ['barkod']
+    chunks, _ = read(app, path, path.name, None, chunk_rows=2)
+    assert len(chunks) == 1 and len(chunks[0]) == 5
+
+def test_latin1_csv(app, tmp_path):
+    path = tmp_path / 'f.csv'
+    write_csv(path, [['869', 'Caf\xe9']], encoding='latin-1', header=['Barkod', '\xdcr\xfcn'])
+    _, got = read(app, path, path.name)
+    assert got.to_dict('list') == {'barkod': ['869'], '\xfcr\xfcn': ['Caf\xe9']}
+
+def test_unreadable_file_names_the_file(app, tmp_path):
+    path = tmp_path / 'bozuk.xlsx'
+    path.write_bytes(b'not a zip')
+    with pytest.raises(Exception, match='bozuk.xlsx'):
+        list(app.iter_normalized_chunks(path, path.name, {'barkod'}))
+
+INTERNAL_TPL = {'barcode': 'barkod', 'sku': 'ürün adı', 'stock': 'stok adedi', 'product_name': 'ürün adı', 'selling_price': 'fiyat'}
+SUPPLIER_TPL = {'barcode': 'barkod', 'sku': 'ürün adı', 'stock': 'stok adedi.1', 'cost': 'fiyat', 'selling_price': 'fiyat',
+                'currency': 'TRY'}
+
+def file_specs(app, tmp_path, tpl, chunk_rows, by_path=False):
+    specs = []
+    for i, (lbl, n) in enumerate((('+', 23), ('-', 11))):
+        path = tmp_path / f"d{i}.csv"
+        write_csv(path, rows(n, seed=i))
+        spec = {'template': tpl, 'label': lbl, 'filename': path.name}
+        if by_path: spec.update(path=path, columns=app.template_columns(tpl))
+        elif chunk_rows: spec['chunks'] = app.iter_normalized_chunks(path, path.name, app.template_columns(tpl), chunk_rows)
+        else: spec['dataframe'] = whole(app, path, path.name)
+        specs.append(spec)
+    return specs
+
+def sort(df, keys):
+    return df.sort_values(keys).reset_index(drop=True)
+
+@pytest.mark.parametrize('chunk_rows', [1, 4])
+def test_internal_stock_independent_of_chunking(app, tmp_path, chunk_rows):
+    ref, ref_meta = app.calculate_internal_stock(file_specs(app, tmp_path, INTERNAL_TPL, None), 5, decimal.Decimal(2))
+    got, meta = app.calculate_internal_stock(file_specs(app, tmp_path, INTERNAL_TPL, chunk_rows), 5, decimal.Decimal(2))
+    rows = lambda m: {k: v['rows'] for k, v in m.items()}
+    assert rows(meta) == rows(ref_meta) == {'d0.csv': 23, 'd1.csv': 11} and len(ref) > 5
+    pd.testing.assert_frame_equal(sort(got, app.INTERNAL_KEYS), sort(ref, app.INTERNAL_KEYS), check_dtype=False)
+
+@pytest.mark.parametrize('chunk_rows', [1, 4])
+def test_suppliers_independent_of_chunking(app, tmp_path, chunk_rows):
+    ref, _, _ = app.consolidate_suppliers(file_specs(app, tmp_path, SUPPLIER_TPL, None))
+    got, _, _ = app.consolidate_suppliers(file_specs(app, tmp_path, SUPPLIER_TPL, chunk_rows))
+    keys = ['Barkod', 'match_code']
+    assert (ref['Barkod'] == 'YOK').any() and (ref['Barkod'] != 'YOK').any()
+    pd.testing.assert_frame_equal(sort(got, keys), sort(ref, keys), check_dtype=False)
+
+@pytest.fixture
+def cpus(app, monkeypatch, forking):
+    # resolve_workers çekirdek sayısıyla sınırlar; dosyaların gerçekten ayrı süreçlerde okunması için
+    monkeypatch.setattr(app.os, 'cpu_count', lambda: 4)
+
+@pytest.mark.parametrize('workers', [1, 3])
+def test_parallel_ingest_matches_sequential(app, tmp_path, monkeypatch, cpus, workers):
+    monkeypatch.setattr(app, 'FILE_CHUNK_ROWS', 5)
+    ref, _ = app.calculate_internal_stock(file_specs(app, tmp_path, INTERNAL_TPL, None), None, None)
+    got, meta = app.calculate_internal_stock(file_specs(app, tmp_path, INTERNAL_TPL, None, by_path=True), None, None, workers)
+    pd.testing.assert_frame_equal(got, ref, check_dtype=False)
+    assert list(meta) == ['d0.csv', 'd1.csv'] and all(m['seconds'] >= 0 for m in meta.values())
+    ref, _, _ = app.consolidate_suppliers(file_specs(app, tmp_path, SUPPLIER_TPL, None))
+    got, _, _ = app.consolidate_suppliers(file_specs(app, tmp_path, SUPPLIER_TPL, None, by_path=True), workers)
+    pd.testing.assert_frame_equal(got, ref, check_dtype=False)
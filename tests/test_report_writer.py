@@ -0,0 +1,56 @@
+# write_xlsx_report, DataFrame.to_excel(index=False) ile aynı hücreleri yazmalı
+import numpy as np
+import pandas as pd
+import pytest
+from openpyxl import load_workbook
+
+def sample(n=11):
+    rng = np.random.default_rng(9)
+    df = pd.DataFrame({
+        'Barkod': [f"869{i:04d}" if i % 4 else None for i in range(n)],
+        'Adet': rng.integers(-5, 100, n),
+        'Fiyat': rng.uniform(0, 500, n).round(2),
+        'Var': rng.random(n) < 0.5,
+        'Eksik': pd.array([1, None] * (n // 2) + [3] * (n % 2), dtype='Int64'),
+        'Tarih': pd.to_datetime('2026-01-05') + pd.to_timedelta(np.arange(n), unit='D'),
+        'Ürün Adı': ['Çelik Pense ığüşöç', '', 'Matkap'] * (n // 3) + ['x'] * (n % 3),
+    })
+    df.loc[2, 'Fiyat'] = np.nan; df.loc[3, 'Fiyat'] = np.inf; df.loc[4, 'Fiyat'] = -np.inf
+    return df
+
+def cells(path):
+    wb = load_workbook(path, read_only=True)
+    try: return {ws.title: [list(r) for r in ws.iter_rows(values_only=True)] for ws in wb.worksheets}
+    finally: wb.close()
+
+@pytest.mark.parametrize('chunk_rows', [1, 4, 10000])
+def test_cells_match_to_excel(app, tmp_path, chunk_rows):
+    sheets = [('1. Genel Özet', pd.DataFrame({'Kategori': ['A', ' '], 'Değer': ['uzun metin', 5]})),
+              ('2. Eşleşenler (Yeşil)', sample()), ('Boş', sample().iloc[:0])]
+    app.write_xlsx_report(tmp_path / 'yeni.xlsx', sheets, chunk_rows)
+    with pd.ExcelWriter(tmp_path / 'eski.xlsx', engine='openpyxl') as writer:
+        for name, df in sheets: df.to_excel(writer, sheet_name=name, index=False)
+    assert cells(tmp_path / 'yeni.xlsx') == cells(tmp_path / 'eski.xlsx')
+
+def test_csv_sidecar_round_trip(app, tmp_path):
+    df = sample()
+    app.write_csv_sidecar(tmp_path / 'ham.csv.gz', df, chunk_rows=3)
+    back = pd.read_csv(tmp_path / 'ham.csv.gz', dtype=str, keep_default_na=False)
+    assert back.columns.tolist() == df.columns.tolist() and len(back) == len(df)
+    assert back['Ürün Adı'].tolist() == df['Ürün Adı'].tolist()
+
+def test_sidecar_download_only_listed(app, tmp_path, monkeypatch):
+    monkeypatch.setattr(app, 'TEMP_RESULTS_DIR', tmp_path)
+    monkeypatch.setattr(app, 'JOBS_DIR', tmp_path)
+    monkeypatch.setattr(app, 'JOB_STORE', app.SQLiteJobStore(tmp_path / 'jobs.db'))
+    monkeypatch.setattr(app, 'JOB_RUNNER', 'external')
+    (tmp_path / 'j_ic_stok_ham.csv.gz').write_bytes(b'x')
+    (tmp_path / 'baska.csv.gz').write_bytes(b'x')
+    app.update_job_status('j', 'completed', 100, 'Tamamlandı.', result_file='j.xlsx', detail={'sidecars': ['j_ic_stok_ham.csv.gz']})
+    client = app.app.test_client()
+    assert client.get('/api/v1/download/j/j_ic_stok_ham.csv.gz').status_code == 200
+    assert client.get('/api/v1/download/j/baska.csv.gz').status_code == 404
+    # Süresi dolan iş, ek dosyalarıyla birlikte silinir
+    monkeypatch.setattr(app, 'JOB_TTL_HOURS', -1)
+    app.expire_jobs(force=True)
+    assert not (tmp_path / 'j_ic_stok_ham.csv.gz').exists() and (tmp_path / 'baska.csv.gz').exists()
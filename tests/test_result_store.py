@@ -0,0 +1,76 @@
+# Kolonsal ara sonuç deposu: yazılan çerçeve aynı değerler ve tiplerle geri okunmalı; eski .json anahtarları okunmaya devam etmeli
+import decimal
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+D = decimal.Decimal
+
+@pytest.fixture
+def store(app, tmp_path, monkeypatch):
+    monkeypatch.setattr(app, 'TEMP_RESULTS_DIR', tmp_path)
+    return tmp_path
+
+def values(col):
+    return [None if v is None or (isinstance(v, float) and np.isnan(v)) else v for v in col.tolist()]
+
+def sample():
+    return pd.DataFrame({
+        'adet': np.array([3, -1, 0, 2 ** 40], dtype=np.int64),
+        'oran': [0.5, np.nan, -2.25, 1e300],
+        'var': [True, False, False, True],
+        'ad': ['Matkap', None, '', 'Çelik Pense ığüşöç'],
+        'fiyat': [D('12.5'), D('0.000001'), None, D('-7')],
+        'maliyet': [D('1E+3'), D('99999999999.999999'), D('0'), D('3.10')],
+        'karisik': ['a', 1, D('2.5'), None],
+    })
+
+def test_round_trip(app, store):
+    df = sample()
+    app.save_result_frame('internal', 'k1', df, meta={'a.csv': 4})
+    out = app.load_result_frame('internal', 'k1')
+    assert list(out.columns) == list(df.columns) and len(out) == 4
+    np.testing.assert_array_equal(out['adet'], df['adet']); assert out['adet'].dtype == np.int64
+    np.testing.assert_array_equal(out['oran'], df['oran'])
+    assert out['var'].tolist() == df['var'].tolist()
+    assert values(out['ad']) == ['Matkap', None, '', 'Çelik Pense ığüşöç']
+    # Decimal kolonlar birebir (ölçek dahil değer eşitliği) geri döner, boşlar None kalır
+    assert values(out['fiyat']) == [D('12.5'), D('0.000001'), None, D('-7')]
+    assert all(isinstance(v, D) for v in out['maliyet']) and out['maliyet'].tolist() == df['maliyet'].tolist()
+    # Karışık tipler metin olarak saklanır
+    assert values(out['karisik']) == ['a', '1', '2.5', None]
+    assert app.load_result_meta('internal', 'k1') == {'a.csv': 4}
+
+def test_column_subset_and_overwrite(app, store):
+    app.save_result_frame('supplier', 'k2', sample())
+    out = app.load_result_frame('supplier', 'k2', columns=['fiyat', 'ad', 'yok'])
+    assert list(out.columns) == ['ad', 'fiyat']
+    app.save_result_frame('supplier', 'k2', sample().iloc[:1])
+    assert len(app.load_result_frame('supplier', 'k2')) == 1
+    assert not [p for p in store.iterdir() if '.tmp' in p.name or '.old' in p.name]
+
+def test_failed_swap_keeps_previous_version(app, store, monkeypatch):
+    app.save_result_frame('supplier', 'k3', sample())
+    def fail(src, dst): raise OSError("yerleştirilemedi")
+    with monkeypatch.context() as m, pytest.raises(OSError):
+        m.setattr(app.os, 'replace', fail)
+        app.save_result_frame('supplier', 'k3', sample().iloc[:1])
+    assert len(app.load_result_frame('supplier', 'k3')) == len(sample())
+    assert [p.name for p in store.iterdir()] == ['supplier_k3']
+
+def test_empty_frame(app, store):
+    app.save_result_frame('internal', 'bos', pd.DataFrame({'a': pd.Series([], dtype=object), 'b': pd.Series([], dtype=np.int64)}))
+    out = app.load_result_frame('internal', 'bos')
+    assert list(out.columns) == ['a', 'b'] and len(out) == 0
+
+def test_legacy_json_key(app, store):
+    # Eski sürüm: df.to_json(internal_<key>.json) + meta_internal_<key>.json
+    legacy = pd.DataFrame({'Barkod': ['ABC-1', None], 'Miktar': [3, 4], 'Fiyat': [12.5, 0.0]})
+    legacy.to_json(store / 'internal_eski.json')
+    with open(store / 'meta_internal_eski.json', 'w') as f: json.dump({'x.xlsx': 2}, f)
+    out = app.load_result_frame('internal', 'eski')
+    assert values(out['Barkod']) == ['ABC-1', None] and out['Miktar'].tolist() == [3, 4]
+    assert list(app.load_result_frame('internal', 'eski', columns=['Miktar']).columns) == ['Miktar']
+    assert app.load_result_meta('internal', 'eski') == {'x.xlsx': 2}
@@ -0,0 +1,59 @@
+# Fiyat simülasyonu: tüm katalog tek geçişte calculate_prices ile fiyatlanır; özet ve sayfalı önizleme bu sonuçtan türetilir
+import decimal
+
+import numpy as np
+import pandas as pd
+
+D = decimal.Decimal
+RULES = "BOSCH %10 ZAM\nMAKITA 500 TL OLSUN\nKNIPEX 100 USD OLSUN\nCETA %50 INDIRIM"
+
+def catalog(n=400, seed=2):
+    rng = np.random.default_rng(seed)
+    brands = rng.choice(['BOSCH', 'MAKITA', 'KNIPEX', 'CETA', 'IZELTAS'], n)
+    price = rng.integers(1, 200000, n)
+    price[rng.random(n) < 0.1] = 0
+    return pd.DataFrame({'MP_SKU': [f"S-{i}" for i in range(n)], 'MP_Barkod': [f"8690{i:09d}" for i in range(n)],
+                         'Nihai_Marka': brands, 'Urun_Adi': [f"{b} matkap {i}" for i, b in enumerate(brands)],
+                         'MP_Urun_Adi': [f"{b} matkap {i}" for i, b in enumerate(brands)], 'MP_Fiyat': price})
+
+def test_summary_matches_calculate_prices(app, rates):
+    df = catalog()
+    strat = {'method': 'stock_only', 'vat_rate': 20}
+    plan = app.PriceRulePlan(app.parse_natural_language_rules(RULES))
+    out = app.simulate_prices(df, strat, plan, page_size=25, top=5)
+    priced = app.calculate_prices(df, strat, plan)
+    old, new = df['MP_Fiyat'].to_numpy(), priced['Satis_Fiyati'].to_numpy()
+    delta = new - old
+    assert out['satir'] == len(df)
+    assert out['etkilenen'] == int((delta != 0).sum())
+    assert (out['artan'], out['azalan']) == (int((delta > 0).sum()), int((delta < 0).sum()))
+    assert D(out['toplam_fark']) == D(int(delta.sum())).scaleb(-2)
+    assert out['sifirdan_cikan'] == int(((old <= 0) & (new > 0)).sum())
+    # CETA %50 indirim KDV eşiğini geçer, BOSCH %10 geçmez
+    ceta = (df['Nihai_Marka'] == 'CETA').to_numpy() & (old > 0)
+    assert out['kdv_esigini_gecen'] >= int(ceta.sum())
+    masks = plan.rule_masks(app.price_rule_columns(df), len(df))
+    assert [r['eslesen'] for r in out['kurallar']] == masks.sum(axis=0).tolist()
+    assert [r['degisen'] for r in out['kurallar']] == [int((m & (delta != 0)).sum()) for m in masks.T]
+    # En çok değişenler mutlak farka göre sıralı
+    movers = [abs(D(m['fark'])) for m in out['en_cok_degisen']]
+    assert len(movers) == 5 and movers == sorted(movers, reverse=True) and movers[0] == D(int(np.abs(delta).max())).scaleb(-2)
+
+def test_pages_cover_listed_rows(app, rates):
+    df = catalog(120)
+    plan = app.PriceRulePlan(app.parse_natural_language_rules(RULES))
+    first = app.simulate_prices(df, {'method': 'stock_only'}, plan, page=1, page_size=50)
+    seen = [r['sku'] for p in range(1, first['sayfa_sayisi'] + 1)
+            for r in app.simulate_prices(df, {'method': 'stock_only'}, plan, page=p, page_size=50)['preview']]
+    assert len(seen) == len(set(seen)) == first['onizleme_satir']
+    # Sayfa sınırın dışındaysa son sayfa döner
+    last = app.simulate_prices(df, {'method': 'stock_only'}, plan, page=99, page_size=50)
+    assert last['sayfa'] == first['sayfa_sayisi']
+
+def test_precomputed_masks_give_same_prices(app, rates):
+    df = catalog(200, seed=7)
+    strat = {'method': 'calculated', 'source': 'cost'}
+    df['maliyet'] = np.arange(len(df)) * 10 ** 6
+    plan = app.PriceRulePlan(app.parse_natural_language_rules(RULES))
+    masks = plan.rule_masks(app.price_rule_columns(df), len(df))
+    pd.testing.assert_frame_equal(app.calculate_prices(df, strat, plan, masks=masks), app.calculate_prices(df, strat, plan))
@@ -0,0 +1,90 @@
+# select_best_offers: strateji başına anahtar başına kazanan teklif (eşitlikler ve stoksuz teklifler dahil)
+import pandas as pd
+import pytest
+
+# (barkod, match_code, tedarikçi sırası, stok, maliyet, liste fiyatı)
+OFFERS = [
+    ('8690001', 'MC1', 0, 0, 100, 150),   # stoksuz ama en ucuz
+    ('8690001', 'MC1', 1, 5, 120, 200),
+    ('8690001', 'MC1', 2, 5, 120, 180),   # S1 ile stok ve maliyette eşit
+    ('8690001', 'MC1', 3, 9, 130, 170),   # en çok stok
+    ('8690002', 'MC2', 2, 3, 0, 60),      # maliyeti yok
+    ('8690002', 'MC2', 3, 1, 70, 65),
+    ('8690003', 'MC3', 1, 3, 80, 90),     # satır sırası önce, tedarikçi sırası sonra; her şey eşit
+    ('8690003', 'MC3', 0, 3, 80, 95),
+    (None, 'KOD-9', 0, 0, 50, 55),        # barkodsuz, hiçbir teklifte stok yok
+    (None, 'KOD-9', 1, 0, 40, 45),
+]
+
+def offers_frame(app):
+    rows = []
+    for barcode, code, rank, stock, cost, listed in OFFERS:
+        rows.append({'Barkod': barcode or '_barkod_yok_', 'Anahtar_Kod': f"{code}-S{rank}", 'match_code': code,
+                     'Toplam_Tedarikci_Stok': stock, 'Maliyet': cost, 'Ted_Hazir_Fiyat': listed, 'Marka': 'BOSCH',
+                     'Ted_Urun_Adi': f"urun S{rank}", 'Tedarikci': f"S{rank}", 'Tedarikci_Sira': rank})
+    return pd.DataFrame(rows, columns=app.SUPPLIER_COLUMNS + ['Tedarikci', 'Tedarikci_Sira'])
+
+def winners(out):
+    # Barkod -> (kazanan, stok, maliyet, liste fiyatı, teklif sayısı)
+    return {r.Barkod if r.Barkod != 'YOK' else r.match_code: (r.Tedarikci, r.Toplam_Tedarikci_Stok, r.Maliyet, r.Ted_Hazir_Fiyat, r.Teklif_Sayisi)
+            for r in out.itertuples()}
+
+def test_aggregate(app):
+    out = app.select_best_offers(offers_frame(app), 'aggregate')
+    # Stok toplanır, maliyet en düşük (eski groupby min gibi 0 dahil), liste fiyatı en yüksek; eşit maliyette önceki tedarikçi
+    assert winners(out) == {'8690001': ('S0', 19, 100, 200, 4), '8690002': ('S2', 4, 0, 65, 2),
+                            '8690003': ('S0', 6, 80, 95, 2), 'KOD-9': ('S1', 0, 40, 55, 2)}
+    # Metin kolonları ilk tedarikçinin teklifinden
+    assert out.set_index('match_code').loc['MC2', 'Ted_Urun_Adi'] == 'urun S2'
+    assert out.set_index('match_code').loc['KOD-9', 'Anahtar_Kod'] == 'KOD-9-S0'
+
+def test_cheapest_in_stock(app):
+    out = app.select_best_offers(offers_frame(app), 'cheapest_in_stock')
+    # Stoklu teklifler önce; eşit maliyet ve stokta önceki tedarikçi; hiç stok yoksa en ucuz
+    assert winners(out) == {'8690001': ('S1', 5, 120, 200, 4), '8690002': ('S3', 1, 70, 65, 2),
+                            '8690003': ('S0', 3, 80, 95, 2), 'KOD-9': ('S1', 0, 40, 45, 2)}
+
+def test_max_stock(app):
+    out = app.select_best_offers(offers_frame(app), 'max_stock')
+    assert winners(out) == {'8690001': ('S3', 9, 130, 170, 4), '8690002': ('S2', 3, 0, 60, 2),
+                            '8690003': ('S0', 3, 80, 95, 2), 'KOD-9': ('S1', 0, 40, 45, 2)}
+
+def test_preferred(app):
+    out = app.select_best_offers(offers_frame(app), 'preferred', [' s2 ', 'S0'])
+    # Stoklu teklifler önce, sonra tercih sırası (listede baştaki önce); kimsede stok yoksa pahalı olsa da tercih edilen
+    assert winners(out) == {'8690001': ('S2', 5, 120, 180, 4), '8690002': ('S2', 3, 0, 60, 2),
+                            '8690003': ('S0', 3, 80, 95, 2), 'KOD-9': ('S0', 0, 50, 55, 2)}
+
+def test_output_order_and_columns(app):
+    out = app.select_best_offers(offers_frame(app), 'max_stock')
+    assert list(out.columns) == app.SUPPLIER_COLUMNS + ['Tedarikci', 'Teklif_Sayisi']
+    assert out['Barkod'].tolist() == ['8690001', '8690002', '8690003', 'YOK']
+
+def test_empty_and_invalid(app):
+    assert app.select_best_offers(offers_frame(app).iloc[:0], 'aggregate').empty
+    with pytest.raises(ValueError):
+        app.select_best_offers(offers_frame(app), 'en_iyisi')
+
+def test_join_by_barcode_then_strategy_selected_code(app):
+    # 8690001 ve 8690004 aynı match_code'u (MC1) paylaşır: barkodu tutan ürün kendi teklifini, tutmayan koddaki stratejik kazananı alır
+    offers = offers_frame(app)
+    offers = pd.concat([offers, offers.iloc[[1]].assign(Barkod='8690004', Tedarikci='S4', Tedarikci_Sira=4,
+                                                        Toplam_Tedarikci_Stok=40, Maliyet=90)], ignore_index=True)
+    lower = lambda d: d.rename(columns=str.lower)
+    supplier_df = lower(app.select_best_offers(offers, 'max_stock'))
+    codes = lower(app.select_best_offers(offers.assign(Barkod='_barkod_yok_'), 'max_stock'))
+    final = pd.DataFrame({'barkod': ['8690001', '8690004', 'BASKA-123', None, '8690002'],
+                          'match_code': ['MC1', 'MC1', 'MC1', 'YOK', 'MC2']})
+    bc_pos, code_pos = app.supplier_matches(final, supplier_df, codes)
+    got = [supplier_df['tedarikci'][b] if b >= 0 else codes['tedarikci'][c] if c >= 0 else None for b, c in zip(bc_pos, code_pos)]
+    assert got == ['S3', 'S4', 'S4', None, 'S2']
+    assert (code_pos[bc_pos >= 0] == -1).all()
+    # Kod tablosunda MC1 tek satırdır ve iki barkodun en çok stoklu teklifidir
+    assert codes.set_index('match_code').loc['MC1', 'toplam_tedarikci_stok'] == 40
+
+def test_saved_code_table_follows_strategy(app, tmp_path, monkeypatch):
+    monkeypatch.setattr(app, 'TEMP_RESULTS_DIR', tmp_path)
+    offers = offers_frame(app)
+    app.save_supplier_result('k', app.select_best_offers(offers, 'preferred', ['S2']), offers, {}, 'preferred', ['S2'])
+    codes = app.load_result_frame('supplier_codes', 'k', scaled={'Maliyet': app.PRICE_SCALE, 'Ted_Hazir_Fiyat': app.PRICE_SCALE})
+    assert dict(zip(codes['match_code'], codes['Tedarikci'])) == {'MC1': 'S2', 'MC2': 'S2', 'MC3': 'S0', 'KOD-9': 'S1'}